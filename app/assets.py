@@ -0,0 +1,120 @@
+"""
+Fingerprinted, precompressed static assets and the cached index page.
+
+At startup every file under STATIC_DIR is read once, hashed and compressed
+(gzip, plus brotli when installed). Templates link to `static_url(name)`,
+which names the file by content hash, e.g. /static/style.3f2a9c1d04be.css;
+those URLs never change meaning, so they are served with an immutable,
+year-long Cache-Control. The plain names keep working for old links, but
+must be revalidated. Rendered pages are snapshotted the same way, since
+the templates take no per-request data.
+"""
+
+import hashlib
+import mimetypes
+import os
+
+from fastapi import Request, Response
+from fastapi.responses import PlainTextResponse
+from fastapi.templating import Jinja2Templates
+
+from . import conditional
+from .compression import accepted_encodings, choose, precompress
+from .config import STATIC_MAX_AGE_SECONDS
+
+IMMUTABLE = f"public, max-age={STATIC_MAX_AGE_SECONDS}, immutable"
+REVALIDATE = "no-cache"
+
+
+class Asset:
+    __slots__ = ("variants", "media_type", "etags")
+
+    def __init__(self, body: bytes, media_type: str):
+        self.variants = precompress(body)
+        self.media_type = media_type
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        # Each coding is a different representation, with its own strong tag
+        self.etags = {
+            coding: conditional.coded_etag(f'"{digest}"', coding)
+            for coding in self.variants
+        }
+
+    def response(self, request: Request, cache_control: str) -> Response:
+        """The best variant the client accepts, or 304 if its copy is current."""
+        coding = choose(self.variants, accepted_encodings(request.headers))
+        etag = self.etags[coding]
+        headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        if conditional.is_not_modified(request, etag):
+            response = conditional.not_modified(etag)
+            response.headers.update(headers)
+            return response
+        response = Response(self.variants[coding], media_type=self.media_type)
+        response.headers.update(headers)
+        response.headers["ETag"] = etag
+        return response
+
+
+def fingerprint(name: str, body: bytes) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+
+
+class StaticAssets:
+    """ASGI app serving the files under `directory` from memory."""
+
+    def __init__(self, directory: str, prefix: str = "/static"):
+        self.prefix = prefix
+        self.assets = {}
+        self.urls = {}
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    body = f.read()
+                media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                # Starlette adds the charset to text/* types itself
+                if media_type == "application/javascript":
+                    media_type += "; charset=utf-8"
+                asset = Asset(body, media_type)
+                hashed = fingerprint(name, body)
+                self.assets[name] = (asset, REVALIDATE)
+                self.assets[hashed] = (asset, IMMUTABLE)
+                self.urls[name] = f"{prefix}/{hashed}"
+
+    def url(self, name: str) -> str:
+        """Fingerprinted URL for `name`, for use in templates."""
+        return self.urls.get(name, f"{self.prefix}/{name}")
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope)
+        path = scope["path"]
+        mount = scope.get("root_path", "")
+        if mount and path.startswith(mount):
+            path = path[len(mount) :]
+        entry = self.assets.get(path.lstrip("/"))
+        if request.method not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405)
+        elif entry is None:
+            response = PlainTextResponse("Not Found", status_code=404)
+        else:
+            asset, cache_control = entry
+            response = asset.response(request, cache_control)
+        await response(scope, receive, send)
+
+
+class PageCache:
+    """Templates rendered once and kept with their compressed variants."""
+
+    def __init__(self, templates: Jinja2Templates):
+        self.templates = templates
+        self.pages = {}
+
+    def get(self, name: str) -> Asset:
+        page = self.pages.get(name)
+        if page is None:
+            html = self.templates.get_template(name).render()
+            page = self.pages[name] = Asset(html.encode(), "text/html")
+        return page
@@ -0,0 +1,131 @@
+"""
+Group commit for note updates (GROUP_COMMIT_ENABLED).
+
+Autosaving clients send bursts of small PUTs, and committing each one
+costs an fsync and a turn on the SQLite writer lock. With group commit,
+the first update to arrive opens a batch and waits GROUP_COMMIT_WINDOW_SECONDS
+(less if GROUP_COMMIT_MAX_WRITES updates queue up first); every update
+arriving meanwhile joins it. Updates to the same note are merged, later
+fields winning, so only the latest content in the window becomes a version.
+The batch is then written with `crud.update_notes_grouped` in a single
+transaction. A task of its own waits out the window and commits, through a
+session of its own, so the batch does not depend on any of the requests in
+it: once queued, an update is written even if its request goes away.
+
+Responses are sent only once that transaction has committed, so a
+successful response still means the update is durable. Every request
+coalesced into a note's update gets the resulting note. Updates with
+If-Match never join a batch: they are applied on their own, as without
+group commit.
+"""
+
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, database
+from .config import GROUP_COMMIT_MAX_WRITES, GROUP_COMMIT_WINDOW_SECONDS
+from .database import run_db
+from .monitoring import (
+    GROUP_COMMIT_BATCH_WRITES,
+    GROUP_COMMIT_BATCHES,
+    GROUP_COMMIT_COALESCED,
+    GROUP_COMMIT_LATENCY_SECONDS,
+    GROUP_COMMIT_SECONDS,
+    GROUP_COMMIT_WRITES,
+)
+
+
+class Batch:
+    def __init__(self):
+        self.updates = {}
+        self.waiters = {}
+        self.writes = 0
+        self.full = asyncio.Event()
+
+
+class GroupCommitter:
+    """Collects note updates on one event loop and commits them together."""
+
+    def __init__(
+        self,
+        window: float = GROUP_COMMIT_WINDOW_SECONDS,
+        max_writes: int = GROUP_COMMIT_MAX_WRITES,
+        session_factory=None,
+    ):
+        self.window = window
+        self.max_writes = max_writes
+        # None: the app's write sessions, async ones in DB_EXECUTION_MODE=async
+        self.session_factory = session_factory
+        self._batches = {}
+        self._tasks = set()
+
+    async def update(self, note_id: str, values: dict):
+        """Queue an update of `note_id`; returns (note, error) once committed."""
+        queued = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(loop)
+        if batch is None:
+            batch = self._batches[loop] = Batch()
+            task = loop.create_task(self._run(loop, batch))
+            # The loop only keeps weak references to tasks
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if note_id in batch.updates:
+            GROUP_COMMIT_COALESCED.inc()
+        batch.updates[note_id] = {**batch.updates.get(note_id, {}), **values}
+        waiter = loop.create_future()
+        batch.waiters.setdefault(note_id, []).append(waiter)
+        batch.writes += 1
+        GROUP_COMMIT_WRITES.inc()
+        if batch.writes >= self.max_writes:
+            batch.full.set()
+        try:
+            return await waiter
+        finally:
+            GROUP_COMMIT_LATENCY_SECONDS.observe(time.perf_counter() - queued)
+
+    async def _run(self, loop, batch: Batch):
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if self._batches.get(loop) is batch:
+                del self._batches[loop]
+        await self._commit(batch)
+
+    def _new_session(self):
+        if self.session_factory is not None:
+            return self.session_factory()
+        return (database.AsyncSessionLocal or database.SessionLocal)()
+
+    async def _commit(self, batch: Batch):
+        start = time.perf_counter()
+        db = self._new_session()
+        try:
+            results = await run_db(db, crud.update_notes_grouped, batch.updates)
+        except Exception as e:
+            GROUP_COMMIT_BATCHES.labels(result="error").inc()
+            for waiters in batch.waiters.values():
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            return
+        finally:
+            if isinstance(db, AsyncSession):
+                await db.close()
+            else:
+                db.close()
+        GROUP_COMMIT_SECONDS.observe(time.perf_counter() - start)
+        GROUP_COMMIT_BATCHES.labels(result="ok").inc()
+        GROUP_COMMIT_BATCH_WRITES.observe(batch.writes)
+        for note_id, waiters in batch.waiters.items():
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(results[note_id])
+
+
+committer = GroupCommitter()
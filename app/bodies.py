@@ -0,0 +1,128 @@
+"""
+Out-of-row storage for large note bodies.
+
+A note whose content is larger than LARGE_CONTENT_BYTES keeps its body in
+the content_blobs table (see versioning.py), under its content_hash, like
+full versions do. The notes row only holds the first
+LARGE_CONTENT_PREFIX_CHARS characters, which is what full-text search
+indexes and listings preview, so scans and listings of notes no longer
+carry multi-MB values along. `content_size` is the body's size in bytes,
+for raw reads that answer Range requests without loading it twice.
+
+Readers that return a note's content put the full body back with `load`
+or `resolve`; raw reads take just the bytes they need with `read_range`.
+Existing notes are moved by migration 0004_large_bodies.
+"""
+
+from sqlalchemy import LargeBinary, cast, func, select
+from sqlalchemy.orm import Session
+
+from . import models, versioning
+from .config import LARGE_CONTENT_BYTES, LARGE_CONTENT_PREFIX_CHARS
+
+
+def note_values(content: str) -> dict:
+    """Values of the notes content columns for `content`."""
+    size = len(content.encode())
+    values = {
+        "content": content,
+        "content_hash": versioning.content_hash(content),
+        "content_size": size,
+        "content_external": False,
+    }
+    if size > LARGE_CONTENT_BYTES:
+        values.update(
+            content=content[:LARGE_CONTENT_PREFIX_CHARS], content_external=True
+        )
+    return values
+
+
+def load_many(db: Session, rows) -> dict:
+    """Full content of note rows, by note id."""
+    hashes = {row.content_hash for row in rows if row.content_external}
+    blobs = {}
+    if hashes:
+        table = models.BlobDB.__table__
+        blobs = dict(
+            db.execute(
+                select(table.c.hash, table.c.content).where(table.c.hash.in_(hashes))
+            ).all()
+        )
+    return {
+        row.id: blobs[row.content_hash] if row.content_external else row.content
+        for row in rows
+    }
+
+
+def load(db: Session, row) -> str:
+    return load_many(db, [row])[row.id]
+
+
+def _byte_slice(db: Session, column, start: int, length: int):
+    """SQL expression for `length` bytes of a text column from `start`, if any."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return func.substr(cast(column, LargeBinary), start + 1, length)
+    if dialect == "postgresql":
+        return func.substring(func.convert_to(column, "UTF8"), start + 1, length)
+    return None
+
+
+def read_range(db: Session, content_hash: str, start: int, end: int) -> bytes:
+    """Bytes [start, end) of the UTF-8 body stored under `content_hash`.
+
+    SQLite and PostgreSQL slice the body in SQL, so only those bytes reach
+    Python. Raises LookupError if the blob is no longer stored.
+    """
+    table = models.BlobDB.__table__
+    expression = _byte_slice(db, table.c.content, start, end - start)
+    if expression is None:
+        expression = table.c.content
+    data = db.execute(select(expression).where(table.c.hash == content_hash)).scalar()
+    if data is None:
+        raise LookupError(f"Blob {content_hash} is no longer stored")
+    if isinstance(data, str):
+        return data.encode()[start:end]
+    return bytes(data)
+
+
+def resolve(db: Session, rows) -> list:
+    """Note column rows with the full content put back where it is external.
+
+    Rows stored inline are returned as they are; the others become dicts.
+    """
+    if not any(row.content_external for row in rows):
+        return rows
+    contents = load_many(db, rows)
+    return [
+        {**row._mapping, "content": contents[row.id]} if row.content_external else row
+        for row in rows
+    ]
+
+
+def move_all(db: Session, batch_size: int = 100) -> int:
+    """Size every note and move large bodies out of row; returns notes moved."""
+    moved = 0
+    while True:
+        notes = (
+            db.query(models.NoteDB)
+            .filter(models.NoteDB.content_size.is_(None))
+            .order_by(models.NoteDB.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not notes:
+            return moved
+        bodies = {}
+        for note in notes:
+            if note.content is None:
+                note.content_size = 0
+                continue
+            values = note_values(note.content)
+            if values["content_external"]:
+                bodies[values["content_hash"]] = note.content
+                moved += 1
+            for column, value in values.items():
+                setattr(note, column, value)
+        versioning.store_blobs(db, bodies)
+        db.commit()
@@ -0,0 +1,236 @@
+"""
+Read-through cache for single notes and note listings.
+
+Notes are cached by id and dropped when that note is written. Listing pages
+are keyed by a generation number that every write bumps, so a stale page is
+never looked up again and just ages out. Readers take the generation before
+querying and only store their result if no write happened in between, so a
+read racing a write cannot put the old row back.
+
+Values are plain JSON-compatible dicts, never ORM objects, so they can be
+shared between sessions, threads and (with Redis) processes.
+"""
+
+import fnmatch
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from .config import CACHE_BACKEND, CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, REDIS_URL
+from .monitoring import CACHE_EVICTIONS, CACHE_HITS, CACHE_MISSES
+
+GENERATION_KEY = "generation"
+
+
+class LRUCache:
+    """Per-process LRU with a fixed TTL; safe to share between threads."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value, token: int):
+        with self._lock:
+            if token != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                CACHE_EVICTIONS.labels(backend=self.name).inc()
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class InMemoryStore:
+    """Stand-in for the subset of the Redis client API used by SharedCache."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            expires = time.monotonic() + ex if ex else None
+            self._data[key] = (
+                value.encode() if isinstance(value, str) else value,
+                expires,
+            )
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (b"0", None))
+            value = int(value) + 1
+            self._data[key] = (str(value).encode(), expires)
+            return value
+
+    def scan_iter(self, match=None):
+        with self._lock:
+            keys = list(self._data)
+        return [key for key in keys if match is None or fnmatch.fnmatch(key, match)]
+
+
+class SharedCache:
+    """Cache kept in a key/value store shared by every worker process.
+
+    Entries expire through the store's own TTL; evictions under memory
+    pressure happen inside the store and are not counted here.
+    """
+
+    name = "shared"
+
+    def __init__(self, store, ttl: float, prefix: str = "notes-app:"):
+        self.store = store
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def generation(self) -> int:
+        return int(self.store.get(self.prefix + GENERATION_KEY) or 0)
+
+    def get(self, key: str):
+        raw = self.store.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def put(self, key: str, value, token: int):
+        # Not atomic with the check, but narrows the race to a single round trip
+        if token != self.generation():
+            return
+        self.store.set(self.prefix + key, json.dumps(value), ex=max(1, int(self.ttl)))
+
+    def invalidate(self, keys):
+        if keys:
+            self.store.delete(*(self.prefix + key for key in keys))
+        self.store.incr(self.prefix + GENERATION_KEY)
+
+    def clear(self):
+        keys = list(self.store.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.store.delete(*keys)
+
+
+class NullCache:
+    name = "none"
+
+    def generation(self) -> int:
+        return 0
+
+    def get(self, key: str):
+        return None
+
+    def put(self, key: str, value, token: int):
+        pass
+
+    def invalidate(self, keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+def create_backend(name: str = CACHE_BACKEND):
+    if name == "none":
+        return NullCache()
+    if name == "shared":
+        if REDIS_URL:
+            import redis
+
+            return SharedCache(redis.Redis.from_url(REDIS_URL), CACHE_TTL_SECONDS)
+        return SharedCache(InMemoryStore(), CACHE_TTL_SECONDS)
+    if name == "memory":
+        return LRUCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+    raise ValueError(f"Unknown CACHE_BACKEND {name!r}")
+
+
+def backend_for_workers(name: str, workers: int) -> str:
+    """The cache backend `workers` processes may use.
+
+    Writes only invalidate the cache of the process that handled them, so
+    with several workers a per-process cache serves stale notes (and stale
+    ETags, which fail the next If-Match save). Only Redis is shared.
+    """
+    if workers > 1 and (name == "memory" or (name == "shared" and not REDIS_URL)):
+        return "none"
+    return name
+
+
+backend = create_backend()
+
+
+def note_key(note_id: str) -> str:
+    return f"note:{note_id}"
+
+
+def listing_key(kind: str, token: int, **params) -> str:
+    return f"{kind}:{token}:" + json.dumps(params, sort_keys=True)
+
+
+def generation() -> int:
+    """Take before reading from the database; pass to `put` afterwards."""
+    return backend.generation()
+
+
+def get(cache: str, key: str):
+    value = backend.get(key)
+    if value is None:
+        CACHE_MISSES.labels(cache=cache).inc()
+    else:
+        CACHE_HITS.labels(cache=cache).inc()
+    return value
+
+
+def put(key: str, value, token: int):
+    backend.put(key, value, token)
+
+
+def invalidate(*note_ids: str):
+    """Drop the given notes and every cached listing; call after commit."""
+    backend.invalidate([note_key(note_id) for note_id in note_ids])
+
+
+def clear():
+    backend.clear()
@@ -0,0 +1,145 @@
+"""
+Response compression: Accept-Encoding negotiation, and middleware that
+gzips JSON API responses above COMPRESSION_MIN_BYTES on the fly.
+
+Static assets and the index page are compressed once, ahead of time (see
+assets.py); brotli is used for those when the optional `brotli` package is
+installed. Streaming responses are passed through untouched, so NDJSON
+exports and event streams are never buffered.
+"""
+
+import gzip
+
+from .conditional import coded_etag
+from .config import COMPRESSION_LEVEL, COMPRESSION_MIN_BYTES
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = (b"application/json",)
+
+
+def accepted_encodings(headers) -> set:
+    """Codings the client accepts, from raw ASGI headers or a Headers mapping."""
+    if hasattr(headers, "get"):
+        value = headers.get("accept-encoding", "")
+    else:
+        value = next(
+            (v.decode("latin-1") for k, v in headers if k == b"accept-encoding"), ""
+        )
+    accepted = set()
+    for part in value.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if coding:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def precompress(body: bytes) -> dict:
+    """{coding: body} for every coding worth storing, identity included."""
+    variants = {"identity": body}
+    compressed = gzip.compress(body, compresslevel=9, mtime=0)
+    if len(compressed) < len(body):
+        variants["gzip"] = compressed
+    if brotli is not None:
+        compressed = brotli.compress(body)
+        if len(compressed) < len(body):
+            variants["br"] = compressed
+    return variants
+
+
+def choose(variants: dict, accepted: set) -> str:
+    """Best stored coding the client accepts."""
+    for coding in ("br", "gzip"):
+        if coding in variants and coding in accepted:
+            return coding
+    return "identity"
+
+
+def _header(headers, name: bytes):
+    return next((value for key, value in headers if key == name), None)
+
+
+def _vary(headers) -> bytes:
+    """The Vary value of `headers` with Accept-Encoding added."""
+    values = [
+        v.strip() for key, value in headers if key == b"vary" for v in value.split(b",")
+    ]
+    if b"*" in values or b"accept-encoding" in {v.lower() for v in values}:
+        return b", ".join(values)
+    return b", ".join([v for v in values if v] + [b"Accept-Encoding"])
+
+
+def _gzip_etag(etag: bytes) -> bytes:
+    return coded_etag(etag.decode("latin-1"), "gzip").encode("latin-1")
+
+
+class CompressionMiddleware:
+    """Gzip single-message JSON responses of at least `minimum_size` bytes.
+
+    A strong ETag on a compressed response gets a "-gzip" suffix
+    (`conditional.coded_etag`): If-None-Match and If-Match still match it,
+    while If-Range, which needs the exact bytes, does not.
+    """
+
+    def __init__(self, app, minimum_size: int = None, level: int = None):
+        self.app = app
+        self.minimum_size = (
+            COMPRESSION_MIN_BYTES if minimum_size is None else minimum_size
+        )
+        self.level = COMPRESSION_LEVEL if level is None else level
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "gzip" not in accepted_encodings(
+            scope["headers"]
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = _header(headers, b"content-type") or b""
+                if _header(headers, b"content-encoding") is not None or not (
+                    content_type.startswith(COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held back until the body shows whether to compress
+                    start = message
+                return
+
+            body = message.get("body", b"")
+            passthrough = True
+            if message.get("more_body") or len(body) < self.minimum_size:
+                await send(start)
+                await send(message)
+                return
+            compressed = gzip.compress(body, compresslevel=self.level)
+            original = start.get("headers", [])
+            headers = [
+                (key, _gzip_etag(value) if key == b"etag" else value)
+                for key, value in original
+                if key not in (b"content-length", b"vary")
+            ]
+            headers += [
+                (b"content-encoding", b"gzip"),
+                (b"content-length", str(len(compressed)).encode()),
+                (b"vary", _vary(original)),
+            ]
+            await send({**start, "headers": headers})
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,172 @@
+"""
+Conditional request helpers: ETag, Last-Modified, If-None-Match, If-Match,
+and Range with If-Range.
+
+A note's version increments on every write, so it is used directly as the
+note's strong ETag. Collections get weak ETags hashed from what they
+contain. Timestamps are naive local times, as stored by crud.
+"""
+
+import hashlib
+import json
+import re
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+_ETAG_RE = re.compile(r'\*|(?:W/)?"[^"]*"')
+# Content codings whose representations get tags of their own (coded_etag)
+CODINGS = ("gzip", "br")
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def note_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def version_etag(version_id: str) -> str:
+    # Version rows are never edited, only re-encoded, so the id is enough
+    return f'"{version_id}"'
+
+
+def collection_etag(*parts) -> str:
+    raw = json.dumps(parts, default=str, separators=(",", ":")).encode()
+    return f'W/"{hashlib.sha1(raw).hexdigest()[:20]}"'
+
+
+def _as_datetime(value) -> datetime:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def http_date(value) -> str:
+    return format_datetime(_as_datetime(value).astimezone(timezone.utc), usegmt=True)
+
+
+def _etags(header: str):
+    return _ETAG_RE.findall(header)
+
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def coded_etag(etag: str, coding: str) -> str:
+    """The tag of `coding`'s representation of the response tagged `etag`.
+
+    Strong tags get a "-<coding>" suffix, so each coding has its own tag;
+    weak tags already allow for a different coding and are left alone.
+    """
+    if coding == "identity" or etag.startswith("W/"):
+        return etag
+    return f'{etag[:-1]}-{coding}"'
+
+
+def _identity(etag: str) -> str:
+    """The opaque tag of the identity representation behind `etag`."""
+    etag = _opaque(etag)
+    for coding in CODINGS:
+        if etag.endswith(f'-{coding}"'):
+            return etag[: -len(coding) - 2] + '"'
+    return etag
+
+
+def has_validators(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified=None) -> bool:
+    """Evaluate If-None-Match, else If-Modified-Since.
+
+    If-None-Match uses weak comparison, which also matches a tag from another
+    content coding of the same response.
+    """
+    header = request.headers.get("if-none-match")
+    if header is not None:
+        tags = _etags(header)
+        return "*" in tags or _identity(etag) in {_identity(tag) for tag in tags}
+
+    header = request.headers.get("if-modified-since")
+    if header is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    modified = _as_datetime(last_modified).astimezone(timezone.utc)
+    return modified.replace(microsecond=0) <= since
+
+
+def set_validators(response: Response, etag: str, last_modified=None):
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+
+
+def not_modified(etag: str, last_modified=None) -> Response:
+    response = Response(status_code=304)
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def if_match_versions(request: Request):
+    """Note versions accepted by If-Match, or None if any version will do.
+
+    Weak and unparseable tags never match, so they yield an empty set. A
+    note's tag is its version whatever the coding, so "<version>-gzip" from
+    a compressed response matches that version.
+    """
+    header = request.headers.get("if-match")
+    if header is None:
+        return None
+    tags = _etags(header)
+    if "*" in tags:
+        return None
+    versions = set()
+    for tag in tags:
+        version = _identity(tag).strip('"')
+        if not tag.startswith("W/") and version.isdigit():
+            versions.add(int(version))
+    return versions
+
+
+def byte_range(request: Request, etag: str, last_modified, size: int):
+    """(start, end) of the bytes asked for by Range, end exclusive, or None.
+
+    Only a single range is served; several ranges, a malformed header or an
+    If-Range that no longer matches get the whole body (None). Raises
+    RangeNotSatisfiable if the range lies beyond the body.
+    """
+    header = request.headers.get("range")
+    if header is None:
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None:
+        current = etag if if_range.strip().startswith('"') else http_date(last_modified)
+        if if_range.strip() != current:
+            return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if (
+        not (first or last)
+        or not (first or "0").isdigit()
+        or not (last or "0").isdigit()
+    ):
+        return None
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = int(last) + 1 if last else size
+    else:
+        start = max(size - int(last), 0)
+        end = size if int(last) else 0
+    end = min(end, size)
+    if start >= end:
+        raise RangeNotSatisfiable(f"bytes */{size}")
+    return start, end
@@ -8,15 +8,159 @@ import os
 # Database Configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./notes.db")
 
+# Optional read replica: GET routes read from it, everything else uses
+# DATABASE_URL. A client that wrote within READ_YOUR_WRITES_SECONDS (tracked
+# with a cookie) reads from the primary instead, so replica lag never hides
+# its own changes
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# Connection pool for server databases such as PostgreSQL (SQLite file
+# databases are sized by the SQLite profile below). The defaults are
+# SQLAlchemy's; DB_POOL_RECYCLE_SECONDS=-1 never recycles
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "-1"))
+
+# How route handlers reach the database without blocking the event loop:
+#   "threadpool" - sync sessions, crud calls offloaded to a worker thread
+#   "async"      - AsyncSession on aiosqlite/asyncpg, crud run via run_sync
+#   "inline"     - sync sessions called directly on the event loop (legacy)
+DB_EXECUTION_MODE = os.getenv("DB_EXECUTION_MODE", "threadpool")
+
+# SQLite file databases: "tuned" applies the pragmas below to every
+# connection and splits the engine into one writer connection (writes queue
+# for it) and a pool of SQLITE_READ_POOL_SIZE read-only connections;
+# "default" keeps SQLite's defaults and a single shared pool
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned")
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Page cache per connection; negative values are KiB, so 64 MiB
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+# Longest a write waits for the writer connection before failing
+SQLITE_WRITE_TIMEOUT_SECONDS = float(os.getenv("SQLITE_WRITE_TIMEOUT_SECONDS", "30"))
+
 # API Configuration
 API_VERSION = "2.0.0"
 APP_TITLE = "Notes App with Versioning"
 
+# Pagination
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+MAX_PREVIEW_LENGTH = 500
+
+# Bulk API: maximum notes accepted by one bulk request
+MAX_BULK_ITEMS = int(os.getenv("MAX_BULK_ITEMS", "1000"))
+
+# Version storage: every Nth version keeps its full content, the rest are
+# reverse deltas, so reading any version replays at most N - 1 deltas
+VERSION_KEYFRAME_INTERVAL = int(os.getenv("VERSION_KEYFRAME_INTERVAL", "20"))
+
+# Note bodies larger than LARGE_CONTENT_BYTES are kept out of the notes row,
+# which holds only their first LARGE_CONTENT_PREFIX_CHARS characters for
+# search and previews. MAX_CONTENT_BYTES caps raw uploads to /content
+LARGE_CONTENT_BYTES = int(os.getenv("LARGE_CONTENT_BYTES", str(256 * 1024)))
+LARGE_CONTENT_PREFIX_CHARS = int(os.getenv("LARGE_CONTENT_PREFIX_CHARS", "16384"))
+MAX_CONTENT_BYTES = int(os.getenv("MAX_CONTENT_BYTES", str(64 * 1024 * 1024)))
+CONTENT_CHUNK_BYTES = 64 * 1024
+# Out-of-row bodies are read from the database this many bytes per query
+CONTENT_READ_BYTES = 1024 * 1024
+
+# Group commit: note updates without If-Match are queued for up to
+# GROUP_COMMIT_WINDOW_SECONDS (or until GROUP_COMMIT_MAX_WRITES are queued)
+# and committed together, the latest update to each note winning
+GROUP_COMMIT_ENABLED = os.getenv("GROUP_COMMIT_ENABLED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+GROUP_COMMIT_WINDOW_SECONDS = float(os.getenv("GROUP_COMMIT_WINDOW_SECONDS", "0.01"))
+GROUP_COMMIT_MAX_WRITES = int(os.getenv("GROUP_COMMIT_MAX_WRITES", "256"))
+
+# Version retention, enforced by a background compaction task when enabled.
+# Kept: the newest RETENTION_KEEP_LAST versions, everything from the last
+# RETENTION_KEEP_DAYS days, and the last version of each day for
+# RETENTION_DAILY_DAYS days (0 keeps daily snapshots forever)
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+RETENTION_KEEP_LAST = int(os.getenv("RETENTION_KEEP_LAST", "50"))
+RETENTION_KEEP_DAYS = float(os.getenv("RETENTION_KEEP_DAYS", "30"))
+RETENTION_DAILY_DAYS = float(os.getenv("RETENTION_DAILY_DAYS", "365"))
+# Notes pruned per transaction, and the pause between transactions that
+# lets queued writes through
+COMPACTION_INTERVAL_SECONDS = float(os.getenv("COMPACTION_INTERVAL_SECONDS", "3600"))
+COMPACTION_BATCH_SIZE = int(os.getenv("COMPACTION_BATCH_SIZE", "5"))
+COMPACTION_PAUSE_SECONDS = float(os.getenv("COMPACTION_PAUSE_SECONDS", "0.05"))
+
+# Read cache for notes and listings:
+#   "memory" - per-process LRU with TTL
+#   "shared" - shared key/value store; Redis at REDIS_URL, or an in-process
+#              stand-in with the same interface when REDIS_URL is unset
+#   "none"   - disabled
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Request latency histogram buckets in seconds, e.g. "0.005,0.01,0.05,0.1,0.5,1"
+# (defaults to prometheus_client's buckets)
+METRICS_LATENCY_BUCKETS = os.getenv("METRICS_LATENCY_BUCKETS")
+
+# Statements slower than this (seconds) are logged by app.monitoring
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))
+
+# Profiling: a fraction of requests (0 disables sampling) is run under the
+# sampling profiler; requests sending `X-Profile: <ADMIN_TOKEN>` always are.
+# Profiles are kept in memory and downloaded from /admin/profiles, which
+# requires the `X-Admin-Token` header and is disabled while ADMIN_TOKEN is unset.
+# Event streams are never profiled, and sampling stops after PROFILE_MAX_SECONDS
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "50"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 # Server Configuration
 DEFAULT_HOST = "0.0.0.0"
 DEFAULT_PORT = 8000
 LOG_LEVEL = "info"
 
+# run.py: "development" (auto-reload, one process) or "production"
+SERVER_MODE = os.getenv("SERVER_MODE", "development")
+# Production worker processes. More than one needs CACHE_BACKEND=shared with
+# REDIS_URL: run.py disables a per-process cache for them, since each worker
+# would keep serving notes the others have changed
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+KEEP_ALIVE_SECONDS = int(os.getenv("KEEP_ALIVE_SECONDS", "5"))
+SOCKET_BACKLOG = int(os.getenv("SOCKET_BACKLOG", "2048"))
+# In-flight requests get this long to finish on shutdown
+GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30"))
+
+# Fingerprinted static assets are cached by browsers for this long
+STATIC_MAX_AGE_SECONDS = int(os.getenv("STATIC_MAX_AGE_SECONDS", str(365 * 24 * 3600)))
+# JSON responses at least this large are gzipped for clients that accept it
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "6"))
+
+# Change feed (/api/notes/stream): a subscriber this many events behind is
+# told to reload instead; reconnects can resume from the last EVENT_HISTORY
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))
+EVENT_HISTORY = int(os.getenv("EVENT_HISTORY", "1000"))
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+EVENT_PREVIEW_LENGTH = 120
+
 # File paths (relative to project root)
 TEMPLATES_DIR = "templates"
 STATIC_DIR = "static"
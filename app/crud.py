@@ -1,166 +1,824 @@
+import base64
+import json
 import uuid
 from datetime import datetime
 
-from sqlalchemy import or_
-from sqlalchemy.orm import Session
+from sqlalchemy import case, delete, func, insert, or_, select, tuple_, update
+from sqlalchemy.orm import Session, defer
 
-from . import models, schemas
+from . import bodies, cache, events, models, schemas, versioning
+from .retention import stored_length
+from .search import apply_search
 
 
 def get_note(db: Session, note_id: str):
     return db.query(models.NoteDB).filter(models.NoteDB.id == note_id).first()
 
 
-def get_notes(db: Session, search: str = None):
-    query = db.query(models.NoteDB)
+def encode_cursor(updated_at: datetime, note_id: str) -> str:
+    raw = json.dumps([updated_at.isoformat(), note_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
+    # Anything else that unpacks into two values (a string, an object) is rejected
+    if not (
+        isinstance(payload, list)
+        and len(payload) == 2
+        and all(isinstance(value, str) for value in payload)
+    ):
+        raise ValueError("Invalid cursor")
+    updated_at, note_id = payload
+    try:
+        return datetime.fromisoformat(updated_at), note_id
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _page_notes(query, search: str = None, limit: int = None, cursor: str = None):
+    """Apply search or keyset pagination; returns (rows, next_cursor).
+
+    Search results are ranked and only truncated to `limit`, since rank order
+    has no stable keyset. Unfiltered listings walk (updated_at, id) newest
+    first, and `next_cursor` is set while more rows remain.
+    """
     if search:
-        search_lower = f"%{search.lower()}%"
+        query = apply_search(query, search)
+        if limit:
+            query = query.limit(limit)
+        return query.all(), None
+
+    query = query.order_by(models.NoteDB.updated_at.desc(), models.NoteDB.id.desc())
+    if cursor:
         query = query.filter(
-            or_(
-                models.NoteDB.title.ilike(search_lower),
-                models.NoteDB.content.ilike(search_lower),
-            )
+            tuple_(models.NoteDB.updated_at, models.NoteDB.id) < decode_cursor(cursor)
         )
-    return query.all()
+    if not limit:
+        return query.all(), None
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].updated_at, rows[-1].id)
+
+
+# Listings select plain columns: rows skip ORM identity-map bookkeeping
+NOTE_COLUMNS = [column for column in models.NoteDB.__table__.c]
+
+
+def get_notes(db: Session, search: str = None, limit: int = None, cursor: str = None):
+    query = db.query(models.NoteDB).with_entities(*NOTE_COLUMNS)
+    rows, next_cursor = _page_notes(query, search, limit, cursor)
+    return bodies.resolve(db, rows), next_cursor
+
+
+def get_note_summaries(
+    db: Session,
+    search: str = None,
+    limit: int = None,
+    cursor: str = None,
+    preview: int = 0,
+):
+    columns = [
+        models.NoteDB.id,
+        models.NoteDB.title,
+        models.NoteDB.updated_at,
+        models.NoteDB.version,
+    ]
+    if preview:
+        columns.append(func.substr(models.NoteDB.content, 1, preview).label("preview"))
+    query = db.query(models.NoteDB).with_entities(*columns)
+    return _page_notes(query, search, limit, cursor)
+
+
+def get_note_body(db: Session, note_id: str):
+    """(row, content) for a note's raw content, or None if no such note.
+
+    The row has the note's id, version, updated_at, content_hash and
+    content_size. `content` is None for a body stored out of row, which is
+    left in the database for `bodies.read_range`.
+    """
+    row = db.execute(
+        select(
+            models.NoteDB.id,
+            models.NoteDB.version,
+            models.NoteDB.updated_at,
+            models.NoteDB.content,
+            models.NoteDB.content_hash,
+            models.NoteDB.content_size,
+            models.NoteDB.content_external,
+        ).where(models.NoteDB.id == note_id)
+    ).first()
+    if row is None:
+        return None
+    return row, None if row.content_external else row.content or ""
+
+
+def get_note_validator(db: Session, note_id: str):
+    """(version, updated_at) of a note, without loading its content."""
+    return (
+        db.query(models.NoteDB.version, models.NoteDB.updated_at)
+        .filter(models.NoteDB.id == note_id)
+        .first()
+    )
+
+
+def _fill_cache(db: Session, key: str, value, token: int):
+    # A replica may lag the primary, so only primary reads refill the cache
+    if not db.info.get("replica"):
+        cache.put(key, value, token)
+
+
+def get_note_cached(db: Session, note_id: str):
+    """Read-through cached `get_note`; returns a Note dict or None."""
+    key = cache.note_key(note_id)
+    cached = cache.get("note", key)
+    if cached is not None:
+        return cached
+    token = cache.generation()
+    note = db.execute(select(*NOTE_COLUMNS).where(models.NoteDB.id == note_id)).first()
+    if note is None:
+        return None
+    data = _note_model(db, note).model_dump(mode="json")
+    _fill_cache(db, key, data, token)
+    return data
+
+
+def _cached_page(db: Session, kind: str, schema, fn, **params):
+    token = cache.generation()
+    key = cache.listing_key(kind, token, **params)
+    cached = cache.get(kind, key)
+    if cached is not None:
+        return cached["items"], cached["next_cursor"]
+    rows, next_cursor = fn(db, **params)
+    adapter = schemas.list_adapter(schema)
+    items = adapter.dump_python(
+        adapter.validate_python(rows, from_attributes=True), mode="json"
+    )
+    _fill_cache(db, key, {"items": items, "next_cursor": next_cursor}, token)
+    return items, next_cursor
+
+
+def get_notes_cached(
+    db: Session, search: str = None, limit: int = None, cursor: str = None
+):
+    """Read-through cached `get_notes`; returns (Note dicts, next_cursor)."""
+    return _cached_page(
+        db, "notes", schemas.Note, get_notes, search=search, limit=limit, cursor=cursor
+    )
+
+
+def get_note_summaries_cached(
+    db: Session,
+    search: str = None,
+    limit: int = None,
+    cursor: str = None,
+    preview: int = 0,
+):
+    return _cached_page(
+        db,
+        "summaries",
+        schemas.NoteSummary,
+        get_note_summaries,
+        search=search,
+        limit=limit,
+        cursor=cursor,
+        preview=preview,
+    )
 
 
 def create_note(db: Session, note: schemas.NoteCreate):
     note_id = str(uuid.uuid4())
-    now = datetime.now().isoformat()
-
-    # Create DB object
-    new_note_db = models.NoteDB(
-        id=note_id,
-        title=note.title,
-        content=note.content,
-        created_at=now,
-        updated_at=now,
-        version=1,
-    )
-
-    # Create version DB object
-    version_id = str(uuid.uuid4())
-    new_version_db = models.NoteVersionDB(
-        id=version_id,
-        note_id=note_id,
-        title=note.title,
-        content=note.content,
-        version=1,
-        created_at=now,
-    )
+    now = datetime.now()
+    note_row = {
+        "id": note_id,
+        "title": note.title,
+        "content": note.content,
+        "created_at": now,
+        "updated_at": now,
+        "version": 1,
+    }
+    values = bodies.note_values(note.content)
 
     try:
-        db.add(new_note_db)
-        db.add(new_version_db)
+        db.execute(insert(models.NoteDB), {**note_row, **values})
+        versioning.insert_versions(
+            db,
+            [
+                {
+                    "id": str(uuid.uuid4()),
+                    "note_id": note_id,
+                    "title": note.title,
+                    "content": note.content,
+                    "content_hash": values["content_hash"],
+                    "storage": versioning.STORAGE_FULL,
+                    "version": 1,
+                    "created_at": now,
+                }
+            ],
+        )
         db.commit()
-        db.refresh(new_note_db)
-        return new_note_db
     except Exception as e:
         db.rollback()
         raise e
+    cache.invalidate()
+    events.note_changed(events.CREATED, note_row)
+    # Everything the response needs is known, so nothing is read back
+    return schemas.Note(**note_row)
 
 
-def update_note(db: Session, note_id: str, note_update: schemas.NoteUpdate):
-    existing_note = get_note(db, note_id)
-    if not existing_note:
-        return None
+# _write_note's "error" when the write would not change the note
+UNCHANGED = "Unchanged"
 
-    new_version = existing_note.version + 1
-    now = datetime.now().isoformat()
 
-    # Create new version record
-    version_id = str(uuid.uuid4())
-    new_version_db = models.NoteVersionDB(
-        id=version_id,
-        note_id=note_id,
-        title=note_update.title or existing_note.title,
-        content=note_update.content or existing_note.content,
-        version=new_version,
-        created_at=now,
+def _write_note(db: Session, note_id: str, values: dict, expected_versions=None):
+    """Apply `values` to a note, bump its version and add the version row.
+
+    One UPDATE ... RETURNING increments the version in SQL and returns the
+    new row, and one INSERT adds its version, so there is no read-modify-
+    write window. The UPDATE only matches while the title or the content
+    hash differ, so a write that changes nothing adds no version and
+    returns (current row, UNCHANGED). Returns (row, error); the caller
+    commits.
+    """
+    now = datetime.now()
+    content = values.get("content")
+    if content is not None:
+        values = {**values, **bodies.note_values(content)}
+    changes = []
+    if "title" in values:
+        changes.append(models.NoteDB.title.is_distinct_from(values["title"]))
+    if "content_hash" in values:
+        changes.append(
+            models.NoteDB.content_hash.is_distinct_from(values["content_hash"])
+        )
+    row = None
+    if changes:
+        statement = (
+            update(models.NoteDB)
+            .where(models.NoteDB.id == note_id, or_(*changes))
+            .values(**values, updated_at=now, version=models.NoteDB.version + 1)
+            .returning(*NOTE_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+        if expected_versions is not None:
+            statement = statement.where(models.NoteDB.version.in_(expected_versions))
+        row = db.execute(statement).first()
+    if row is None:
+        # Only writes that did nothing pay for a second look, to report why
+        current = db.execute(
+            select(*NOTE_COLUMNS).where(models.NoteDB.id == note_id)
+        ).first()
+        if current is None:
+            return None, "Note not found"
+        if expected_versions is not None and current.version not in expected_versions:
+            return None, "Version mismatch"
+        return current, UNCHANGED
+
+    if content is None and not row.content_external:
+        content = row.content
+    versioning.insert_versions(
+        db,
+        [
+            {
+                "id": str(uuid.uuid4()),
+                "note_id": note_id,
+                "title": row.title,
+                # None for a title-only change to a large note: the version
+                # references the blob the note already has
+                "content": content,
+                "content_hash": row.content_hash,
+                "storage": versioning.STORAGE_FULL,
+                "version": row.version,
+                "created_at": now,
+            }
+        ],
     )
+    return row, None
+
+
+def _note_model(db: Session, row, content: str = None):
+    """The Note for a row of NOTE_COLUMNS; `content` is its full text, if known."""
+    if content is None:
+        content = bodies.load(db, row)
+    return schemas.Note(**{**row._mapping, "content": content})
+
+
+def _commit_write(db: Session, row, kind: str, content: str = None):
+    note = _note_model(db, row, content)
+    # The old head becomes a reverse delta in the same transaction
+    versioning.supersede_previous(db, row.id, row.version, note.content)
+    db.commit()
+    cache.invalidate(row.id)
+    events.note_changed(kind, row._mapping)
+    return note
+
+
+def update_note(
+    db: Session,
+    note_id: str,
+    note_update: schemas.NoteUpdate,
+    expected_versions=None,
+):
+    """Update a note and add a version; returns (note, error).
 
-    # Update the note
-    if note_update.title is not None:
-        existing_note.title = note_update.title
-    if note_update.content is not None:
-        existing_note.content = note_update.content
+    The version is incremented in SQL, so concurrent writers each get their
+    own version. `expected_versions` (from If-Match) restricts the update to
+    those versions, and "Version mismatch" is returned otherwise. An update
+    that changes nothing returns the note as it is, without a new version.
+    """
+    values = note_update.model_dump(exclude_none=True)
+    try:
+        row, error = _write_note(db, note_id, values, expected_versions)
+        if error == UNCHANGED:
+            note = _note_model(db, row, note_update.content)
+            db.rollback()
+            return note, None
+        if error:
+            db.rollback()
+            return None, error
+        return _commit_write(db, row, events.UPDATED, note_update.content), None
+    except Exception as e:
+        db.rollback()
+        raise e
 
-    existing_note.updated_at = now
-    existing_note.version = new_version
 
+def update_notes_grouped(db: Session, updates: dict) -> dict:
+    """Apply {note_id: values} updates in one transaction (group commit).
+
+    Each note gets one version, as `update_note` would give it, and the
+    transaction commits once for all of them. Returns {note_id: (note,
+    error)}; an exception rolls back every update in the group.
+    """
+    results = {}
+    written = []
     try:
-        db.add(new_version_db)
+        for note_id, values in updates.items():
+            row, error = _write_note(db, note_id, values)
+            if error == UNCHANGED:
+                results[note_id] = (_note_model(db, row, values.get("content")), None)
+            elif error:
+                results[note_id] = (None, error)
+            else:
+                note = _note_model(db, row, values.get("content"))
+                results[note_id] = (note, None)
+                written.append((row, note))
+        # The old heads become reverse deltas, still in the same transaction
+        versioning.supersede_previous_many(
+            db, [(row.id, row.version, note.content) for row, note in written]
+        )
         db.commit()
-        db.refresh(existing_note)
-        return existing_note
     except Exception as e:
         db.rollback()
         raise e
+    if written:
+        cache.invalidate(*(row.id for row, _ in written))
+    for row, _ in written:
+        events.note_changed(events.UPDATED, row._mapping)
+    return results
 
 
 def delete_note(db: Session, note_id: str):
-    note = get_note(db, note_id)
-    if note:
+    """Delete a note and its history with two DELETEs and no prior SELECT."""
+    try:
+        deleted = _delete_notes(db, [note_id])
+        if not deleted:
+            db.rollback()
+            return False
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    cache.invalidate(note_id)
+    events.note_deleted(note_id)
+    return True
+
+
+def _delete_notes(db: Session, note_ids) -> int:
+    """Delete notes and their history, then the blobs only they referenced.
+
+    Returns the number of notes deleted.
+    """
+    versions = models.NoteVersionDB
+    hashes = (
+        db.execute(
+            delete(versions)
+            .where(versions.note_id.in_(note_ids))
+            .returning(versions.content_hash)
+            .execution_options(synchronize_session=False)
+        )
+        .scalars()
+        .all()
+    )
+    notes = (
+        db.execute(
+            delete(models.NoteDB)
+            .where(models.NoteDB.id.in_(note_ids))
+            .returning(models.NoteDB.content_hash)
+            .execution_options(synchronize_session=False)
+        )
+        .scalars()
+        .all()
+    )
+    versioning.release_blobs(db, hashes + notes)
+    return len(notes)
+
+
+def _bulk_result(results):
+    failed = sum(1 for result in results if result.detail)
+    return schemas.BulkResult(
+        succeeded=len(results) - failed, failed=failed, results=results
+    )
+
+
+def bulk_create_notes(db: Session, notes):
+    """Insert notes and their first versions with two batched INSERTs."""
+    now = datetime.now()
+    note_rows = []
+    version_rows = []
+    for note in notes:
+        note_id = str(uuid.uuid4())
+        values = bodies.note_values(note.content)
+        note_rows.append(
+            {
+                "id": note_id,
+                "title": note.title,
+                **values,
+                "created_at": now,
+                "updated_at": now,
+                "version": 1,
+            }
+        )
+        version_rows.append(
+            {
+                "id": str(uuid.uuid4()),
+                "note_id": note_id,
+                "title": note.title,
+                "content": note.content,
+                "content_hash": values["content_hash"],
+                "storage": versioning.STORAGE_FULL,
+                "version": 1,
+                "created_at": now,
+            }
+        )
+
+    try:
+        db.execute(insert(models.NoteDB), note_rows)
+        versioning.insert_versions(db, version_rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    cache.invalidate()
+    for row in note_rows:
+        events.note_changed(events.CREATED, row)
+
+    return _bulk_result(
+        [
+            schemas.BulkItemResult(index=i, id=row["id"], status="created", version=1)
+            for i, row in enumerate(note_rows)
+        ]
+    )
+
+
+def bulk_update_notes(db: Session, updates):
+    """Apply many updates in one transaction with batched statements.
+
+    Each note is read once, updated by primary key in a single executemany,
+    and gets its new version row from one batched INSERT. The read locks
+    the notes where the database has row locks (SQLite's writer lock already
+    serializes writes), so the versions computed from it cannot collide with
+    a concurrent writer's. Items that would not change their note are
+    reported as "unchanged" and add no version.
+    """
+    ids = {update.id for update in updates}
+    existing = {
+        note.id: note
+        for note in db.query(models.NoteDB).filter(models.NoteDB.id.in_(ids))
+        # Locked in id order, so overlapping bulk updates cannot deadlock
+        .order_by(models.NoteDB.id).with_for_update()
+    }
+    contents = bodies.load_many(db, existing.values())
+    now = datetime.now()
+    results = []
+    seen = set()
+    note_rows = []
+    version_rows = []
+    heads = []
+    for i, update_item in enumerate(updates):
+        note = existing.get(update_item.id)
+        if note is None:
+            results.append(
+                schemas.BulkItemResult(
+                    index=i,
+                    id=update_item.id,
+                    status="not_found",
+                    detail="Note not found",
+                )
+            )
+            continue
+        if note.id in seen:
+            results.append(
+                schemas.BulkItemResult(
+                    index=i, id=note.id, status="error", detail="Duplicate id in batch"
+                )
+            )
+            continue
+        seen.add(note.id)
+
+        title = update_item.title if update_item.title is not None else note.title
+        old_content = contents[note.id]
+        content = (
+            update_item.content if update_item.content is not None else old_content
+        )
+        if title == note.title and content == old_content:
+            results.append(
+                schemas.BulkItemResult(
+                    index=i, id=note.id, status="unchanged", version=note.version
+                )
+            )
+            continue
+        values = bodies.note_values(content)
+        new_version = note.version + 1
+        heads.append((note.id, note.version, old_content, content))
+        note_rows.append(
+            {
+                "id": note.id,
+                "title": title,
+                **values,
+                "updated_at": now,
+                "version": new_version,
+            }
+        )
+        version_rows.append(
+            {
+                "id": str(uuid.uuid4()),
+                "note_id": note.id,
+                "title": title,
+                "content": content,
+                "content_hash": values["content_hash"],
+                "storage": versioning.STORAGE_FULL,
+                "version": new_version,
+                "created_at": now,
+            }
+        )
+        results.append(
+            schemas.BulkItemResult(
+                index=i, id=note.id, status="updated", version=new_version
+            )
+        )
+
+    if note_rows:
         try:
-            db.delete(note)
+            versioning.supersede_many(db, heads)
+            db.execute(update(models.NoteDB), note_rows)
+            versioning.insert_versions(db, version_rows)
             db.commit()
-            return True
         except Exception as e:
             db.rollback()
             raise e
-    return False
+        cache.invalidate(*(row["id"] for row in note_rows))
+        for row in note_rows:
+            events.note_changed(events.UPDATED, row)
+    return _bulk_result(results)
+
+
+def bulk_delete_notes(db: Session, note_ids):
+    """Delete many notes and their history with two batched DELETEs."""
+    ids = set(note_ids)
+    found = {
+        note_id
+        for (note_id,) in db.query(models.NoteDB.id).filter(models.NoteDB.id.in_(ids))
+    }
+    if found:
+        try:
+            _delete_notes(db, found)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise e
+        cache.invalidate(*found)
+        for note_id in found:
+            events.note_deleted(note_id)
+
+    results = []
+    deleted = set()
+    for i, note_id in enumerate(note_ids):
+        if note_id in found and note_id not in deleted:
+            deleted.add(note_id)
+            results.append(
+                schemas.BulkItemResult(index=i, id=note_id, status="deleted")
+            )
+        else:
+            results.append(
+                schemas.BulkItemResult(
+                    index=i, id=note_id, status="not_found", detail="Note not found"
+                )
+            )
+    return _bulk_result(results)
+
+
+VERSION_COLUMNS = [column for column in models.NoteVersionDB.__table__.c]
 
 
 def get_note_versions(db: Session, note_id: str):
-    return (
+    rows = (
         db.query(models.NoteVersionDB)
+        .with_entities(*VERSION_COLUMNS)
         .filter(models.NoteVersionDB.note_id == note_id)
         .order_by(models.NoteVersionDB.version.desc())
         .all()
     )
+    return schemas.list_adapter(schemas.NoteVersion).validate_python(
+        [
+            {
+                "id": row.id,
+                "note_id": row.note_id,
+                "title": row.title,
+                "content": content,
+                "version": row.version,
+                "created_at": row.created_at,
+            }
+            for row, content in versioning.decode_history(
+                rows, versioning.load_blobs(db, rows)
+            )
+        ]
+    )
 
 
-def restore_note_version(db: Session, note_id: str, version_id: str):
-    note = get_note(db, note_id)
-    if not note:
-        return None, "Note not found"
+def get_note_version_summaries(
+    db: Session, note_id: str, limit: int = None, cursor: str = None
+):
+    """Page through version metadata newest first; bodies are never loaded.
 
-    version_data = (
+    The cursor is the last version number seen; returns (rows, next_cursor).
+    """
+    query = (
         db.query(models.NoteVersionDB)
-        .filter(models.NoteVersionDB.id == version_id)
-        .first()
+        .options(
+            defer(models.NoteVersionDB.content), defer(models.NoteVersionDB.storage)
+        )
+        .filter(models.NoteVersionDB.note_id == note_id)
+        .order_by(models.NoteVersionDB.version.desc())
     )
-    if not version_data:
-        return None, "Version not found"
+    if cursor:
+        try:
+            before = int(cursor)
+        except ValueError as e:
+            raise ValueError("Invalid cursor") from e
+        query = query.filter(models.NoteVersionDB.version < before)
+    if not limit:
+        return query.all(), None
 
-    if version_data.note_id != note_id:
-        return None, "Version does not belong to this note"
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, str(rows[-1].version)
 
-    new_version = note.version + 1
-    now = datetime.now().isoformat()
 
-    # Create version record for the restore action
-    restore_version_id = str(uuid.uuid4())
-    restore_version_db = models.NoteVersionDB(
-        id=restore_version_id,
+def get_version_validator(db: Session, note_id: str):
+    """(version, updated_at, count) for a note's history, or None if no such note."""
+    note = get_note_validator(db, note_id)
+    if note is None:
+        return None
+    count = (
+        db.query(func.count())
+        .select_from(models.NoteVersionDB)
+        .filter(models.NoteVersionDB.note_id == note_id)
+        .scalar()
+    )
+    return note.version, note.updated_at, count
+
+
+def get_note_storage(db: Session, note_id: str):
+    """How much a note and its history take up, and how the history is stored."""
+    note = (
+        db.query(
+            models.NoteDB.version,
+            stored_length(db, models.NoteDB.content),
+            models.NoteDB.content_size,
+            models.NoteDB.content_external,
+        )
+        .filter(models.NoteDB.id == note_id)
+        .first()
+    )
+    if note is None:
+        return None
+    versions = models.NoteVersionDB
+    count, deltas, oldest, oldest_created_at, history_bytes = (
+        db.query(
+            func.count(),
+            func.coalesce(
+                func.sum(
+                    case((versions.storage == versioning.STORAGE_DELTA, 1), else_=0)
+                ),
+                0,
+            ),
+            func.min(versions.version),
+            func.min(versions.created_at),
+            func.coalesce(func.sum(stored_length(db, versions.content)), 0),
+        )
+        .filter(versions.note_id == note_id)
+        .one()
+    )
+    blob_bytes = (
+        db.query(func.coalesce(func.sum(models.BlobDB.size), 0))
+        .filter(
+            models.BlobDB.hash.in_(
+                select(versions.content_hash).where(
+                    versions.note_id == note_id,
+                    versions.storage == versioning.STORAGE_FULL,
+                    versions.content.is_(None),
+                )
+            )
+        )
+        .scalar()
+    )
+    return schemas.NoteStorage(
         note_id=note_id,
-        title=version_data.title,
-        content=version_data.content,
-        version=new_version,
-        created_at=now,
+        version=note[0],
+        versions=count,
+        full_versions=count - deltas,
+        delta_versions=deltas,
+        oldest_version=oldest,
+        oldest_created_at=oldest_created_at,
+        content_bytes=note[1] or 0,
+        content_size=note[2] or 0,
+        content_external=bool(note[3]),
+        history_bytes=history_bytes,
+        blob_bytes=blob_bytes,
+    )
+
+
+def get_note_version_meta(db: Session, note_id: str, version_id: str):
+    """A version row with its content deferred."""
+    return (
+        db.query(models.NoteVersionDB)
+        .options(
+            defer(models.NoteVersionDB.content), defer(models.NoteVersionDB.storage)
+        )
+        .filter(
+            models.NoteVersionDB.id == version_id,
+            models.NoteVersionDB.note_id == note_id,
+        )
+        .first()
     )
 
-    # Update the note with restored content
-    note.title = version_data.title
-    note.content = version_data.content
-    note.updated_at = now
-    note.version = new_version
 
+def get_note_version(db: Session, note_id: str, version_id: str):
+    row = (
+        db.query(models.NoteVersionDB)
+        .filter(
+            models.NoteVersionDB.id == version_id,
+            models.NoteVersionDB.note_id == note_id,
+        )
+        .first()
+    )
+    if not row:
+        return None
+    return schemas.NoteVersion(
+        id=row.id,
+        note_id=row.note_id,
+        title=row.title,
+        content=versioning.load_content(db, row),
+        version=row.version,
+        created_at=row.created_at,
+    )
+
+
+def restore_note_version(db: Session, note_id: str, version_id: str):
+    version_data = (
+        db.query(models.NoteVersionDB)
+        .filter(models.NoteVersionDB.id == version_id)
+        .first()
+    )
+    if not version_data or version_data.note_id != note_id:
+        # Only failures look the note up, so a missing note is reported first
+        if not db.query(models.NoteDB.id).filter(models.NoteDB.id == note_id).first():
+            return None, "Note not found"
+        if not version_data:
+            return None, "Version not found"
+        return None, "Version does not belong to this note"
+
+    content = versioning.load_content(db, version_data)
     try:
-        db.add(restore_version_db)
-        db.commit()
-        db.refresh(note)
-        return note, None
+        row, error = _write_note(
+            db, note_id, {"title": version_data.title, "content": content}
+        )
+        if error == UNCHANGED:
+            db.rollback()
+            return _note_model(db, row, content), None
+        if error:
+            db.rollback()
+            return None, error
+        return _commit_write(db, row, events.RESTORED, content), None
     except Exception as e:
         db.rollback()
         raise e
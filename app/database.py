@@ -1,32 +1,271 @@
-from sqlalchemy import create_engine
+import math
+import time
+from typing import Union
+
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.concurrency import run_in_threadpool
+
+from .config import (
+    DATABASE_READ_URL,
+    DATABASE_URL,
+    DB_EXECUTION_MODE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE_SECONDS,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT_SECONDS,
+    READ_YOUR_WRITES_SECONDS,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_CACHE_SIZE,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_PROFILE,
+    SQLITE_READ_POOL_SIZE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_WRITE_TIMEOUT_SECONDS,
+)
+from .monitoring import instrument_engine
+from .profiling import in_request_thread
+
+
+def normalize_url(url: str) -> str:
+    # Fix for Heroku/Azure postgres URL starting with postgres:// instead of postgresql://
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
 
-from .config import DATABASE_URL
 
 # Use SQLite for local development, or DATABASE_URL if provided (e.g., by Azure)
-SQLALCHEMY_DATABASE_URL = DATABASE_URL
+SQLALCHEMY_DATABASE_URL = normalize_url(DATABASE_URL)
+SQLALCHEMY_READ_URL = normalize_url(DATABASE_READ_URL) if DATABASE_READ_URL else None
+
+SQLITE_PRAGMAS = {
+    "journal_mode": SQLITE_JOURNAL_MODE,
+    "synchronous": SQLITE_SYNCHRONOUS,
+    "mmap_size": SQLITE_MMAP_SIZE,
+    "cache_size": SQLITE_CACHE_SIZE,
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+}
+
 
-# Fix for Heroku/Azure postgres URL starting with postgres:// instead of postgresql://
-if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
-    SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace(
-        "postgres://", "postgresql://", 1
+def is_sqlite_file(url: Union[str, URL]) -> bool:
+    """Whether `url` is a SQLite database on disk (not in memory)."""
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
     )
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args=(
-        {"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-    ),
+
+def sqlite_pragmas(engine, read_only: bool = False, immediate: bool = False):
+    """Apply SQLITE_PRAGMAS to every new connection of `engine`.
+
+    `read_only` connections refuse writes (PRAGMA query_only). `immediate`
+    makes transactions take the write lock at BEGIN, so a writer in another
+    process waits out busy_timeout instead of failing when it upgrades a
+    read transaction.
+    """
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+        if immediate:
+            # Let SQLAlchemy issue BEGIN instead of pysqlite's implicit one
+            dbapi_connection.isolation_level = None
+
+    if immediate:
+
+        @event.listens_for(engine, "begin")
+        def _begin(connection):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def pool_args(url: str) -> dict:
+    """create_engine pool settings from DB_POOL_*; SQLite pools keep their own."""
+    if url.startswith("sqlite"):
+        # One connection for every thread, or each would see its own empty
+        # in-memory database
+        return {} if is_sqlite_file(url) else {"poolclass": StaticPool}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+    }
+
+
+connect_args = (
+    {"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
 )
+TUNED_SQLITE = SQLITE_PROFILE == "tuned" and is_sqlite_file(SQLALCHEMY_DATABASE_URL)
+
+if TUNED_SQLITE:
+    # SQLite allows one writer at a time: give writes a single connection, so
+    # they queue on its pool checkout instead of failing with "database is
+    # locked", and serve reads from their own pool, which WAL never blocks
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args=connect_args,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=SQLITE_WRITE_TIMEOUT_SECONDS,
+    )
+    sqlite_pragmas(engine, immediate=True)
+    read_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args=connect_args,
+        pool_size=SQLITE_READ_POOL_SIZE,
+    )
+    sqlite_pragmas(read_engine, read_only=True)
+    instrument_engine(read_engine, "read")
+else:
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args=connect_args,
+        **pool_args(SQLALCHEMY_DATABASE_URL),
+    )
+    read_engine = engine
+if SQLALCHEMY_READ_URL:
+    read_engine = create_engine(SQLALCHEMY_READ_URL, **pool_args(SQLALCHEMY_READ_URL))
+    instrument_engine(read_engine, "replica")
+instrument_engine(engine, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Sessions on a replica are marked, so crud does not cache what may be stale
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=read_engine,
+    info={"replica": bool(SQLALCHEMY_READ_URL)},
+)
 
 Base = declarative_base()
 
 
-def get_db():
+def async_database_url(url: str) -> str:
+    """Map a sync database URL onto its asyncio driver."""
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+
+if DB_EXECUTION_MODE == "async":
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        async_database_url(SQLALCHEMY_DATABASE_URL),
+        **pool_args(SQLALCHEMY_DATABASE_URL),
+    )
+    if TUNED_SQLITE:
+        sqlite_pragmas(async_engine.sync_engine)
+    instrument_engine(async_engine.sync_engine, "async")
+    # Objects are serialized after the session closes, so keep them loaded
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+    AsyncReadSessionLocal = AsyncSessionLocal
+    if SQLALCHEMY_READ_URL:
+        async_read_engine = create_async_engine(
+            async_database_url(SQLALCHEMY_READ_URL), **pool_args(SQLALCHEMY_READ_URL)
+        )
+        instrument_engine(async_read_engine.sync_engine, "async-replica")
+        AsyncReadSessionLocal = async_sessionmaker(
+            async_read_engine,
+            autoflush=False,
+            expire_on_commit=False,
+            info={"replica": True},
+        )
+
+# Read-your-writes: write sessions stamp the client with this cookie, and its
+# reads go to the primary until READ_YOUR_WRITES_SECONDS have passed
+LAST_WRITE_COOKIE = "notes_last_write"
+
+
+def mark_write(response: Response):
+    if SQLALCHEMY_READ_URL:
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            f"{time.time():.3f}",
+            max_age=math.ceil(READ_YOUR_WRITES_SECONDS),
+            httponly=True,
+            samesite="lax",
+        )
+
+
+def reads_from_primary(request: Request) -> bool:
+    if not SQLALCHEMY_READ_URL:
+        return False
+    try:
+        written_at = float(request.cookies[LAST_WRITE_COOKIE])
+    except (KeyError, ValueError):
+        return False
+    return time.time() - written_at < READ_YOUR_WRITES_SECONDS
+
+
+def get_sync_db(response: Response):
+    mark_write(response)
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_sync_read_db(request: Request):
+    db = SessionLocal() if reads_from_primary(request) else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db(response: Response):
+    mark_write(response)
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db(request: Request):
+    factory = (
+        AsyncSessionLocal if reads_from_primary(request) else AsyncReadSessionLocal
+    )
+    async with factory() as db:
+        yield db
+
+
+# Routes depend on get_db, or get_read_db when they only read; in async mode
+# both yield an AsyncSession instead
+get_db = get_async_db if DB_EXECUTION_MODE == "async" else get_sync_db
+get_read_db = get_async_read_db if DB_EXECUTION_MODE == "async" else get_sync_read_db
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """Run a sync crud function against `db` without blocking the event loop.
+
+    AsyncSessions run it through run_sync on the async driver; sync sessions
+    are handed to the threadpool unless DB_EXECUTION_MODE is "inline".
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    if DB_EXECUTION_MODE == "inline":
+        return fn(db, *args, **kwargs)
+    return await run_in_threadpool(in_request_thread(fn), db, *args, **kwargs)
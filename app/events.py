@@ -0,0 +1,267 @@
+"""
+In-process change feed behind GET /api/notes/stream.
+
+The crud write functions publish a compact event after they commit: the
+kind of change, the note id and, except for deletes, the new version,
+title, updated_at and a short preview, which is everything a client needs
+to patch its note list without refetching it.
+
+Each event is encoded once, as a ready-to-send Server-Sent Events frame,
+and handed to every subscriber's bounded queue with a single callback per
+event loop, so writers (which run in the threadpool) never touch a queue
+and publishing stays cheap with thousands of subscribers. A subscriber that
+falls EVENT_QUEUE_SIZE events behind has its backlog dropped and gets a
+"resync" event, telling it to reload rather than catch up one by one. The
+last EVENT_HISTORY events are kept so a reconnecting EventSource can resume
+from its Last-Event-ID.
+
+Each worker process has its own broker. When REDIS_URL is set, events are
+relayed through a Redis channel so subscribers see writes from every
+worker; otherwise they only see writes handled by their own process.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from .config import (
+    EVENT_HEARTBEAT_SECONDS,
+    EVENT_HISTORY,
+    EVENT_PREVIEW_LENGTH,
+    EVENT_QUEUE_SIZE,
+    REDIS_URL,
+)
+from .monitoring import EVENT_OVERFLOWS, EVENT_SUBSCRIBERS, EVENTS_PUBLISHED
+
+logger = logging.getLogger(__name__)
+
+CREATED = "create"
+UPDATED = "update"
+RESTORED = "restore"
+DELETED = "delete"
+RESYNC = "resync"
+
+CHANNEL = "notes-app:events"
+RETRY_MILLISECONDS = 3000
+# Sent to a subscriber whose queue overflowed; carries no id, so a
+# reconnect still resumes from the last event it actually received
+OVERFLOW_FRAME = (0, b'data: {"type":"resync"}\n\n')
+KEEPALIVE_FRAME = (0, b": keepalive\n\n")
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class Subscriber:
+    __slots__ = ("loop", "queue")
+
+    def __init__(self, loop, size: int):
+        self.loop = loop
+        self.queue = asyncio.Queue(size)
+
+
+class Broker:
+    """Fan-out of change events to the subscribers of this process."""
+
+    def __init__(
+        self,
+        queue_size: int,
+        history: int,
+        relay_url: str = None,
+        heartbeat: float = EVENT_HEARTBEAT_SECONDS,
+    ):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        # Event ids are "<epoch>-<sequence>"; the epoch tells a client that
+        # reconnected to another worker, or after a restart, to resync
+        self.epoch = format(time.time_ns() // 1000, "x")
+        self.relay_url = relay_url
+        self._relay = None
+        self._sequence = itertools.count(1)
+        self._history = deque(maxlen=history)
+        self._loops = {}
+        # One keepalive timer per loop with subscribers
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> Subscriber:
+        """Register a subscriber on the running event loop."""
+        self._start_relay()
+        loop = asyncio.get_running_loop()
+        subscriber = Subscriber(loop, self.queue_size)
+        with self._lock:
+            self._loops.setdefault(loop, set()).add(subscriber)
+            if loop not in self._timers:
+                self._timers[loop] = loop.call_later(
+                    self.heartbeat, self._keepalive, loop
+                )
+        EVENT_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._loops.get(subscriber.loop)
+            if not subscribers or subscriber not in subscribers:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._loops[subscriber.loop]
+                timer = self._timers.pop(subscriber.loop, None)
+                if timer is not None:
+                    timer.cancel()
+        EVENT_SUBSCRIBERS.dec()
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._loops.values())
+
+    def publish(self, event: dict):
+        """Send `event` to every subscriber; safe to call from any thread."""
+        self._start_relay()
+        if self._relay is not None:
+            try:
+                self._relay.publish(CHANNEL, json.dumps(event, default=_encode))
+                return
+            except Exception:
+                logger.warning("Event relay failed; delivering locally", exc_info=True)
+        self.dispatch(event)
+
+    def dispatch(self, event: dict):
+        """Deliver `event` to this process's subscribers."""
+        with self._lock:
+            sequence = next(self._sequence)
+            data = json.dumps(event, default=_encode, separators=(",", ":"))
+            frame = (
+                sequence,
+                f"id: {self.epoch}-{sequence}\ndata: {data}\n\n".encode(),
+            )
+            self._history.append(frame)
+            loops = list(self._loops.items())
+        for loop, subscribers in loops:
+            try:
+                loop.call_soon_threadsafe(self._fan_out, subscribers, frame)
+            except RuntimeError:  # the loop has been closed
+                pass
+        EVENTS_PUBLISHED.labels(type=event["type"]).inc()
+
+    @staticmethod
+    def _fan_out(subscribers, frame):
+        # Runs on the subscribers' own loop, the only place their set and
+        # queues are changed, so neither needs a lock here
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(OVERFLOW_FRAME)
+                EVENT_OVERFLOWS.inc()
+
+    def _keepalive(self, loop):
+        # One timer per loop keeps idle connections open through proxies, so
+        # subscribers can block on their queue without a timeout of their own
+        with self._lock:
+            subscribers = self._loops.get(loop)
+            if not subscribers:
+                self._timers.pop(loop, None)
+                return
+            self._timers[loop] = loop.call_later(self.heartbeat, self._keepalive, loop)
+            subscribers = list(subscribers)
+        for subscriber in subscribers:
+            if subscriber.queue.empty():
+                subscriber.queue.put_nowait(KEEPALIVE_FRAME)
+
+    def since(self, last_event_id: str):
+        """Frames after `last_event_id`, or None if they cannot all be replayed."""
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        with self._lock:
+            history = list(self._history)
+        if history and history[0][0] > sequence + 1:
+            return None
+        return [frame for frame in history if frame[0] > sequence]
+
+    def _start_relay(self):
+        if not self.relay_url or self._relay is not None:
+            return
+        with self._lock:
+            if self._relay is not None:
+                return
+            import redis
+
+            self._relay = redis.Redis.from_url(self.relay_url)
+            pubsub = self._relay.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+        threading.Thread(
+            target=self._listen, args=(pubsub,), name="event-relay", daemon=True
+        ).start()
+
+    def _listen(self, pubsub):
+        for message in pubsub.listen():
+            try:
+                self.dispatch(json.loads(message["data"]))
+            except Exception:
+                logger.warning("Dropped a malformed relayed event", exc_info=True)
+
+
+broker = Broker(EVENT_QUEUE_SIZE, EVENT_HISTORY, REDIS_URL)
+
+
+def note_changed(kind: str, note: dict):
+    """Publish a create/update/restore of `note` (a mapping of its columns)."""
+    broker.publish(
+        {
+            "type": kind,
+            "id": note["id"],
+            "version": note["version"],
+            "title": note["title"],
+            "updated_at": note["updated_at"],
+            "preview": note["content"][:EVENT_PREVIEW_LENGTH],
+        }
+    )
+
+
+def note_deleted(note_id: str):
+    broker.publish({"type": DELETED, "id": note_id})
+
+
+def resync():
+    """Tell every subscriber to reload, after changes too large to describe."""
+    broker.publish({"type": RESYNC})
+
+
+async def stream(last_event_id: str = None, source: Broker = None):
+    """SSE body: replay since `last_event_id`, then live events and keepalives."""
+    source = source or broker
+    subscriber = source.subscribe()
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n".encode()
+        sent = 0
+        if last_event_id:
+            # Subscribed first, so nothing is missed between replay and live
+            # events; anything in both is skipped by sequence number below
+            replay = source.since(last_event_id)
+            if replay is None:
+                yield OVERFLOW_FRAME[1]
+            else:
+                for sequence, frame in replay:
+                    sent = sequence
+                    yield frame
+        while True:
+            sequence, frame = await subscriber.queue.get()
+            if sequence and sequence <= sent:
+                continue
+            sent = max(sent, sequence)
+            yield frame
+    finally:
+        source.unsubscribe(subscriber)
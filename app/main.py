@@ -1,25 +1,52 @@
+import asyncio
 import time
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 from fastapi.responses import Response
-from fastapi.staticfiles import StaticFiles
 from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-from .config import API_VERSION, APP_TITLE, STATIC_DIR
-from .database import Base, engine
+from . import retention
+from .compression import CompressionMiddleware
+from .config import API_VERSION, APP_TITLE, RETENTION_ENABLED
+from .database import async_engine, async_read_engine, engine, read_engine
+from .migrations import init_db
 from .monitoring import MonitoringMiddleware
-from .routes import router
+from .profiling import ProfilingMiddleware
+from .routes import router, static_assets
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title=APP_TITLE, version=API_VERSION)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once per worker process, after it starts rather than at import, so
+    # workers never race on table creation (init_db takes a lock)
+    init_db(engine)
+    compaction = (
+        asyncio.create_task(retention.run_forever()) if RETENTION_ENABLED else None
+    )
+    yield
+    if compaction is not None:
+        compaction.cancel()
+        with suppress(asyncio.CancelledError):
+            await compaction
+    engine.dispose()
+    read_engine.dispose()
+    for async_bind in (async_engine, async_read_engine):
+        if async_bind is not None:
+            await async_bind.dispose()
 
-# Add monitoring middleware
+
+app = FastAPI(title=APP_TITLE, version=API_VERSION, lifespan=lifespan)
+
+# Add monitoring middleware; the last one added runs outermost, and
+# profiling reads the request stats that monitoring sets up. Compression
+# runs innermost, so latency metrics include it
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ProfilingMiddleware)
 app.add_middleware(MonitoringMiddleware)
 
-# Mount static files
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+# Mount static files, served from memory with fingerprinted URLs
+app.mount("/static", static_assets, name="static")
 
 # Include API routes
 app.include_router(router)
@@ -0,0 +1,269 @@
+"""
+Schema migrations for databases created by older releases.
+`Base.metadata.create_all` only creates missing tables, so column and data
+changes to existing tables are applied here, in order, exactly once.
+Applied revisions are recorded in the `schema_migrations` table.
+"""
+
+import argparse
+import logging
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import func, inspect, text
+from sqlalchemy.orm import Session
+
+from . import bodies, models, versioning
+from .database import Base, is_sqlite_file
+from .search import ensure_search_index
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(revision: str):
+    def register(fn):
+        MIGRATIONS.append((revision, fn))
+        return fn
+
+    return register
+
+
+def _columns(connection, table: str):
+    return {column["name"] for column in inspect(connection).get_columns(table)}
+
+
+@migration("0001_version_storage")
+def _version_storage(bind):
+    """Add the storage column and delta-compress existing version history."""
+    with bind.begin() as connection:
+        if "storage" not in _columns(connection, "note_versions"):
+            connection.execute(
+                text(
+                    "ALTER TABLE note_versions "
+                    "ADD COLUMN storage VARCHAR DEFAULT 'full'"
+                )
+            )
+    with Session(bind=bind) as db:
+        rewritten = versioning.compact_all(db)
+    logger.info(f"Compacted {rewritten} version rows")
+
+
+TIMESTAMP_COLUMNS = [
+    ("notes", "created_at"),
+    ("notes", "updated_at"),
+    ("note_versions", "created_at"),
+]
+
+
+def _renumber_duplicate_versions(db: Session):
+    """Give notes that raced into duplicate version numbers a clean 1..n history.
+
+    History is decoded in the same order compaction encoded it, rewritten in
+    full under the new numbers, then compacted again.
+    """
+    note_ids = [
+        note_id
+        for (note_id,) in db.query(models.NoteVersionDB.note_id)
+        .group_by(models.NoteVersionDB.note_id, models.NoteVersionDB.version)
+        .having(func.count() > 1)
+        .distinct()
+    ]
+    for note_id in note_ids:
+        rows = (
+            db.query(models.NoteVersionDB)
+            .filter(models.NoteVersionDB.note_id == note_id)
+            .order_by(models.NoteVersionDB.version.desc())
+            .all()
+        )
+        history = list(versioning.decode_history(rows, versioning.load_blobs(db, rows)))
+        for position, (row, content) in enumerate(history):
+            row.version = len(history) - position
+            row.content = content
+            row.storage = versioning.STORAGE_FULL
+        db.query(models.NoteDB).filter(models.NoteDB.id == note_id).update(
+            {"version": len(history)}, synchronize_session=False
+        )
+        db.flush()
+        versioning.compact_note(db, note_id)
+        logger.warning(f"Renumbered {len(history)} duplicate versions of {note_id}")
+    db.commit()
+
+
+@migration("0002_timestamps_and_version_index")
+def _timestamps_and_version_index(bind):
+    """Convert ISO string timestamps to DateTime and add the history indexes."""
+    with bind.begin() as connection:
+        for table, column in TIMESTAMP_COLUMNS:
+            if connection.dialect.name == "postgresql":
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table} ALTER COLUMN {column} "
+                        f"TYPE TIMESTAMP USING {column}::timestamp"
+                    )
+                )
+            else:
+                # SQLite keeps DateTime as text; rewrite isoformat() values into
+                # SQLAlchemy's storage format so they compare and sort correctly
+                connection.execute(
+                    text(
+                        f"UPDATE {table} SET {column} = replace({column}, 'T', ' ') || "
+                        f"CASE WHEN length({column}) = 19 THEN '.000000' ELSE '' END "
+                        f"WHERE {column} LIKE '____-__-__T%'"
+                    )
+                )
+    with Session(bind=bind) as db:
+        _renumber_duplicate_versions(db)
+    for table in (models.NoteDB.__table__, models.NoteVersionDB.__table__):
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
+
+@migration("0003_content_blobs")
+def _content_blobs(bind):
+    """Hash note bodies and move full version bodies into content_blobs."""
+    with Session(bind=bind) as db:
+        rewritten = versioning.dedup_all(db)
+        blobs, size = db.query(
+            func.count(models.BlobDB.hash),
+            func.coalesce(func.sum(models.BlobDB.size), 0),
+        ).one()
+    for index in models.NoteVersionDB.__table__.indexes:
+        index.create(bind, checkfirst=True)
+    logger.info(f"Moved {rewritten} version bodies into {blobs} blobs ({size} bytes)")
+
+
+@migration("0004_large_bodies")
+def _large_bodies(bind):
+    """Record note sizes and move bodies over LARGE_CONTENT_BYTES out of row."""
+    with Session(bind=bind) as db:
+        moved = bodies.move_all(db)
+    for index in models.NoteDB.__table__.indexes:
+        index.create(bind, checkfirst=True)
+    logger.info(f"Moved {moved} large note bodies out of row")
+
+
+# Columns added to existing tables after they first shipped. They are added
+# before any migration runs, since migrations use the models.
+ADDED_COLUMNS = [
+    ("notes", "content_hash", "VARCHAR"),
+    ("note_versions", "content_hash", "VARCHAR"),
+    ("notes", "content_size", "INTEGER"),
+    ("notes", "content_external", "BOOLEAN DEFAULT FALSE"),
+]
+
+
+def _add_columns(bind):
+    with bind.begin() as connection:
+        for table, column, column_type in ADDED_COLUMNS:
+            if column not in _columns(connection, table):
+                connection.execute(
+                    text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                )
+
+
+def _ensure_table(bind):
+    with bind.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations "
+                "(revision VARCHAR PRIMARY KEY)"
+            )
+        )
+        return {
+            revision
+            for (revision,) in connection.execute(
+                text("SELECT revision FROM schema_migrations")
+            )
+        }
+
+
+def pending(bind):
+    applied = _ensure_table(bind)
+    return [revision for revision, _ in MIGRATIONS if revision not in applied]
+
+
+def upgrade(bind):
+    """Apply every pending migration in order."""
+    applied = _ensure_table(bind)
+    if any(revision not in applied for revision, _ in MIGRATIONS):
+        _add_columns(bind)
+    for revision, fn in MIGRATIONS:
+        if revision in applied:
+            continue
+        logger.info(f"Applying migration {revision}")
+        fn(bind)
+        with bind.begin() as connection:
+            connection.execute(
+                text("INSERT INTO schema_migrations (revision) VALUES (:revision)"),
+                {"revision": revision},
+            )
+
+
+@contextmanager
+def _init_lock(bind):
+    """Serialize init_db across processes sharing one database."""
+    url = bind.url
+    if is_sqlite_file(url):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.abspath(url.database) + ".init-lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    elif url.get_backend_name() == "postgresql":
+        with bind.connect() as connection:
+            connection.execute(
+                text("SELECT pg_advisory_lock(hashtext('notes_init_db'))")
+            )
+            try:
+                yield
+            finally:
+                connection.execute(
+                    text("SELECT pg_advisory_unlock(hashtext('notes_init_db'))")
+                )
+                connection.commit()
+    else:
+        yield
+
+
+def init_db(bind):
+    """Create tables, apply migrations and build the search index.
+
+    Every worker calls this at startup; a file lock (SQLite) or advisory lock
+    (PostgreSQL) makes them take turns, and all but the first find nothing
+    left to do.
+    """
+    with _init_lock(bind):
+        Base.metadata.create_all(bind=bind)
+        upgrade(bind)
+        ensure_search_index(bind)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage database migrations")
+    parser.add_argument("command", choices=["upgrade", "status"])
+    args = parser.parse_args()
+
+    from .database import engine
+
+    if args.command == "upgrade":
+        init_db(engine)
+    else:
+        Base.metadata.create_all(bind=engine)
+    for revision in pending(engine):
+        print(f"pending: {revision}")
+    print(f"{len(MIGRATIONS)} migrations known")
+
+
+if __name__ == "__main__":
+    main()
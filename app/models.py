@@ -1,4 +1,13 @@
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    false,
+)
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -10,15 +19,24 @@ class NoteDB(Base):
 
     id = Column(String, primary_key=True, index=True)
     title = Column(String, index=True)
+    # The full text, or only its start when content_external is set and the
+    # body is the blob keyed by content_hash (see bodies.py)
     content = Column(String)
-    created_at = Column(String)
-    updated_at = Column(String)
+    # sha256 of content, so unchanged writes are spotted without reading it
+    content_hash = Column(String, index=True)
+    content_size = Column(Integer)
+    content_external = Column(Boolean, default=False, server_default=false())
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
     version = Column(Integer)
 
     versions = relationship(
         "NoteVersionDB", back_populates="note", cascade="all, delete-orphan"
     )
 
+    # Keyset pagination walks notes newest first on (updated_at, id)
+    __table_args__ = (Index("ix_notes_updated_at_id", "updated_at", "id"),)
+
 
 class NoteVersionDB(Base):
     __tablename__ = "note_versions"
@@ -26,11 +44,34 @@ class NoteVersionDB(Base):
     id = Column(String, primary_key=True, index=True)
     note_id = Column(String, ForeignKey("notes.id"))
     title = Column(String)
+    # A reverse delta against the next version, or NULL for full versions,
+    # whose body is the blob keyed by content_hash (see versioning.py)
     content = Column(String)
+    storage = Column(String, default="full", server_default="full")
+    # sha256 of the full content this version decodes to
+    content_hash = Column(String)
     version = Column(Integer)
-    created_at = Column(String)
+    created_at = Column(DateTime)
 
     note = relationship("NoteDB", back_populates="versions")
 
+    # Serves history lookups by note ordered by version, and rejects two
+    # concurrent writers claiming the same version number
+    __table_args__ = (
+        Index("ix_note_versions_note_id_version", "note_id", "version", unique=True),
+        # Finds the versions still referencing a blob before it is dropped
+        Index("ix_note_versions_content_hash", "content_hash"),
+    )
+
+
+class BlobDB(Base):
+    """A version or large note body, stored once however many rows share it."""
+
+    __tablename__ = "content_blobs"
+
+    hash = Column(String, primary_key=True)
+    content = Column(String)
+    size = Column(Integer)
+
 
 # Pydantic models moved to schemas.py
@@ -1,13 +1,30 @@
 """
 Enhanced monitoring middleware for the Notes App.
-Provides metrics for request count, latency, and errors.
+Provides metrics for request count, latency, and errors, plus SQL statement
+latency, queries per request and connection pool usage.
 """
 
+import asyncio
+import contextvars
+import functools
+import logging
 import time
+from contextlib import contextmanager
 
+from fastapi.routing import APIRoute
 from prometheus_client import Counter, Gauge, Histogram
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from sqlalchemy import event
+
+from .config import METRICS_LATENCY_BUCKETS, SLOW_QUERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def _buckets(spec):
+    if not spec:
+        return Histogram.DEFAULT_BUCKETS
+    return tuple(float(bucket) for bucket in spec.split(","))
+
 
 # Metrics
 REQUEST_COUNT = Counter(
@@ -18,6 +35,7 @@ REQUEST_LATENCY = Histogram(
     "http_request_duration_seconds",
     "HTTP request latency in seconds",
     ["method", "endpoint"],
+    buckets=_buckets(METRICS_LATENCY_BUCKETS),
 )
 
 REQUEST_IN_PROGRESS = Gauge(
@@ -28,39 +46,321 @@ ERROR_COUNT = Counter(
     "http_errors_total", "Total HTTP errors", ["method", "endpoint", "status"]
 )
 
+# Read cache, labelled by what was looked up ("note", "notes", "summaries")
+CACHE_HITS = Counter("cache_hits_total", "Read cache hits", ["cache"])
+CACHE_MISSES = Counter("cache_misses_total", "Read cache misses", ["cache"])
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total", "Entries evicted from a full LRU cache", ["backend"]
+)
 
-class MonitoringMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        REQUEST_IN_PROGRESS.inc()
+# Database, labelled by statement type and by pool ("primary", "async", ...)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time in seconds",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "SQL statements executed per HTTP request",
+    ["method", "endpoint"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_SLOW_QUERIES = Counter(
+    "db_slow_queries_total", "Statements slower than SLOW_QUERY_SECONDS", ["operation"]
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    ["pool"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_IN_USE = Gauge("db_pool_in_use", "Connections checked out", ["pool"])
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections open beyond pool_size", ["pool"]
+)
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured pool size", ["pool"])
+
+# Version retention / background compaction
+COMPACTION_RUNS = Counter(
+    "version_compaction_runs_total", "Compaction passes", ["result"]
+)
+COMPACTION_PRUNED = Counter(
+    "version_compaction_pruned_total", "Versions deleted by retention"
+)
+COMPACTION_REWRITTEN = Counter(
+    "version_compaction_rewritten_total", "Surviving versions re-encoded"
+)
+COMPACTION_BATCH_SECONDS = Histogram(
+    "version_compaction_batch_seconds",
+    "Duration of one compaction transaction",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+COMPACTION_LAST_SUCCESS = Gauge(
+    "version_compaction_last_success_timestamp_seconds",
+    "When the last compaction pass finished",
+)
+
+# Group commit of note updates
+GROUP_COMMIT_WRITES = Counter(
+    "group_commit_writes_total", "Note updates queued for group commit"
+)
+GROUP_COMMIT_COALESCED = Counter(
+    "group_commit_coalesced_total",
+    "Queued updates replaced by a later update to the same note",
+)
+GROUP_COMMIT_BATCHES = Counter(
+    "group_commit_batches_total", "Group commit transactions", ["result"]
+)
+GROUP_COMMIT_BATCH_WRITES = Histogram(
+    "group_commit_batch_writes",
+    "Updates answered by one group commit",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+GROUP_COMMIT_SECONDS = Histogram(
+    "group_commit_seconds",
+    "Duration of one group commit transaction",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+GROUP_COMMIT_LATENCY_SECONDS = Histogram(
+    "group_commit_latency_seconds",
+    "From queueing an update until it is committed",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+# Change feed
+EVENT_SUBSCRIBERS = Gauge("event_subscribers", "Open /api/notes/stream connections")
+EVENTS_PUBLISHED = Counter(
+    "events_published_total", "Change events published", ["type"]
+)
+EVENT_OVERFLOWS = Counter(
+    "event_overflows_total", "Subscribers that fell behind and were told to resync"
+)
+
+OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+class RequestStats:
+    """Database work and named phase timings for one request."""
+
+    __slots__ = ("queries", "db_seconds", "timings")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.timings = {}
+
+    def add_timing(self, name: str, seconds: float):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+# Threadpool and run_sync calls inherit the request's context, so statements
+# executed there are counted against the request that issued them
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def request_stats():
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+def current_stats():
+    return _request_stats.get()
+
+
+@contextmanager
+def timed(name: str):
+    """Add the duration of the block to the current request's `name` timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.add_timing(name, time.perf_counter() - start)
+
+
+def _operation(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+    return keyword if keyword in OPERATIONS else "OTHER"
 
-        method = request.method
-        endpoint = request.url.path
 
-        start_time = time.time()
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
 
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start"].pop()
+    operation = _operation(statement)
+    DB_QUERY_LATENCY.labels(operation=operation).observe(duration)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += duration
+    if duration >= SLOW_QUERY_SECONDS:
+        DB_SLOW_QUERIES.labels(operation=operation).inc()
+        # Parameters are left out: they carry note content
+        logger.warning(
+            f"Slow query ({duration:.3f}s): {' '.join(statement.split())[:500]}"
+        )
+
+
+def _handle_error(context):
+    starts = context.connection.info.get("query_start") if context.connection else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(engine, name: str):
+    """Export statement latency, per-request query counts and pool usage for `engine`.
+
+    Pool gauges are read at scrape time. Checkout wait is timed around the
+    pool's internal get, so it only exists for pools that can block
+    (QueuePool); the pool that replaces it when the engine is disposed is
+    timed as well.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    event.listen(
+        engine, "engine_disposed", lambda engine: _time_checkouts(engine, name)
+    )
+
+    pool = engine.pool
+    if hasattr(pool, "checkedout"):
+        DB_POOL_IN_USE.labels(pool=name).set_function(lambda: engine.pool.checkedout())
+    if hasattr(pool, "overflow"):
+        DB_POOL_OVERFLOW.labels(pool=name).set_function(
+            lambda: max(engine.pool.overflow(), 0)
+        )
+    # SingletonThreadPool (in-memory SQLite) has a plain `size` attribute
+    if callable(getattr(pool, "size", None)):
+        DB_POOL_SIZE.labels(pool=name).set(pool.size())
+    _time_checkouts(engine, name)
+
+
+def _time_checkouts(engine, name: str):
+    pool = engine.pool
+    if not hasattr(pool, "_do_get"):
+        return
+    do_get = pool._do_get
+    wait = DB_POOL_CHECKOUT_WAIT.labels(pool=name)
+
+    def timed_do_get():
+        start = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            wait.observe(time.perf_counter() - start)
+
+    pool._do_get = timed_do_get
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that records endpoint and whole-handler time per request.
+
+    The handler covers parameter parsing, the endpoint and response
+    serialization, so their difference approximates serialization time.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+
+            @functools.wraps(endpoint)
+            async def timed_endpoint(*args, **kw):
+                with timed("endpoint"):
+                    return await endpoint(*args, **kw)
+
+        else:
+
+            @functools.wraps(endpoint)
+            def timed_endpoint(*args, **kw):
+                with timed("endpoint"):
+                    return endpoint(*args, **kw)
+
+        super().__init__(path, timed_endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            with timed("handler"):
+                return await handler(request)
+
+        return timed_handler
+
+
+# Label for requests that matched no route, so stray paths add no new series
+UNMATCHED = "unmatched"
+
+
+def route_label(scope, root_path: str = "") -> str:
+    """The route template a request was routed to, e.g. /api/notes/{note_id}.
+
+    Read from the scope after the router has handled the request: FastAPI
+    stores the matched route there, and mounts rewrite `root_path`.
+    """
+    route = scope.get("route")
+    if route is not None:
+        return route.path_format
+    mount_path = scope.get("root_path", "")[len(root_path) :]
+    if mount_path and "endpoint" in scope:
+        return mount_path + "/{path}"
+    return UNMATCHED
+
+
+class MonitoringMiddleware:
+    """Pure ASGI middleware: records metrics without wrapping the response.
+
+    Unlike BaseHTTPMiddleware it adds no extra task or body buffering, so
+    streaming responses pass straight through, and latency covers the whole
+    response including its body.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        root_path = scope.get("root_path", "")
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUEST_IN_PROGRESS.inc()
+        start_time = time.perf_counter()
+        stats = RequestStats()
+        token = _request_stats.set(stats)
         try:
-            response = await call_next(request)
-            status_code = response.status_code
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            duration = time.perf_counter() - start_time
+            endpoint = route_label(scope, root_path)
 
             # Record metrics
             REQUEST_COUNT.labels(
                 method=method, endpoint=endpoint, status=status_code
             ).inc()
-
             if status_code >= 400:
                 ERROR_COUNT.labels(
                     method=method, endpoint=endpoint, status=status_code
                 ).inc()
-
-            return response
-
-        except Exception:
-            # Record error
-            ERROR_COUNT.labels(method=method, endpoint=endpoint, status=500).inc()
-            raise
-
-        finally:
-            # Record latency
-            duration = time.time() - start_time
             REQUEST_LATENCY.labels(method=method, endpoint=endpoint).observe(duration)
+            DB_QUERIES_PER_REQUEST.labels(method=method, endpoint=endpoint).observe(
+                stats.queries
+            )
             REQUEST_IN_PROGRESS.dec()
@@ -0,0 +1,259 @@
+"""
+Opt-in sampling profiler for individual requests.
+
+A profiled request gets a background thread that samples the stacks of the
+event loop thread and of any threadpool worker currently running a crud
+call for it, every PROFILE_INTERVAL_SECONDS. Samples taken on the event loop
+also include other requests' async work, so profiles are most precise with
+low concurrency. Sampling stops after PROFILE_MAX_SECONDS, and event
+streams, which stay open for as long as the client is connected, are not
+profiled at all. Profiled responses carry a Server-Timing header, and the
+finished profile is kept in memory for download as collapsed stacks
+(flamegraph.pl, speedscope) or speedscope JSON.
+"""
+
+import contextvars
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+
+from .config import (
+    ADMIN_TOKEN,
+    PROFILE_INTERVAL_SECONDS,
+    PROFILE_MAX_SECONDS,
+    PROFILE_MAX_STORED,
+    PROFILE_SAMPLE_RATE,
+)
+from .monitoring import RequestStats, current_stats
+
+PROFILE_HEADER = b"x-profile"
+EVENT_STREAM = b"text/event-stream"
+
+
+class Profile:
+    def __init__(self, method: str, path: str, interval: float):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.started_at = datetime.now()
+        self.duration = 0.0
+        self.samples = Counter()
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def add_thread(self, thread_id: int):
+        with self._lock:
+            self.threads.add(thread_id)
+
+    def remove_thread(self, thread_id: int):
+        with self._lock:
+            self.threads.discard(thread_id)
+
+    def sample(self, frames):
+        with self._lock:
+            thread_ids = list(self.threads)
+        for thread_id in thread_ids:
+            frame = frames.get(thread_id)
+            if frame is not None:
+                self.samples[_stack(frame)] += 1
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "samples": sum(self.samples.values()),
+        }
+
+    def collapsed(self) -> str:
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.samples.items()
+        )
+
+    def speedscope(self):
+        frames = []
+        index = {}
+        samples = []
+        weights = []
+        for stack, count in self.samples.items():
+            ids = []
+            for name in stack:
+                if name not in index:
+                    index[name] = len(frames)
+                    frames.append({"name": name})
+                ids.append(index[name])
+            samples.append(ids)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path}",
+            "exporter": "notes-app",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": f"{self.method} {self.path}",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+def _stack(frame):
+    """Root-first tuple of 'function (file:line)' names for `frame`."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    return tuple(reversed(names))
+
+
+class Sampler(threading.Thread):
+    def __init__(self, profile: Profile, max_seconds: float = PROFILE_MAX_SECONDS):
+        super().__init__(name=f"profiler-{profile.id[:8]}", daemon=True)
+        self.profile = profile
+        self.max_seconds = max_seconds
+        self._stop_event = threading.Event()
+
+    def run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop_event.wait(self.profile.interval):
+            if time.monotonic() >= deadline:
+                return
+            self.profile.sample(sys._current_frames())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+PROFILES = deque(maxlen=PROFILE_MAX_STORED)
+
+_active_profile = contextvars.ContextVar("active_profile", default=None)
+
+
+def get_profile(profile_id: str):
+    return next((profile for profile in PROFILES if profile.id == profile_id), None)
+
+
+def in_request_thread(fn):
+    """Wrap a threadpool call so the active profile also samples its thread."""
+    profile = _active_profile.get()
+    if profile is None:
+        return fn
+
+    def tracked(*args, **kwargs):
+        thread_id = threading.get_ident()
+        profile.add_thread(thread_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.remove_thread(thread_id)
+
+    return tracked
+
+
+def is_admin_token(token) -> bool:
+    return (
+        bool(ADMIN_TOKEN)
+        and token is not None
+        and hmac.compare_digest(
+            token.encode() if isinstance(token, str) else token, ADMIN_TOKEN.encode()
+        )
+    )
+
+
+def server_timing(stats: RequestStats, total: float) -> str:
+    """Server-Timing value splitting a request into db, app, template and serialize."""
+    timings = stats.timings
+    endpoint = timings.get("endpoint", 0.0)
+    template = timings.get("template", 0.0)
+    parts = {
+        "db": stats.db_seconds,
+        "app": max(endpoint - stats.db_seconds - template, 0.0),
+        "template": template,
+        "serialize": max(timings.get("handler", 0.0) - endpoint, 0.0),
+        "total": total,
+    }
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.2f}" for name, seconds in parts.items()
+    )
+
+
+class ProfilingMiddleware:
+    """Profile sampled or explicitly requested HTTP requests.
+
+    Must run inside MonitoringMiddleware, whose request stats it reads.
+    """
+
+    def __init__(
+        self,
+        app,
+        sample_rate: float = None,
+        interval: float = None,
+        max_seconds: float = None,
+    ):
+        self.app = app
+        self.sample_rate = PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.interval = PROFILE_INTERVAL_SECONDS if interval is None else interval
+        self.max_seconds = PROFILE_MAX_SECONDS if max_seconds is None else max_seconds
+
+    def _wanted(self, scope) -> bool:
+        headers = dict(scope["headers"])
+        # EventSource asks for an event stream; it would be sampled until it closes
+        if EVENT_STREAM in headers.get(b"accept", b""):
+            return False
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        if PROFILE_HEADER in headers:
+            return is_admin_token(headers[PROFILE_HEADER])
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"], self.interval)
+        profile.add_thread(threading.get_ident())
+        stats = current_stats() or RequestStats()
+        start_time = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                timing = server_timing(stats, time.perf_counter() - start_time)
+                headers = list(message.get("headers", []))
+                if EVENT_STREAM in dict(headers).get(b"content-type", b""):
+                    # Streams opened without asking for one: stop at the first byte
+                    sampler.stop()
+                headers.append((b"server-timing", timing.encode()))
+                headers.append((b"x-profile-id", profile.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler = Sampler(profile, self.max_seconds)
+        token = _active_profile.set(profile)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            _active_profile.reset(token)
+            profile.duration = time.perf_counter() - start_time
+            PROFILES.append(profile)
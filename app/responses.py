@@ -0,0 +1,42 @@
+"""
+Fast JSON responses for payloads that need no response_model validation.
+
+Returning a Response from a route skips FastAPI's per-item validation of the
+result against `response_model` and its generic jsonable_encoder pass, which
+dominate the cost of large listings. Payloads handed to these helpers are
+already trusted: JSON-mode dicts from the read cache, or schema instances
+validated in bulk. `response_model` stays on the routes for the OpenAPI docs.
+"""
+
+from fastapi.responses import JSONResponse, Response
+
+from .schemas import list_adapter
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+if orjson is not None:
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+else:
+    FastJSONResponse = JSONResponse
+
+
+def _with_headers(fast: Response, response: Response = None) -> Response:
+    # Headers set on the injected Response (ETag, X-Next-Cursor, cookies) are
+    # dropped by FastAPI when a route returns its own response
+    if response is not None:
+        fast.headers.raw.extend(response.headers.raw)
+    return fast
+
+
+def json_response(content, response: Response = None) -> Response:
+    """Serialize JSON-native `content`, with orjson when it is installed."""
+    return _with_headers(FastJSONResponse(content), response)
+
+
+def model_list_response(schema, items, response: Response = None) -> Response:
+    """Serialize a list of `schema` instances in one pydantic-core pass."""
+    body = list_adapter(schema).dump_json(items)
+    return _with_headers(Response(body, media_type="application/json"), response)
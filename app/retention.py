@@ -0,0 +1,269 @@
+"""
+Version retention and the background compaction task that enforces it.
+
+A note keeps its newest `keep_last` versions, every version created in the
+last `keep_days` days and, beyond that, the last version of each calendar
+day for `daily_days` days (0 keeps those daily snapshots forever). The
+current version is always kept.
+
+Deleting a version can take away the base another version's delta was
+encoded against, so each note is pruned and its surviving history
+re-encoded in the same transaction. Notes are processed COMPACTION_BATCH_SIZE
+at a time, one short transaction per batch with a pause in between, so
+compaction never holds the write lock for long. With several workers, a
+file lock (SQLite) or advisory lock (PostgreSQL) lets one of them run each
+pass and the others skip it.
+
+Run one pass by hand with `python -m app.retention run`.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import LargeBinary, cast, delete, func, text
+from sqlalchemy.orm import Session
+
+from . import models, versioning
+from .config import (
+    COMPACTION_BATCH_SIZE,
+    COMPACTION_INTERVAL_SECONDS,
+    COMPACTION_PAUSE_SECONDS,
+    RETENTION_DAILY_DAYS,
+    RETENTION_KEEP_DAYS,
+    RETENTION_KEEP_LAST,
+)
+from .database import is_sqlite_file
+from .monitoring import (
+    COMPACTION_BATCH_SECONDS,
+    COMPACTION_LAST_SUCCESS,
+    COMPACTION_PRUNED,
+    COMPACTION_REWRITTEN,
+    COMPACTION_RUNS,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy:
+    def __init__(self, keep_last: int, keep_days: float, daily_days: float):
+        # The head is never pruned, whatever keep_last says
+        self.keep_last = max(keep_last, 1)
+        self.keep_days = keep_days
+        self.daily_days = daily_days
+
+    def versions_to_keep(self, rows, now: datetime) -> set:
+        """Version numbers to keep, from (version, created_at) rows newest first."""
+        recent = now - timedelta(days=self.keep_days)
+        daily = now - timedelta(days=self.daily_days) if self.daily_days else None
+        keep = set()
+        days = set()
+        for i, (version, created_at) in enumerate(rows):
+            if i < self.keep_last or created_at is None or created_at >= recent:
+                keep.add(version)
+                continue
+            # Rows are newest first, so the first one seen is the day's last
+            if created_at.date() not in days:
+                days.add(created_at.date())
+                if daily is None or created_at >= daily:
+                    keep.add(version)
+        return keep
+
+
+def default_policy() -> RetentionPolicy:
+    return RetentionPolicy(
+        RETENTION_KEEP_LAST, RETENTION_KEEP_DAYS, RETENTION_DAILY_DAYS
+    )
+
+
+def prune_note(db: Session, note_id: str, policy: RetentionPolicy, now: datetime):
+    """Apply `policy` to one note; returns (pruned, rewritten). The caller commits."""
+    # Keeps writers off the note until commit where the database has row locks
+    db.query(models.NoteDB.id).filter(
+        models.NoteDB.id == note_id
+    ).with_for_update().first()
+    rows = (
+        db.query(models.NoteVersionDB)
+        .filter(models.NoteVersionDB.note_id == note_id)
+        .order_by(models.NoteVersionDB.version.desc())
+        .all()
+    )
+    keep = policy.versions_to_keep([(row.version, row.created_at) for row in rows], now)
+    if len(keep) == len(rows):
+        return 0, 0
+
+    history = list(versioning.decode_history(rows, versioning.load_blobs(db, rows)))
+    pruned = [row for row, _ in history if row.version not in keep]
+    db.execute(
+        delete(models.NoteVersionDB)
+        .where(models.NoteVersionDB.id.in_([row.id for row in pruned]))
+        .execution_options(synchronize_session=False)
+    )
+    rewritten = versioning.rewrite(db, versioning.encode_survivors(history, keep))
+    versioning.release_blobs(
+        db, [row.content_hash for row in pruned if versioning.is_blob(row)]
+    )
+    return len(pruned), rewritten
+
+
+def _candidates(db: Session, after: str, limit: int, keep_last: int):
+    """Ids of notes with more than `keep_last` versions, in id order after `after`."""
+    return [
+        note_id
+        for (note_id,) in db.query(models.NoteVersionDB.note_id)
+        .filter(models.NoteVersionDB.note_id > after)
+        .group_by(models.NoteVersionDB.note_id)
+        .having(func.count() > keep_last)
+        .order_by(models.NoteVersionDB.note_id)
+        .limit(limit)
+    ]
+
+
+def compact(
+    session_factory,
+    policy: RetentionPolicy = None,
+    batch_size: int = COMPACTION_BATCH_SIZE,
+    pause: float = COMPACTION_PAUSE_SECONDS,
+    now: datetime = None,
+) -> dict:
+    """One retention pass over every note, a batch of notes per transaction."""
+    policy = policy or default_policy()
+    now = now or datetime.now()
+    totals = {
+        "notes": 0,
+        "pruned": 0,
+        "rewritten": 0,
+        "batches": 0,
+        "max_batch_seconds": 0.0,
+    }
+    after = ""
+    while True:
+        start = time.perf_counter()
+        pruned = rewritten = 0
+        with session_factory() as db:
+            note_ids = _candidates(db, after, batch_size, policy.keep_last)
+            if not note_ids:
+                db.rollback()
+                break
+            try:
+                for note_id in note_ids:
+                    note_pruned, note_rewritten = prune_note(db, note_id, policy, now)
+                    pruned += note_pruned
+                    rewritten += note_rewritten
+                    totals["notes"] += bool(note_pruned)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        elapsed = time.perf_counter() - start
+        COMPACTION_BATCH_SECONDS.observe(elapsed)
+        totals["max_batch_seconds"] = max(totals["max_batch_seconds"], elapsed)
+        COMPACTION_PRUNED.inc(pruned)
+        COMPACTION_REWRITTEN.inc(rewritten)
+        totals["pruned"] += pruned
+        totals["rewritten"] += rewritten
+        totals["batches"] += 1
+        after = note_ids[-1]
+        if pause:
+            time.sleep(pause)
+    return totals
+
+
+@contextmanager
+def _compaction_lock(bind):
+    """Yields whether this process may compact; never waits for the lock."""
+    url = bind.url
+    if is_sqlite_file(url):
+        if fcntl is None:
+            yield True
+            return
+        with open(os.path.abspath(url.database) + ".compaction-lock", "w") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    elif url.get_backend_name() == "postgresql":
+        with bind.connect() as connection:
+            acquired = connection.execute(
+                text("SELECT pg_try_advisory_lock(hashtext('notes_compaction'))")
+            ).scalar()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    connection.execute(
+                        text("SELECT pg_advisory_unlock(hashtext('notes_compaction'))")
+                    )
+                connection.commit()
+    else:
+        yield True
+
+
+def run_once(session_factory=None) -> dict:
+    """A compaction pass, unless another process is running one; logs the totals."""
+    if session_factory is None:
+        from .database import SessionLocal as session_factory
+
+    bind = session_factory.kw["bind"]
+    with _compaction_lock(bind) as acquired:
+        if not acquired:
+            COMPACTION_RUNS.labels(result="skipped").inc()
+            return None
+        try:
+            totals = compact(session_factory)
+        except Exception:
+            COMPACTION_RUNS.labels(result="error").inc()
+            raise
+    COMPACTION_RUNS.labels(result="ok").inc()
+    COMPACTION_LAST_SUCCESS.set_to_current_time()
+    logger.info(
+        f"Compaction pruned {totals['pruned']} versions of {totals['notes']} notes "
+        f"in {totals['batches']} batches"
+    )
+    return totals
+
+
+async def run_forever(interval: float = COMPACTION_INTERVAL_SECONDS):
+    """Background task started by the app's lifespan when RETENTION_ENABLED."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(run_once)
+        except Exception:
+            logger.exception("Version compaction failed")
+
+
+def stored_length(db: Session, column):
+    """SQL expression for the stored size of a text column in bytes."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return func.length(cast(column, LargeBinary))
+    if dialect == "postgresql":
+        return func.octet_length(column)
+    return func.length(column)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the version retention policy")
+    parser.add_argument("command", choices=["run"])
+    parser.parse_args()
+
+    print(run_once() or "Another process is compacting; skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,469 @@
+import codecs
+import json
 import logging
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from fastapi.responses import HTMLResponse
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 
-from . import crud, schemas
-from .config import TEMPLATES_DIR
-from .database import get_db
+from . import (
+    assets,
+    batching,
+    bodies,
+    conditional,
+    crud,
+    events,
+    profiling,
+    responses,
+    schemas,
+    transfer,
+)
+from .config import (
+    CONTENT_CHUNK_BYTES,
+    CONTENT_READ_BYTES,
+    DEFAULT_PAGE_SIZE,
+    GROUP_COMMIT_ENABLED,
+    MAX_CONTENT_BYTES,
+    MAX_PAGE_SIZE,
+    MAX_PREVIEW_LENGTH,
+    STATIC_DIR,
+    TEMPLATES_DIR,
+)
+from .database import get_db, get_read_db, get_sync_db, get_sync_read_db, run_db
+from .monitoring import TimedRoute, timed
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
+# Static files are loaded, hashed and compressed once; templates link to
+# their fingerprinted URLs and are rendered once, on first request
+static_assets = assets.StaticAssets(STATIC_DIR)
+templates.env.globals["static_url"] = static_assets.url
+pages = assets.PageCache(templates)
 
 
 # API Routes
 @router.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     """Serve the main notes app interface"""
-    return templates.TemplateResponse("index.html", {"request": request})
+    with timed("template"):
+        page = pages.get("index.html")
+    return page.response(request, assets.REVALIDATE)
 
 
 @router.post("/api/notes/", response_model=schemas.Note)
 async def create_note(note: schemas.NoteCreate, db: Session = Depends(get_db)):
     """Create a new note"""
     try:
-        return crud.create_note(db=db, note=note)
+        return await run_db(db, crud.create_note, note=note)
     except Exception as e:
         logger.error(f"Error creating note: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/api/notes/bulk", response_model=schemas.BulkResult)
+async def bulk_create_notes(
+    payload: schemas.NoteBulkCreate, db: Session = Depends(get_db)
+):
+    """Create many notes in a single transaction"""
+    try:
+        return await run_db(db, crud.bulk_create_notes, notes=payload.notes)
+    except Exception as e:
+        logger.error(f"Error bulk creating notes: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.put("/api/notes/bulk", response_model=schemas.BulkResult)
+async def bulk_update_notes(
+    payload: schemas.NoteBulkUpdate, db: Session = Depends(get_db)
+):
+    """Update many notes in a single transaction, one new version each"""
+    try:
+        return await run_db(db, crud.bulk_update_notes, updates=payload.notes)
+    except Exception as e:
+        logger.error(f"Error bulk updating notes: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/api/notes/bulk/delete", response_model=schemas.BulkResult)
+async def bulk_delete_notes(
+    payload: schemas.NoteBulkDelete, db: Session = Depends(get_db)
+):
+    """Delete many notes in a single transaction"""
+    try:
+        return await run_db(db, crud.bulk_delete_notes, note_ids=payload.ids)
+    except Exception as e:
+        logger.error(f"Error bulk deleting notes: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+
+def _page_response(request: Request, response: Response, items, next_cursor):
+    """Set validators and the cursor; returns a 304 response if the page is unchanged."""
+    etag = conditional.collection_etag(
+        [(item["id"], item["version"]) for item in items], next_cursor
+    )
+    if conditional.is_not_modified(request, etag):
+        response = conditional.not_modified(etag)
+        _set_next_cursor(response, next_cursor)
+        return response
+    conditional.set_validators(response, etag)
+    _set_next_cursor(response, next_cursor)
+    return None
+
+
 @router.get("/api/notes/", response_model=List[schemas.Note])
 async def get_notes(
-    search: Optional[str] = Query(None, min_length=1), db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    search: Optional[str] = Query(None, min_length=1),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_read_db),
 ):
-    """Get all notes, optionally filtered by search term"""
-    return crud.get_notes(db=db, search=search)
+    """Get all notes, optionally filtered by search term or paginated by cursor"""
+    try:
+        notes, next_cursor = await run_db(
+            db, crud.get_notes_cached, search=search, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    not_modified = _page_response(request, response, notes, next_cursor)
+    return not_modified or responses.json_response(notes, response)
+
+
+@router.get("/api/notes/summary", response_model=List[schemas.NoteSummary])
+async def get_note_summaries(
+    request: Request,
+    response: Response,
+    search: Optional[str] = Query(None, min_length=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    preview: int = Query(0, ge=0, le=MAX_PREVIEW_LENGTH),
+    db: Session = Depends(get_read_db),
+):
+    """Get a page of note summaries without full content, newest first"""
+    try:
+        summaries, next_cursor = await run_db(
+            db,
+            crud.get_note_summaries_cached,
+            search=search,
+            limit=limit,
+            cursor=cursor,
+            preview=preview,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    not_modified = _page_response(request, response, summaries, next_cursor)
+    return not_modified or responses.json_response(summaries, response)
+
+
+@router.get("/api/notes/stream")
+async def stream_changes(last_event_id: Optional[str] = Header(None)):
+    """Server-Sent Events feed of note changes; resumes from Last-Event-ID"""
+    return StreamingResponse(
+        events.stream(last_event_id),
+        media_type="text/event-stream",
+        # X-Accel-Buffering stops nginx from holding events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/api/notes/{note_id}", response_model=schemas.Note)
-async def get_note(note_id: str, db: Session = Depends(get_db)):
+async def get_note(
+    note_id: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+):
     """Get a specific note"""
-    note = crud.get_note(db=db, note_id=note_id)
+    if conditional.has_validators(request):
+        # Revalidation only reads version/updated_at, never the content
+        validator = await run_db(db, crud.get_note_validator, note_id=note_id)
+        if validator:
+            etag = conditional.note_etag(validator.version)
+            if conditional.is_not_modified(request, etag, validator.updated_at):
+                return conditional.not_modified(etag, validator.updated_at)
+    note = await run_db(db, crud.get_note_cached, note_id=note_id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
-    return note
+    conditional.set_validators(
+        response, conditional.note_etag(note["version"]), note["updated_at"]
+    )
+    return responses.json_response(note, response)
+
+
+async def _update_note(db, note_id, note_update, expected_versions):
+    """crud.update_note, through the group committer when it is enabled.
+
+    Conditional updates are applied on their own: coalescing them with other
+    writes would make If-Match meaningless.
+    """
+    if GROUP_COMMIT_ENABLED and expected_versions is None:
+        return await batching.committer.update(
+            note_id, note_update.model_dump(exclude_none=True)
+        )
+    return await run_db(
+        db,
+        crud.update_note,
+        note_id=note_id,
+        note_update=note_update,
+        expected_versions=expected_versions,
+    )
 
 
 @router.put("/api/notes/{note_id}", response_model=schemas.Note)
 async def update_note(
-    note_id: str, note_update: schemas.NoteUpdate, db: Session = Depends(get_db)
+    note_id: str,
+    note_update: schemas.NoteUpdate,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
 ):
-    """Update a note and create a new version"""
-    updated_note = crud.update_note(db=db, note_id=note_id, note_update=note_update)
-    if not updated_note:
+    """Update a note and create a new version; honours If-Match"""
+    updated_note, error = await _update_note(
+        db, note_id, note_update, conditional.if_match_versions(request)
+    )
+    if error == "Note not found":
         raise HTTPException(status_code=404, detail="Note not found")
+    if error:
+        # The version is incremented in SQL, so only If-Match can mismatch
+        raise HTTPException(status_code=412, detail="Note has been modified")
+    conditional.set_validators(
+        response, conditional.note_etag(updated_note.version), updated_note.updated_at
+    )
     return updated_note
 
 
+def _chunks(data: bytes, start: int, end: int):
+    for offset in range(start, end, CONTENT_CHUNK_BYTES):
+        yield data[offset : min(offset + CONTENT_CHUNK_BYTES, end)]
+
+
+async def _blob_chunks(db, content_hash: str, start: int, end: int):
+    # Blobs are immutable, so reads that span several queries stay consistent
+    for offset in range(start, end, CONTENT_READ_BYTES):
+        data = await run_db(
+            db,
+            bodies.read_range,
+            content_hash,
+            offset,
+            min(offset + CONTENT_READ_BYTES, end),
+        )
+        for chunk in _chunks(data, 0, len(data)):
+            yield chunk
+
+
+@router.get("/api/notes/{note_id}/content")
+async def get_note_content(
+    note_id: str, request: Request, db: Session = Depends(get_read_db)
+):
+    """Stream a note's content as plain text; supports Range and If-Range"""
+    if conditional.has_validators(request):
+        validator = await run_db(db, crud.get_note_validator, note_id=note_id)
+        if validator:
+            etag = conditional.note_etag(validator.version)
+            if conditional.is_not_modified(request, etag, validator.updated_at):
+                return conditional.not_modified(etag, validator.updated_at)
+    body = await run_db(db, crud.get_note_body, note_id=note_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    note, content = body
+    # An out-of-row body stays in the database; only the bytes sent are read
+    data = None if content is None else content.encode()
+    size = note.content_size if data is None else len(data)
+    etag = conditional.note_etag(note.version)
+    headers = {"Accept-Ranges": "bytes"}
+    try:
+        requested = conditional.byte_range(request, etag, note.updated_at, size)
+    except conditional.RangeNotSatisfiable as e:
+        return Response(status_code=416, headers={**headers, "Content-Range": str(e)})
+    start, end = requested or (0, size)
+    headers["Content-Length"] = str(end - start)
+    if requested:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    response = StreamingResponse(
+        (
+            _blob_chunks(db, note.content_hash, start, end)
+            if data is None
+            else _chunks(data, start, end)
+        ),
+        status_code=206 if requested else 200,
+        media_type="text/plain",
+        headers=headers,
+    )
+    conditional.set_validators(response, etag, note.updated_at)
+    return response
+
+
+@router.put("/api/notes/{note_id}/content", status_code=204)
+async def put_note_content(
+    note_id: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+):
+    """Replace a note's content with the raw UTF-8 request body; honours If-Match"""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > MAX_CONTENT_BYTES:
+        raise HTTPException(status_code=413, detail="Content too large")
+    # Decoded as it arrives, so the raw bytes are never buffered as a whole
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts = []
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > MAX_CONTENT_BYTES:
+                raise HTTPException(status_code=413, detail="Content too large")
+            parts.append(decoder.decode(chunk))
+        parts.append(decoder.decode(b"", final=True))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Content must be UTF-8 text")
+    content = "".join(parts)
+    updated_note, error = await _update_note(
+        db,
+        note_id,
+        schemas.NoteUpdate(content=content),
+        conditional.if_match_versions(request),
+    )
+    if error == "Note not found":
+        raise HTTPException(status_code=404, detail="Note not found")
+    if error:
+        raise HTTPException(status_code=412, detail="Note has been modified")
+    # Set on the injected response, which also carries get_db's write cookie
+    conditional.set_validators(
+        response, conditional.note_etag(updated_note.version), updated_note.updated_at
+    )
+
+
 @router.delete("/api/notes/{note_id}")
 async def delete_note(note_id: str, db: Session = Depends(get_db)):
     """Delete a note"""
-    success = crud.delete_note(db=db, note_id=note_id)
+    success = await run_db(db, crud.delete_note, note_id=note_id)
     if not success:
         raise HTTPException(status_code=404, detail="Note not found")
     return {"message": "Note deleted successfully"}
 
 
+async def _history_validators(db: Session, request: Request, note_id: str, *params):
+    """(etag, last_modified, not_modified) for a note's history; 404 if no note."""
+    validator = await run_db(db, crud.get_version_validator, note_id=note_id)
+    if not validator:
+        raise HTTPException(status_code=404, detail="Note not found")
+    version, updated_at, count = validator
+    etag = conditional.collection_etag(version, count, *params)
+    return etag, updated_at, conditional.is_not_modified(request, etag, updated_at)
+
+
 @router.get("/api/notes/{note_id}/versions", response_model=List[schemas.NoteVersion])
-async def get_note_versions(note_id: str, db: Session = Depends(get_db)):
+async def get_note_versions(
+    note_id: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+):
     """Get all versions of a specific note"""
-    note = crud.get_note(db=db, note_id=note_id)
-    if not note:
+    etag, last_modified, unchanged = await _history_validators(db, request, note_id)
+    if unchanged:
+        return conditional.not_modified(etag, last_modified)
+    conditional.set_validators(response, etag, last_modified)
+    versions = await run_db(db, crud.get_note_versions, note_id=note_id)
+    return responses.model_list_response(schemas.NoteVersion, versions, response)
+
+
+@router.get(
+    "/api/notes/{note_id}/versions/summary",
+    response_model=List[schemas.NoteVersionSummary],
+)
+async def get_note_version_summaries(
+    note_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_read_db),
+):
+    """Get a page of version metadata for a note, without version bodies"""
+    etag, last_modified, unchanged = await _history_validators(
+        db, request, note_id, limit, cursor
+    )
+    if unchanged:
+        return conditional.not_modified(etag, last_modified)
+    try:
+        summaries, next_cursor = await run_db(
+            db,
+            crud.get_note_version_summaries,
+            note_id=note_id,
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    conditional.set_validators(response, etag, last_modified)
+    _set_next_cursor(response, next_cursor)
+    return summaries
+
+
+@router.get("/api/notes/{note_id}/storage", response_model=schemas.NoteStorage)
+async def get_note_storage(note_id: str, db: Session = Depends(get_read_db)):
+    """Storage used by a note and its version history"""
+    storage = await run_db(db, crud.get_note_storage, note_id=note_id)
+    if storage is None:
         raise HTTPException(status_code=404, detail="Note not found")
-    return crud.get_note_versions(db=db, note_id=note_id)
+    return storage
+
+
+@router.get(
+    "/api/notes/{note_id}/versions/{version_id}", response_model=schemas.NoteVersion
+)
+async def get_note_version(
+    note_id: str,
+    version_id: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+):
+    """Get a single version of a note, including its content"""
+    etag = conditional.version_etag(version_id)
+    if conditional.has_validators(request):
+        meta = await run_db(
+            db, crud.get_note_version_meta, note_id=note_id, version_id=version_id
+        )
+        if meta and conditional.is_not_modified(request, etag, meta.created_at):
+            return conditional.not_modified(etag, meta.created_at)
+    version = await run_db(
+        db, crud.get_note_version, note_id=note_id, version_id=version_id
+    )
+    if not version:
+        raise HTTPException(status_code=404, detail="Version not found")
+    conditional.set_validators(response, etag, version.created_at)
+    return version
 
 
 @router.post("/api/notes/{note_id}/restore/{version_id}", response_model=schemas.Note)
 async def restore_note_version(
-    note_id: str, version_id: str, db: Session = Depends(get_db)
+    note_id: str, version_id: str, response: Response, db: Session = Depends(get_db)
 ):
     """Restore a note to a specific version"""
-    note, error = crud.restore_note_version(
-        db=db, note_id=note_id, version_id=version_id
+    note, error = await run_db(
+        db, crud.restore_note_version, note_id=note_id, version_id=version_id
     )
     if error:
         if error == "Note not found":
@@ -99,4 +476,70 @@ async def restore_note_version(
             )
         else:
             raise HTTPException(status_code=500, detail=error)
+    conditional.set_validators(
+        response, conditional.note_etag(note.version), note.updated_at
+    )
     return note
+
+
+# Export and import stream from sync cursors in the threadpool, so they always
+# use sync sessions; in the default execution mode these are the get_read_db
+# and get_db sessions themselves
+@router.get("/api/export")
+async def export_notes(db: Session = Depends(get_sync_read_db)):
+    """Stream every note and its versions as NDJSON"""
+    return StreamingResponse(
+        transfer.export_lines(db),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="notes.ndjson"'},
+    )
+
+
+@router.post("/api/import", response_model=schemas.ImportResult)
+async def import_notes(request: Request, db: Session = Depends(get_sync_db)):
+    """Import an NDJSON export, streaming the request body in batches"""
+    try:
+        return await transfer.import_stream(db, request.stream())
+    except transfer.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except transfer.ImportConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Hide admin endpoints entirely unless an admin token is configured
+    if not profiling.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling.is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """List stored request profiles, newest first"""
+    return [profile.summary() for profile in reversed(profiling.PROFILES)]
+
+
+@router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile(
+    profile_id: str,
+    format: str = Query("speedscope", pattern="^(speedscope|collapsed)$"),
+):
+    """Download a profile as speedscope JSON or collapsed stacks"""
+    profile = profiling.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(
+            profile.collapsed(),
+            headers={
+                "Content-Disposition": f'attachment; filename="{profile.id}.collapsed"'
+            },
+        )
+    return Response(
+        json.dumps(profile.speedscope()),
+        media_type="application/json",
+        headers={
+            "Content-Disposition": f'attachment; filename="{profile.id}.speedscope.json"'
+        },
+    )
@@ -1,6 +1,10 @@
-from typing import Optional
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter
+
+from .config import MAX_BULK_ITEMS
 
 
 class NoteCreate(BaseModel):
@@ -17,9 +21,20 @@ class Note(BaseModel):
     id: str
     title: str
     content: str
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
+    version: int
+
+    class Config:
+        from_attributes = True
+
+
+class NoteSummary(BaseModel):
+    id: str
+    title: str
+    updated_at: datetime
     version: int
+    preview: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -31,7 +46,83 @@ class NoteVersion(BaseModel):
     title: str
     content: str
     version: int
-    created_at: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class NoteVersionSummary(BaseModel):
+    id: str
+    note_id: str
+    title: str
+    version: int
+    created_at: datetime
 
     class Config:
         from_attributes = True
+
+
+class NoteStorage(BaseModel):
+    note_id: str
+    version: int
+    versions: int
+    full_versions: int
+    delta_versions: int
+    oldest_version: Optional[int] = None
+    oldest_created_at: Optional[datetime] = None
+    # Bytes as stored: the note's content, its history's inline deltas, and
+    # the blobs holding its full versions (possibly shared with other notes).
+    # A large note's content_bytes is only the part kept in the notes row
+    content_bytes: int
+    content_size: int
+    content_external: bool
+    history_bytes: int
+    blob_bytes: int
+
+
+class NoteBulkUpdateItem(NoteUpdate):
+    id: str
+
+
+class NoteBulkCreate(BaseModel):
+    notes: List[NoteCreate] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class NoteBulkUpdate(BaseModel):
+    notes: List[NoteBulkUpdateItem] = Field(
+        ..., min_length=1, max_length=MAX_BULK_ITEMS
+    )
+
+
+class NoteBulkDelete(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    status: str
+    version: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
+
+class ImportResult(BaseModel):
+    notes: int
+    versions: int
+    skipped_notes: int
+    skipped_versions: int
+    seconds: float
+    rows_per_sec: float
+
+
+@lru_cache(maxsize=None)
+def list_adapter(schema) -> TypeAdapter:
+    """TypeAdapter for List[schema], to validate or dump whole lists at once."""
+    return TypeAdapter(List[schema])
@@ -0,0 +1,193 @@
+"""
+Full-text search backend for notes.
+Uses an FTS5 virtual table on SQLite and a GIN expression index on PostgreSQL,
+falling back to ILIKE matching on any other database.
+"""
+
+import argparse
+import logging
+import re
+
+from sqlalchemy import Float, Integer, event, func, literal_column, or_, text
+from sqlalchemy.exc import OperationalError
+
+from . import cache, models
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "notes_fts"
+PG_INDEX = "ix_notes_search"
+
+# Title matches weigh more than content matches in bm25 ranking
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+# External-content FTS5 table kept in sync with `notes` by triggers, so every
+# write path (create, update, restore, delete) is covered without crud changes.
+# `notes` has no INTEGER PRIMARY KEY, so VACUUM may renumber its rowids:
+# run `python -m app.search rebuild` after vacuuming.
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content, content='notes', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content)
+        VALUES (new.rowid, new.title, new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON notes BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content)
+        VALUES ('delete', old.rowid, old.title, old.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, content ON notes BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content)
+        VALUES ('delete', old.rowid, old.title, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, title, content)
+        VALUES (new.rowid, new.title, new.content);
+    END""",
+]
+
+# The query must use the exact same expression for the planner to pick the index
+PG_DOCUMENT = (
+    "(setweight(to_tsvector('simple', coalesce(notes.title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(notes.content, '')), 'B'))"
+)
+PG_DDL = [
+    f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON notes USING GIN ({PG_DOCUMENT})",
+]
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Set when the SQLite build lacks FTS5; searches then fall back to ILIKE
+_fts_unavailable = False
+
+
+def _tokens(search: str):
+    return _TOKEN_RE.findall(search.lower())
+
+
+def _fts5_query(tokens):
+    # Every token is a quoted prefix term so search-as-you-type matches partial words
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _tsquery(tokens):
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+def _create_index(connection):
+    global _fts_unavailable
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        try:
+            for statement in SQLITE_DDL:
+                connection.exec_driver_sql(statement)
+        except OperationalError as e:
+            _fts_unavailable = True
+            logger.warning(f"FTS5 unavailable, falling back to ILIKE search: {e}")
+    elif dialect == "postgresql":
+        for statement in PG_DDL:
+            connection.exec_driver_sql(statement)
+
+
+@event.listens_for(models.NoteDB.__table__, "after_create")
+def _create_search_index(target, connection, **kw):
+    _create_index(connection)
+
+
+@event.listens_for(models.NoteDB.__table__, "before_drop")
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _sqlite_index_exists(connection):
+    return (
+        connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (FTS_TABLE,),
+        ).first()
+        is not None
+    )
+
+
+def ensure_search_index(bind):
+    """Create the search index on databases that predate it."""
+    with bind.begin() as connection:
+        created = connection.dialect.name == "sqlite" and not _sqlite_index_exists(
+            connection
+        )
+        _create_index(connection)
+    if created and not _fts_unavailable:
+        rebuild_search_index(bind)
+
+
+def rebuild_search_index(bind):
+    """Re-index every note from the `notes` table."""
+    with bind.begin() as connection:
+        dialect = connection.dialect.name
+        if dialect == "sqlite" and not _fts_unavailable:
+            connection.exec_driver_sql(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            )
+        elif dialect == "postgresql":
+            connection.exec_driver_sql(f"REINDEX INDEX {PG_INDEX}")
+    # Search results may change, so cached listings must not outlive the rebuild
+    cache.invalidate()
+
+
+def _ilike(query, search: str):
+    search_lower = f"%{search.lower()}%"
+    return query.filter(
+        or_(
+            models.NoteDB.title.ilike(search_lower),
+            models.NoteDB.content.ilike(search_lower),
+        )
+    )
+
+
+def apply_search(query, search: str):
+    """Filter a NoteDB query to `search` matches, ordered best match first."""
+    tokens = _tokens(search)
+    dialect = query.session.get_bind().dialect.name
+    if not tokens or (dialect == "sqlite" and _fts_unavailable):
+        return _ilike(query, search)
+
+    if dialect == "sqlite":
+        matches = (
+            text(
+                f"SELECT rowid, bm25({FTS_TABLE}, {TITLE_WEIGHT}, {CONTENT_WEIGHT}) AS rank "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+            )
+            .bindparams(match=_fts5_query(tokens))
+            .columns(rowid=Integer, rank=Float)
+            .subquery()
+        )
+        return query.join(
+            matches, matches.c.rowid == literal_column("notes.rowid")
+        ).order_by(matches.c.rank)
+
+    if dialect == "postgresql":
+        tsquery = func.to_tsquery(literal_column("'simple'"), _tsquery(tokens))
+        document = literal_column(PG_DOCUMENT)
+        return query.filter(document.op("@@")(tsquery)).order_by(
+            func.ts_rank(document, tsquery).desc()
+        )
+
+    return _ilike(query, search)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the notes search index")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    from .database import engine
+
+    ensure_search_index(engine)
+    rebuild_search_index(engine)
+    print("Search index rebuilt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+NDJSON export and import of the whole notes corpus, including history.
+
+Each note is written as a {"type": "note", ...} line followed by one
+{"type": "version", ...} line per version, newest first, with version
+content fully reconstructed so the stream is independent of the storage
+encoding. Both directions work in fixed-size batches, so memory stays
+bounded by the batch size and the longest single note history.
+"""
+
+import itertools
+import json
+import logging
+import time
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import bodies, cache, events, models, schemas, versioning
+from .database import run_db
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 500
+IMPORT_BATCH_SIZE = 500
+
+
+def _timestamp(value):
+    return value.isoformat() if value is not None else None
+
+
+def _note_record(row):
+    return {
+        "type": "note",
+        "id": row.id,
+        "title": row.title,
+        "content": row.blob_content if row.content_external else row.content,
+        "created_at": _timestamp(row.created_at),
+        "updated_at": _timestamp(row.updated_at),
+        "version": row.version,
+    }
+
+
+def _version_record(row, content):
+    return {
+        "type": "version",
+        "id": row.id,
+        "note_id": row.note_id,
+        "title": row.title,
+        "content": content,
+        "version": row.version,
+        "created_at": _timestamp(row.created_at),
+    }
+
+
+def export_lines(db: Session, batch_size: int = EXPORT_BATCH_SIZE):
+    """Yield the corpus as chunks of NDJSON text.
+
+    Notes and versions are read through two server-side cursors sorted by
+    note id and merged, so no more than one batch of rows is held at once.
+    Full versions and large notes come joined with their blob.
+    """
+    notes_table = models.NoteDB.__table__
+    versions_table = models.NoteVersionDB.__table__
+    blobs_table = models.BlobDB.__table__
+    stream = {"yield_per": batch_size}
+    notes = db.execute(
+        select(notes_table, blobs_table.c.content.label("blob_content"))
+        .outerjoin(
+            blobs_table,
+            (blobs_table.c.hash == notes_table.c.content_hash)
+            & notes_table.c.content_external.is_(True),
+        )
+        .order_by(notes_table.c.id),
+        execution_options=stream,
+    )
+    versions = db.execute(
+        select(versions_table, blobs_table.c.content.label("blob_content"))
+        .outerjoin(
+            blobs_table,
+            (blobs_table.c.hash == versions_table.c.content_hash)
+            & versions_table.c.content.is_(None),
+        )
+        .order_by(versions_table.c.note_id, versions_table.c.version.desc()),
+        execution_options=stream,
+    )
+    history = itertools.groupby(versions, key=lambda row: row.note_id)
+    pending = next(history, None)
+
+    start = time.perf_counter()
+    rows = 0
+    lines = []
+    for note in notes:
+        lines.append(json.dumps(_note_record(note)))
+        # Skip orphaned history that sorts before this note
+        while pending is not None and pending[0] < note.id:
+            pending = next(history, None)
+        if pending is not None and pending[0] == note.id:
+            history_rows = list(pending[1])
+            blobs = {
+                row.content_hash: row.blob_content
+                for row in history_rows
+                if versioning.is_blob(row)
+            }
+            for row, content in versioning.decode_history(history_rows, blobs):
+                lines.append(json.dumps(_version_record(row, content)))
+            pending = next(history, None)
+        if len(lines) >= batch_size:
+            rows += len(lines)
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        rows += len(lines)
+        yield "\n".join(lines) + "\n"
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Exported {rows} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)"
+    )
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+class ImportConflictError(ValueError):
+    """A batch clashed with rows already stored; earlier batches stay committed."""
+
+    def __init__(self, message: str, committed: dict):
+        super().__init__(message)
+        self.committed = committed
+
+
+def parse_record(line: str, line_number: int):
+    try:
+        record = json.loads(line)
+        kind = record.pop("type")
+        if kind == "note":
+            return kind, schemas.Note.model_validate(record)
+        if kind == "version":
+            return kind, schemas.NoteVersion.model_validate(record)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise ImportFormatError(f"Line {line_number}: {e}") from e
+    raise ImportFormatError(f"Line {line_number}: unknown record type {kind!r}")
+
+
+def import_batch(db: Session, notes, versions):
+    """Insert one batch of parsed records; notes that already exist are skipped.
+
+    So are repeats of a note id or version within the batch, the first one
+    winning. Versions are only imported alongside their note, and are
+    re-encoded with the current delta storage. Returns a dict of counts.
+    """
+    existing = set()
+    if notes:
+        existing = {
+            note_id
+            for (note_id,) in db.query(models.NoteDB.id).filter(
+                models.NoteDB.id.in_([note.id for note in notes])
+            )
+        }
+    note_rows = []
+    large = {}
+    for note in notes:
+        if note.id in existing:
+            continue
+        existing.add(note.id)
+        row = {**note.model_dump(), **bodies.note_values(note.content)}
+        if row["content_external"]:
+            large[row["content_hash"]] = note.content
+        note_rows.append(row)
+    imported_ids = {row["id"] for row in note_rows}
+
+    by_note = {}
+    version_ids = set()
+    for version in versions:
+        if version.note_id not in imported_ids or version.id in version_ids:
+            continue
+        numbered = by_note.setdefault(version.note_id, {})
+        if version.version not in numbered:
+            numbered[version.version] = version
+            version_ids.add(version.id)
+    version_rows = []
+    for numbered in by_note.values():
+        history = sorted(numbered.values(), key=lambda v: v.version, reverse=True)
+        encoded = versioning.encode_history((v.version, v.content) for v in history)
+        for version, (storage, stored) in zip(history, encoded):
+            row = version.model_dump()
+            row.update(
+                content=stored,
+                storage=storage,
+                content_hash=versioning.content_hash(version.content),
+            )
+            version_rows.append(row)
+
+    try:
+        if note_rows:
+            versioning.store_blobs(db, large)
+            db.execute(insert(models.NoteDB), note_rows)
+        if version_rows:
+            versioning.insert_versions(db, version_rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    if note_rows:
+        cache.invalidate()
+        # Imports can be any size; subscribers reload rather than patch
+        events.resync()
+    return {
+        "notes": len(note_rows),
+        "versions": len(version_rows),
+        "skipped_notes": len(notes) - len(note_rows),
+        "skipped_versions": len(versions) - len(version_rows),
+    }
+
+
+async def import_stream(db, chunks, batch_size: int = IMPORT_BATCH_SIZE):
+    """Import NDJSON from an async iterator of byte chunks.
+
+    Batches are committed as they fill, always on a note boundary so a
+    note and its versions land together. A malformed line raises
+    ImportFormatError, and a batch the database rejects (say, a note
+    created concurrently under an imported id) ImportConflictError;
+    batches before either stay committed.
+    """
+    totals = {"notes": 0, "versions": 0, "skipped_notes": 0, "skipped_versions": 0}
+    notes, versions = [], []
+    start = time.perf_counter()
+
+    async def flush():
+        try:
+            counts = await run_db(
+                db, import_batch, notes=list(notes), versions=list(versions)
+            )
+        except IntegrityError as e:
+            raise ImportConflictError(
+                f"Import stopped at line {line_number}: batch conflicts with stored "
+                f"rows ({e.orig}); "
+                f"{totals['notes']} notes and {totals['versions']} versions "
+                "were committed before it",
+                committed=dict(totals),
+            ) from e
+        for key, value in counts.items():
+            totals[key] += value
+        notes.clear()
+        versions.clear()
+
+    # Pieces of the line still being received; joined once it is complete
+    partial = []
+    line_number = 0
+    async for chunk in chunks:
+        *lines, tail = chunk.split(b"\n")
+        if lines:
+            partial.append(lines[0])
+            lines[0] = b"".join(partial)
+            partial = []
+        partial.append(tail)
+        for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            kind, record = parse_record(line, line_number)
+            if kind == "note":
+                if len(notes) + len(versions) >= batch_size:
+                    await flush()
+                notes.append(record)
+            else:
+                versions.append(record)
+    last = b"".join(partial)
+    if last.strip():
+        kind, record = parse_record(last, line_number + 1)
+        (notes if kind == "note" else versions).append(record)
+    if notes or versions:
+        await flush()
+
+    elapsed = time.perf_counter() - start
+    rows = totals["notes"] + totals["versions"]
+    totals["seconds"] = round(elapsed, 3)
+    totals["rows_per_sec"] = round(rows / max(elapsed, 1e-9), 1)
+    logger.info(
+        f"Imported {rows} rows in {elapsed:.2f}s ({totals['rows_per_sec']:.0f} rows/s)"
+    )
+    return totals
@@ -0,0 +1,487 @@
+"""
+Delta-compressed storage for note version bodies.
+
+The newest version of a note and every VERSION_KEYFRAME_INTERVAL-th version
+keep their full content. Every other version stores a reverse delta: the
+edits that turn the next newer version's content back into its own. Reading
+any version therefore replays about one keyframe interval of deltas at most.
+Histories thinned out by retention (see retention.py) have gaps where
+keyframes used to be, so re-encoding them also puts a full row after every
+VERSION_KEYFRAME_INTERVAL - 1 consecutive deltas.
+
+Full versions keep no body of their own: it lives in the content_blobs
+table, keyed by its sha256, so a body shared by several versions (a
+restore, a title-only edit, two notes with the same text) is stored once.
+Every version also records the hash of the content it decodes to. Rows
+written before blobs existed may still hold their full body inline until
+`python -m app.migrations upgrade` moves it out.
+"""
+
+import argparse
+import difflib
+import hashlib
+import json
+
+from sqlalchemy import bindparam, exists, func, insert, or_, select, tuple_
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import VERSION_KEYFRAME_INTERVAL
+
+STORAGE_FULL = "full"
+STORAGE_DELTA = "delta"
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def store_blobs(db: Session, bodies: dict):
+    """Insert the {hash: content} bodies the blob table does not have yet."""
+    if not bodies:
+        return
+    table = models.BlobDB.__table__
+    rows = [
+        {"hash": digest, "content": content, "size": len(content.encode())}
+        for digest, content in bodies.items()
+    ]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(table).on_conflict_do_nothing(
+            index_elements=["hash"]
+        )
+    else:
+        stored = set(
+            db.execute(select(table.c.hash).where(table.c.hash.in_(bodies))).scalars()
+        )
+        rows = [row for row in rows if row["hash"] not in stored]
+        statement = table.insert()
+    if rows:
+        db.execute(statement, rows)
+
+
+def release_blobs(db: Session, hashes):
+    """Delete the blobs among `hashes` no full version or large note references."""
+    hashes = [digest for digest in set(hashes) if digest]
+    if not hashes:
+        return
+    blobs = models.BlobDB.__table__
+    versions = models.NoteVersionDB.__table__
+    notes = models.NoteDB.__table__
+    db.execute(
+        blobs.delete().where(
+            blobs.c.hash.in_(hashes),
+            ~exists().where(
+                versions.c.content_hash == blobs.c.hash,
+                versions.c.storage == STORAGE_FULL,
+                versions.c.content.is_(None),
+            ),
+            ~exists().where(
+                notes.c.content_hash == blobs.c.hash,
+                notes.c.content_external.is_(True),
+            ),
+        )
+    )
+
+
+def insert_versions(db: Session, rows):
+    """Insert version row dicts, moving the bodies of full rows into blobs.
+
+    Every row needs "content_hash" set to the hash of the content it
+    decodes to; full rows come with their content, which is replaced by a
+    reference to the blob, or with None to reference a blob already stored.
+    """
+    bodies = {}
+    for row in rows:
+        if row["storage"] == STORAGE_FULL and row["content"] is not None:
+            bodies[row["content_hash"]] = row["content"]
+            row["content"] = None
+    store_blobs(db, bodies)
+    db.execute(insert(models.NoteVersionDB), rows)
+
+
+def is_blob(row) -> bool:
+    return row.storage != STORAGE_DELTA and row.content is None
+
+
+def load_blobs(db: Session, rows) -> dict:
+    """Bodies of the blob-backed rows among `rows`, by hash."""
+    hashes = {row.content_hash for row in rows if is_blob(row)}
+    if not hashes:
+        return {}
+    table = models.BlobDB.__table__
+    return dict(
+        db.execute(
+            select(table.c.hash, table.c.content).where(table.c.hash.in_(hashes))
+        ).all()
+    )
+
+
+def make_delta(target: str, base: str) -> str:
+    """Encode `target` as line-level edits against `base`.
+
+    The delta is a JSON list whose items are either [start, end] ranges of
+    base lines to copy, or strings to insert verbatim.
+    """
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(target_lines[j1:j2]))
+    return json.dumps(ops, separators=(",", ":"))
+
+
+def apply_delta(base: str, delta: str) -> str:
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(delta):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_lines[op[0] : op[1]])
+    return "".join(parts)
+
+
+def is_keyframe(version: int) -> bool:
+    return version % VERSION_KEYFRAME_INTERVAL == 0
+
+
+def encode(version: int, content: str, newer_content: str):
+    """Return (storage, stored_content) for a version superseded by `newer_content`."""
+    if is_keyframe(version):
+        return STORAGE_FULL, content
+    delta = make_delta(content, newer_content)
+    if len(delta) >= len(content):
+        return STORAGE_FULL, content
+    return STORAGE_DELTA, delta
+
+
+def supersede(
+    db: Session, note_id: str, version: int, content: str, newer_content: str
+):
+    """Re-encode the previous head version once `newer_content` replaces it.
+
+    The row is only rewritten while it still holds `content` in full, so a
+    head that already diverged from the note is never corrupted.
+    """
+    supersede_many(db, [(note_id, version, content, newer_content)])
+
+
+def supersede_many(db: Session, heads):
+    """Batch form of `supersede` for (note_id, version, content, newer_content) tuples."""
+    params = []
+    for note_id, version, content, newer_content in heads:
+        storage, stored = encode(version, content, newer_content)
+        if storage == STORAGE_DELTA:
+            params.append(
+                {
+                    "b_note_id": note_id,
+                    "b_version": version,
+                    "b_hash": content_hash(content),
+                    "b_content": content,
+                    "b_stored": stored,
+                }
+            )
+    if not params:
+        return
+    table = models.NoteVersionDB.__table__
+    db.execute(
+        table.update()
+        .where(
+            table.c.note_id == bindparam("b_note_id"),
+            table.c.version == bindparam("b_version"),
+            table.c.storage == STORAGE_FULL,
+            or_(
+                table.c.content_hash == bindparam("b_hash"),
+                table.c.content == bindparam("b_content"),
+            ),
+        )
+        .values(
+            content=bindparam("b_stored"),
+            storage=STORAGE_DELTA,
+            content_hash=bindparam("b_hash"),
+        ),
+        params,
+    )
+    # A blob the new head still uses (a title-only edit) cannot be released
+    kept = {content_hash(newer_content) for _, _, _, newer_content in heads}
+    release_blobs(
+        db, [param["b_hash"] for param in params if param["b_hash"] not in kept]
+    )
+
+
+def supersede_previous(db: Session, note_id: str, version: int, content: str):
+    """Delta-encode version `version - 1` now that `version` holds `content`.
+
+    Single-statement writes never read the old body, so the previous head is
+    inserted in full and re-encoded here, before the write's transaction
+    commits. The caller commits.
+    """
+    supersede_previous_many(db, [(note_id, version, content)])
+
+
+def supersede_previous_many(db: Session, heads):
+    """Batch form of `supersede_previous` for (note_id, version, content) tuples."""
+    newer = {
+        (note_id, version - 1): content
+        for note_id, version, content in heads
+        if version > 1 and not is_keyframe(version - 1)
+    }
+    if not newer:
+        return
+    table = models.NoteVersionDB.__table__
+    blobs = models.BlobDB.__table__
+    # The previous heads and their blob bodies in one SELECT
+    rows = db.execute(
+        select(
+            table.c.note_id,
+            table.c.version,
+            func.coalesce(table.c.content, blobs.c.content).label("content"),
+        )
+        .select_from(table.outerjoin(blobs, blobs.c.hash == table.c.content_hash))
+        .where(
+            tuple_(table.c.note_id, table.c.version).in_(list(newer)),
+            table.c.storage == STORAGE_FULL,
+        )
+    ).all()
+    supersede_many(
+        db,
+        [
+            (
+                row.note_id,
+                row.version,
+                row.content,
+                newer[(row.note_id, row.version)],
+            )
+            for row in rows
+            if row.content is not None
+        ],
+    )
+
+
+def decode_history(rows, blobs: dict = None):
+    """Yield (row, content) for version rows ordered newest first.
+
+    `blobs` maps hashes to bodies for the blob-backed rows, as from
+    `load_blobs`.
+    """
+    newer_content = None
+    for row in rows:
+        if row.storage == STORAGE_DELTA and newer_content is not None:
+            content = apply_delta(newer_content, row.content)
+        elif is_blob(row):
+            content = blobs[row.content_hash]
+        else:
+            content = row.content
+        newer_content = content
+        yield row, content
+
+
+def load_content(db: Session, version_row) -> str:
+    """Reconstruct the full content of a single version row."""
+    if version_row.storage != STORAGE_DELTA:
+        if is_blob(version_row):
+            return load_blobs(db, [version_row])[version_row.content_hash]
+        return version_row.content
+
+    # The nearest full row is usually within one keyframe interval, but
+    # writes after a retention pass can add up to another interval on top
+    chain = []
+    after = version_row.version - 1
+    while not chain or chain[-1].storage == STORAGE_DELTA:
+        rows = (
+            db.query(models.NoteVersionDB)
+            .filter(
+                models.NoteVersionDB.note_id == version_row.note_id,
+                models.NoteVersionDB.version > after,
+            )
+            .order_by(models.NoteVersionDB.version.asc())
+            .limit(VERSION_KEYFRAME_INTERVAL)
+            .all()
+        )
+        for row in rows:
+            chain.append(row)
+            if row.storage != STORAGE_DELTA:
+                break
+        if len(rows) < VERSION_KEYFRAME_INTERVAL:
+            break
+        after = rows[-1].version
+    history = list(decode_history(reversed(chain), load_blobs(db, chain[-1:])))
+    return history[-1][1]
+
+
+def encode_history(history):
+    """Yield (storage, stored_content) for (version, content) pairs newest first."""
+    newer_content = None
+    run = 0
+    for version, content in history:
+        if newer_content is None or run >= VERSION_KEYFRAME_INTERVAL - 1:
+            storage, stored = STORAGE_FULL, content
+        else:
+            storage, stored = encode(version, content, newer_content)
+        run = run + 1 if storage == STORAGE_DELTA else 0
+        newer_content = content
+        yield storage, stored
+
+
+def encode_survivors(history, keep):
+    """Yield (row, storage, stored_content, content) for rows whose version is in `keep`.
+
+    `history` is decoded (row, content) pairs newest first, as from
+    `decode_history`. A delta whose base (the next newer row) survives is
+    kept as stored; rows that lost their base are encoded against the next
+    newer survivor.
+    """
+    newer_content = None
+    run = 0
+    base_kept = True
+    for row, content in history:
+        kept = row.version in keep
+        if kept:
+            if newer_content is None or run >= VERSION_KEYFRAME_INTERVAL - 1:
+                storage, stored = STORAGE_FULL, content
+            elif base_kept:
+                storage = row.storage
+                stored = row.content if storage == STORAGE_DELTA else content
+            else:
+                storage, stored = encode(row.version, content, newer_content)
+            run = run + 1 if storage == STORAGE_DELTA else 0
+            newer_content = content
+            yield row, storage, stored, content
+        base_kept = kept
+
+
+def rewrite(db: Session, encoded) -> int:
+    """Apply (row, storage, stored_content, content) encodings to version rows.
+
+    Full rows end up referencing a blob, and blobs no longer referenced
+    afterwards are deleted. Returns the number of rows changed.
+    """
+    bodies = {}
+    released = set()
+    rewritten = 0
+    for row, storage, stored, content in encoded:
+        digest = row.content_hash or content_hash(content)
+        if storage == STORAGE_FULL:
+            stored = None
+        if (row.storage, row.content, row.content_hash) == (storage, stored, digest):
+            continue
+        if is_blob(row) and (storage != STORAGE_FULL or row.content_hash != digest):
+            released.add(row.content_hash)
+        if storage == STORAGE_FULL:
+            bodies[digest] = content
+        row.storage = storage
+        row.content = stored
+        row.content_hash = digest
+        rewritten += 1
+    store_blobs(db, bodies)
+    db.flush()
+    release_blobs(db, released)
+    return rewritten
+
+
+def compact_note(db: Session, note_id: str) -> int:
+    """Re-encode every version of a note; returns the number of rows rewritten."""
+    rows = (
+        db.query(models.NoteVersionDB)
+        .filter(models.NoteVersionDB.note_id == note_id)
+        .order_by(models.NoteVersionDB.version.desc())
+        .all()
+    )
+    history = list(decode_history(rows, load_blobs(db, rows)))
+    encoded = encode_history((row.version, content) for row, content in history)
+    return rewrite(
+        db,
+        (
+            (row, storage, stored, content)
+            for (row, content), (storage, stored) in zip(history, encoded)
+        ),
+    )
+
+
+def dedup_note(db: Session, note_id: str) -> int:
+    """Hash a note's versions and move full bodies still inline into blobs.
+
+    Unlike `compact_note`, deltas are left as they are. Returns the number
+    of rows rewritten.
+    """
+    rows = (
+        db.query(models.NoteVersionDB)
+        .filter(models.NoteVersionDB.note_id == note_id)
+        .order_by(models.NoteVersionDB.version.desc())
+        .all()
+    )
+    history = list(decode_history(rows, load_blobs(db, rows)))
+    return rewrite(
+        db,
+        ((row, row.storage, row.content, content) for row, content in history),
+    )
+
+
+def _note_batches(db: Session, batch_size: int):
+    """Yield note ids in batches, committing after each batch is handled."""
+    last_id = ""
+    while True:
+        note_ids = [
+            note_id
+            for (note_id,) in db.query(models.NoteDB.id)
+            .filter(models.NoteDB.id > last_id)
+            .order_by(models.NoteDB.id)
+            .limit(batch_size)
+        ]
+        if not note_ids:
+            return
+        yield note_ids
+        db.commit()
+        last_id = note_ids[-1]
+
+
+def compact_all(db: Session, batch_size: int = 100) -> int:
+    """Compact every note's history, committing after each batch of notes."""
+    rewritten = 0
+    for note_ids in _note_batches(db, batch_size):
+        for note_id in note_ids:
+            rewritten += compact_note(db, note_id)
+    return rewritten
+
+
+def dedup_all(db: Session, batch_size: int = 100) -> int:
+    """Hash every note and `dedup_note` its history, a batch of notes at a time."""
+    rewritten = 0
+    for note_ids in _note_batches(db, batch_size):
+        notes = db.query(models.NoteDB).filter(
+            models.NoteDB.id.in_(note_ids),
+            models.NoteDB.content_hash.is_(None),
+            models.NoteDB.content.is_not(None),
+        )
+        for note in notes:
+            note.content_hash = content_hash(note.content)
+        for note_id in note_ids:
+            rewritten += dedup_note(db, note_id)
+    return rewritten
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage note version storage")
+    parser.add_argument("command", choices=["compact"])
+    parser.parse_args()
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"Rewrote {compact_all(db)} version rows")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Notes/sec for the per-note endpoint versus the bulk endpoints.
+
+Runs the app in-process against a throwaway SQLite file and writes the same
+number of notes through POST /api/notes/ one at a time and through
+POST /api/notes/bulk (then PUT /api/notes/bulk) in batches.
+
+Usage:
+    python benchmarks/bench_bulk.py --notes 5000 --batch 500
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+    from fastapi.testclient import TestClient
+
+    from app.database import engine
+    from app.main import app
+    from app.migrations import init_db
+
+    init_db(engine)
+    client = TestClient(app)
+    notes = [{"title": f"Note {i}", "content": f"Body {i}"} for i in range(args.notes)]
+
+    start = time.perf_counter()
+    for note in notes:
+        client.post("/api/notes/", json=note).raise_for_status()
+    single = args.notes / (time.perf_counter() - start)
+
+    ids = []
+    start = time.perf_counter()
+    for offset in range(0, args.notes, args.batch):
+        response = client.post(
+            "/api/notes/bulk", json={"notes": notes[offset : offset + args.batch]}
+        )
+        response.raise_for_status()
+        ids.extend(item["id"] for item in response.json()["results"])
+    bulk_create = args.notes / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for offset in range(0, args.notes, args.batch):
+        batch = [
+            {"id": note_id, "content": "Updated"}
+            for note_id in ids[offset : offset + args.batch]
+        ]
+        client.put("/api/notes/bulk", json={"notes": batch}).raise_for_status()
+    bulk_update = args.notes / (time.perf_counter() - start)
+
+    print(f"POST /api/notes/      {single:>10.0f} notes/s")
+    print(
+        f"POST /api/notes/bulk  {bulk_create:>10.0f} notes/s ({bulk_create / single:.1f}x)"
+    )
+    print(f"PUT  /api/notes/bulk  {bulk_update:>10.0f} notes/s")
+
+
+if __name__ == "__main__":
+    main()
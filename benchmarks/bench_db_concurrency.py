@@ -0,0 +1,154 @@
+"""
+Concurrency benchmark for the DB execution modes (DB_EXECUTION_MODE).
+
+Each mode runs in its own process against a seeded SQLite file. Concurrent
+clients list notes through the ASGI app in-process while a probe measures
+/health latency, which shows how long the event loop is stalled by DB work.
+
+Usage:
+    python benchmarks/bench_db_concurrency.py --notes 20000 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODES = ["inline", "threadpool", "async"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def seed(notes):
+    import uuid
+    from datetime import datetime
+
+    from app import models
+    from app.database import engine
+    from app.migrations import init_db
+
+    init_db(engine)
+    now = datetime.now()
+    rows = [
+        {
+            "id": str(uuid.uuid4()),
+            "title": f"Note {i}",
+            "content": f"Benchmark body {i} " * 20,
+            "created_at": now,
+            "updated_at": now,
+            "version": 1,
+        }
+        for i in range(notes)
+    ]
+    with engine.begin() as connection:
+        connection.execute(models.NoteDB.__table__.insert(), rows)
+
+
+async def run_clients(requests, concurrency, path):
+    import httpx
+
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    health_latencies = []
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/health")
+                health_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.005)
+
+        async def worker(count):
+            for _ in range(count):
+                response = await client.get(path)
+                response.raise_for_status()
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        per_worker = requests // concurrency
+        await asyncio.gather(*(worker(per_worker) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    return {
+        "requests": per_worker * concurrency,
+        "seconds": round(elapsed, 3),
+        "req_per_sec": round(per_worker * concurrency / elapsed, 1),
+        "health_p50_ms": round(statistics.median(health_latencies) * 1000, 2),
+        "health_p99_ms": round(percentile(health_latencies, 99) * 1000, 2),
+    }
+
+
+def child(args):
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    seed(args.notes)
+    result = asyncio.run(run_clients(args.requests, args.concurrency, args.path))
+    result["mode"] = os.environ["DB_EXECUTION_MODE"]
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=512)
+    # Inline mode blocks the loop on pool checkout, so keep this at or below
+    # the pool size (5 + 10 overflow) when including it
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--path",
+        default="/api/notes/summary?search=benchmark&limit=20",
+        help="request path replayed by every client",
+    )
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results = []
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                DB_EXECUTION_MODE=mode,
+                DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            )
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", *sys.argv[1:]],
+                env=env,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'mode':<12}{'req/s':>10}{'health p50 ms':>16}{'health p99 ms':>16}")
+    for result in results:
+        print(
+            f"{result['mode']:<12}{result['req_per_sec']:>10}"
+            f"{result['health_p50_ms']:>16}{result['health_p99_ms']:>16}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Version storage with content-addressed bodies, and the cost of a no-op save.
+
+Seeds a throwaway SQLite file with --notes notes created from --templates
+shared bodies, then runs --writes updates per note through `crud`: a mix of
+real edits, saves that change nothing (--noop-share) and restores of the
+first version (--restore-share). Reports how many writes became versions,
+the blob bytes actually stored against the bytes the same full versions
+would take inline, and update latency for real edits and for no-op saves.
+
+Usage:
+    python benchmarks/bench_dedup.py --notes 200 --writes 30
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def percentile(timings, p):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--templates", type=int, default=10)
+    parser.add_argument("--writes", type=int, default=30)
+    parser.add_argument("--noop-share", type=float, default=0.3)
+    parser.add_argument("--restore-share", type=float, default=0.1)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'dedup.db')}"
+    from sqlalchemy import func
+
+    from app import crud, models, schemas, versioning
+    from app.database import SessionLocal, engine
+    from app.migrations import init_db
+
+    init_db(engine)
+    rng = random.Random(1)
+    templates = [
+        "".join(f"template {t} line {i}\n" for i in range(200))
+        for t in range(args.templates)
+    ]
+    timings = {"edit": [], "no-op": [], "restore": []}
+    with SessionLocal() as db:
+        notes = [
+            crud.create_note(
+                db,
+                schemas.NoteCreate(
+                    title=f"Note {n}", content=templates[n % len(templates)]
+                ),
+            )
+            for n in range(args.notes)
+        ]
+        for w in range(args.writes):
+            for note in notes:
+                roll = rng.random()
+                start = time.perf_counter()
+                if roll < args.noop_share:
+                    kind = "no-op"
+                    current = crud.get_note(db, note.id)
+                    crud.update_note(
+                        db, note.id, schemas.NoteUpdate(content=current.content)
+                    )
+                elif roll < args.noop_share + args.restore_share:
+                    kind = "restore"
+                    first = (
+                        db.query(models.NoteVersionDB.id)
+                        .filter_by(note_id=note.id, version=1)
+                        .scalar()
+                    )
+                    crud.restore_note_version(db, note.id, first)
+                else:
+                    kind = "edit"
+                    current = crud.get_note(db, note.id)
+                    crud.update_note(
+                        db,
+                        note.id,
+                        schemas.NoteUpdate(content=current.content + f"edit {w}\n"),
+                    )
+                timings[kind].append(time.perf_counter() - start)
+
+        versions = db.query(func.count(models.NoteVersionDB.id)).scalar()
+        blobs, blob_bytes = db.query(
+            func.count(models.BlobDB.hash), func.sum(models.BlobDB.size)
+        ).one()
+        inline_bytes = (
+            db.query(func.sum(models.BlobDB.size))
+            .select_from(models.NoteVersionDB)
+            .join(
+                models.BlobDB,
+                models.BlobDB.hash == models.NoteVersionDB.content_hash,
+            )
+            .filter(
+                models.NoteVersionDB.storage == versioning.STORAGE_FULL,
+                models.NoteVersionDB.content.is_(None),
+            )
+            .scalar()
+        )
+
+    writes = args.notes * (args.writes + 1)
+    print(f"writes: {writes}, version rows: {versions}")
+    print(
+        f"full version bodies: {inline_bytes} bytes inline -> "
+        f"{blob_bytes} bytes in {blobs} blobs"
+    )
+    for kind, kind_timings in timings.items():
+        if kind_timings:
+            print(
+                f"{kind:<8} p50 {percentile(kind_timings, 0.5):.2f} ms, "
+                f"p99 {percentile(kind_timings, 0.99):.2f} ms ({len(kind_timings)})"
+            )
+
+
+if __name__ == "__main__":
+    main()
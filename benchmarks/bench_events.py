@@ -0,0 +1,124 @@
+"""
+Cost of propagating one note change to many open tabs, before and after the
+change feed.
+
+"before" is what the UI did previously: every tab refetched its first page
+of summaries (GET /api/notes/summary?limit=50&preview=120) after a change,
+so bytes per change grow with the page size times the number of tabs.
+"after" sends each tab one event frame. The fan-out part runs --subscribers
+real `events.stream` consumers on one event loop while a writer thread
+publishes --events changes one at a time, and reports the time from publish
+until the last subscriber has the frame.
+
+Usage:
+    python benchmarks/bench_events.py --subscribers 1000,5000,10000 --events 200
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def bytes_per_change(notes=50):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        for i in range(notes):
+            client.post(
+                "/api/notes/",
+                json={
+                    "title": f"Note {i}",
+                    "content": f"Event benchmark body {i} " * 20,
+                },
+            )
+        page = client.get("/api/notes/summary?limit=50&preview=120")
+    from app import events
+
+    frame = events.broker._history[-1][1]
+    return len(page.content), len(frame)
+
+
+async def fan_out(subscribers, count):
+    from app import events
+
+    received = [0] * count
+    done = [None] * count
+    ready = asyncio.Event()
+    started = 0
+
+    async def consume():
+        nonlocal started
+        feed = events.stream()
+        await feed.__anext__()
+        started += 1
+        if started == subscribers:
+            ready.set()
+        try:
+            for _ in range(count):
+                frame = await feed.__anext__()
+                index = int(frame.split(b'"id":"')[1].split(b'"')[0])
+                received[index] += 1
+                if received[index] == subscribers:
+                    done[index] = time.perf_counter()
+                    delivered[index].set()
+        finally:
+            await feed.aclose()
+
+    delivered = []
+    tasks = [asyncio.create_task(consume()) for _ in range(subscribers)]
+    await ready.wait()
+    published = [None] * count
+
+    delivered.extend(threading.Event() for _ in range(count))
+
+    def writer():
+        # One change at a time, so latency is the fan-out itself, not a backlog
+        for i in range(count):
+            published[i] = time.perf_counter()
+            events.broker.publish({"type": events.DELETED, "id": str(i)})
+            delivered[i].wait()
+
+    start = time.perf_counter()
+    thread = threading.Thread(target=writer)
+    thread.start()
+    await asyncio.gather(*tasks)
+    thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = sorted(d - p for d, p in zip(done, published))
+    return (
+        latencies[len(latencies) // 2],
+        latencies[int(len(latencies) * 0.99)],
+        count * subscribers / elapsed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--subscribers", default="1000,5000,10000")
+    parser.add_argument("--events", type=int, default=200)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'events.db')}"
+    os.environ["EVENT_QUEUE_SIZE"] = str(args.events + 1)
+
+    page, frame = bytes_per_change()
+    print(f"bytes per change per tab: before {page}, after {frame}")
+    print(f"{'subscribers':<13}{'p50 ms':>10}{'p99 ms':>10}{'deliveries/s':>15}")
+    for subscribers in (int(n) for n in args.subscribers.split(",")):
+        p50, p99, rate = asyncio.run(fan_out(subscribers, args.events))
+        print(f"{subscribers:<13}{p50 * 1000:>10.2f}{p99 * 1000:>10.2f}{rate:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
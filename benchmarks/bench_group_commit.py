@@ -0,0 +1,125 @@
+"""
+Autosave throughput and latency with group commit disabled and enabled.
+
+Seeds a throwaway SQLite file (tuned profile) with --notes notes, then
+--clients threads each save one note --saves times, back to back, the way
+an editor autosaves while someone types (several clients share a note when
+--clients exceeds --notes). Reports saves per second, save latency, and how
+many versions and commits the saves turned into. Each mode runs in its own
+process; GROUP_COMMIT_WINDOW_SECONDS applies to the enabled run.
+
+Usage:
+    python benchmarks/bench_group_commit.py --notes 20 --clients 40 --saves 50
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def percentile(timings, p):
+    return timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+
+
+def run(args):
+    sys.path.insert(0, ROOT)
+    from fastapi.testclient import TestClient
+    from prometheus_client import REGISTRY
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        note_ids = [
+            client.post(
+                "/api/notes/", json={"title": f"Note {n}", "content": "draft\n"}
+            ).json()["id"]
+            for n in range(args.notes)
+        ]
+
+        def autosave(c):
+            note_id = note_ids[c % len(note_ids)]
+            timings = []
+            for s in range(args.saves):
+                start = time.perf_counter()
+                client.put(
+                    f"/api/notes/{note_id}",
+                    json={"content": f"draft by client {c}, save {s}\n" * 20},
+                )
+                timings.append(time.perf_counter() - start)
+            return timings
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            timings = sorted(
+                t for result in pool.map(autosave, range(args.clients)) for t in result
+            )
+        elapsed = time.perf_counter() - start
+        versions = sum(
+            client.get(f"/api/notes/{note_id}").json()["version"] - 1
+            for note_id in note_ids
+        )
+
+    print(
+        json.dumps(
+            {
+                "saves/s": len(timings) / elapsed,
+                "p50 ms": percentile(timings, 0.5),
+                "p99 ms": percentile(timings, 0.99),
+                "versions": versions,
+                "commits": REGISTRY.get_sample_value(
+                    "group_commit_batches_total", {"result": "ok"}
+                )
+                or len(timings),
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=40)
+    parser.add_argument("--saves", type=int, default=50)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run(args)
+        return
+
+    modes = ("disabled", "enabled")
+    results = {}
+    for mode in modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'group.db')}",
+                "GROUP_COMMIT_ENABLED": str(mode == "enabled").lower(),
+            }
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", *sys.argv[1:]],
+                env=env,
+                cwd=ROOT,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'group commit':<14}" + "".join(f"{mode:>12}" for mode in modes))
+    for measure in results["disabled"]:
+        print(
+            f"{measure:<14}"
+            + "".join(f"{results[mode][measure]:>12.1f}" for mode in modes)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Listing and search latency with multi-MB notes stored inline versus out of
+row, and the cost of reading/writing a large body as JSON versus raw.
+
+Seeds a throwaway SQLite file (tuned profile) with --notes small notes and
+--large notes of --size MB, then times summary listings, searches, a full
+note read as JSON, the same body from /content, a 64 KiB Range read, and
+a JSON PUT against a raw PUT. "inline" runs with LARGE_CONTENT_BYTES above
+--size (every body in the notes row, as before); "out-of-row" uses the
+default threshold. Each layout runs in its own process.
+
+Usage:
+    python benchmarks/bench_large_bodies.py --notes 2000 --large 20 --size 4
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def run(args):
+    sys.path.insert(0, ROOT)
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    big = "".join(f"large body line {i}\n" for i in range(args.size * 2**20 // 20))
+    with TestClient(app) as client:
+        client.post(
+            "/api/notes/bulk",
+            json={
+                "notes": [
+                    {"title": f"Small {i}", "content": f"small note {i} " * 20}
+                    for i in range(args.notes)
+                ]
+            },
+        )
+        large_ids = [
+            client.post(
+                "/api/notes/", json={"title": f"Large {i}", "content": big}
+            ).json()["id"]
+            for i in range(args.large)
+        ]
+        note_id = large_ids[0]
+        # The parent runs this with CACHE_BACKEND=none, so every request
+        # reaches the database
+        results = {
+            "summary page": timed(
+                lambda: client.get("/api/notes/summary?limit=50&preview=120"),
+                args.repeat,
+            ),
+            "search": timed(
+                lambda: client.get("/api/notes/summary?search=line&preview=120"),
+                args.repeat,
+            ),
+            "GET note JSON": timed(
+                lambda: client.get(f"/api/notes/{note_id}"), args.repeat
+            ),
+            "GET /content": timed(
+                lambda: client.get(f"/api/notes/{note_id}/content"), args.repeat
+            ),
+            "GET 64 KiB Range": timed(
+                lambda: client.get(
+                    f"/api/notes/{note_id}/content",
+                    headers={"Range": "bytes=1048576-1114111"},
+                ),
+                args.repeat,
+            ),
+        }
+        edits = iter(range(10**9))
+        results["PUT JSON"] = timed(
+            lambda: client.put(
+                f"/api/notes/{note_id}", json={"content": big + f"{next(edits)}\n"}
+            ),
+            args.repeat,
+        )
+        results["PUT /content"] = timed(
+            lambda: client.put(
+                f"/api/notes/{note_id}/content",
+                content=(big + f"{next(edits)}\n").encode(),
+            ),
+            args.repeat,
+        )
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--large", type=int, default=20)
+    parser.add_argument("--size", type=int, default=4, help="MB per large note")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run(args)
+        return
+
+    layouts = {
+        "inline": str((args.size + 1) * 2**20),
+        "out-of-row": os.environ.get("LARGE_CONTENT_BYTES", str(256 * 1024)),
+    }
+    results = {}
+    for name, threshold in layouts.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'large.db')}",
+                "LARGE_CONTENT_BYTES": threshold,
+                "CACHE_BACKEND": "none",
+            }
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", *sys.argv[1:]],
+                env=env,
+                cwd=ROOT,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            results[name] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'p50 ms':<18}" + "".join(f"{name:>12}" for name in layouts))
+    for measure in results["inline"]:
+        print(
+            f"{measure:<18}"
+            + "".join(f"{results[name][measure]:>12.2f}" for name in layouts)
+        )
+
+
+if __name__ == "__main__":
+    main()
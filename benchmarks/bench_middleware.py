@@ -0,0 +1,124 @@
+"""
+Per-request overhead of MonitoringMiddleware, before and after the ASGI rewrite.
+
+Serves a minimal FastAPI app in-process (no database) with no middleware,
+with the previous BaseHTTPMiddleware implementation, and with the current
+pure ASGI middleware, and reports the mean time per request and how many
+label series each one leaves behind after requests for distinct ids.
+
+Usage:
+    python benchmarks/bench_middleware.py --requests 5000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+
+def legacy_middleware():
+    """The BaseHTTPMiddleware version, labelling by raw path, on its own registry."""
+    from prometheus_client import CollectorRegistry, Counter, Histogram
+    from starlette.middleware.base import BaseHTTPMiddleware
+
+    registry = CollectorRegistry()
+    count = Counter(
+        "http_requests_total",
+        "Total HTTP requests",
+        ["method", "endpoint", "status"],
+        registry=registry,
+    )
+    latency = Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency in seconds",
+        ["method", "endpoint"],
+        registry=registry,
+    )
+
+    class LegacyMonitoringMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request, call_next):
+            start_time = time.time()
+            response = await call_next(request)
+            count.labels(
+                method=request.method,
+                endpoint=request.url.path,
+                status=response.status_code,
+            ).inc()
+            latency.labels(method=request.method, endpoint=request.url.path).observe(
+                time.time() - start_time
+            )
+            return response
+
+    return LegacyMonitoringMiddleware, registry
+
+
+def build_app(middleware=None):
+    from fastapi import FastAPI
+
+    app = FastAPI()
+
+    @app.get("/api/notes/{note_id}")
+    async def get_note(note_id: str):
+        return {"id": note_id, "title": "Benchmark", "version": 1}
+
+    if middleware is not None:
+        app.add_middleware(middleware)
+    return app
+
+
+def series(registry):
+    return sum(
+        1
+        for metric in registry.collect()
+        if metric.name == "http_requests"
+        for sample in metric.samples
+        if sample.name.endswith("_total")
+    )
+
+
+async def run(app, requests: int) -> float:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        for _ in range(100):
+            await client.get(f"/api/notes/{uuid.uuid4()}")
+        start = time.perf_counter()
+        for _ in range(requests):
+            (await client.get(f"/api/notes/{uuid.uuid4()}")).raise_for_status()
+        return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    from prometheus_client import REGISTRY
+
+    from app.monitoring import MonitoringMiddleware
+
+    legacy, legacy_registry = legacy_middleware()
+    cases = [
+        ("none", build_app(), None),
+        ("BaseHTTPMiddleware (before)", build_app(legacy), legacy_registry),
+        ("pure ASGI (after)", build_app(MonitoringMiddleware), REGISTRY),
+    ]
+
+    baseline = None
+    print(f"{'middleware':<30}{'us/req':>10}{'overhead':>12}{'series':>10}")
+    for name, app, registry in cases:
+        per_request = asyncio.run(run(app, args.requests))
+        baseline = per_request if baseline is None else baseline
+        overhead = (per_request - baseline) * 1e6
+        count = series(registry) if registry is not None else 0
+        print(f"{name:<30}{per_request * 1e6:>10.1f}{overhead:>10.1f}us{count:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Bytes transferred and time to first byte for loading the web UI, before and
+after snapshot rendering, fingerprinted assets and compression.
+
+Loads / plus every /static asset it links, as a browser would on a first
+visit and on a repeat visit (revalidating what it may not reuse from its
+cache). "before" is the previous setup: Jinja2 rendering on every request,
+StaticFiles without Cache-Control, no compression, behind the same
+monitoring middleware. "after" is the app as it is now. Both are fetched
+with `Accept-Encoding: gzip, br`, and TTFB is measured over real HTTP
+against uvicorn (single worker, no database access involved).
+
+Usage:
+    python benchmarks/bench_page_load.py --requests 500
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+ASSET_RE = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+
+
+def legacy_app():
+    from fastapi import FastAPI, Request
+    from fastapi.responses import HTMLResponse
+    from fastapi.staticfiles import StaticFiles
+    from fastapi.templating import Jinja2Templates
+
+    from app.monitoring import MonitoringMiddleware
+    from app.profiling import ProfilingMiddleware
+
+    app = FastAPI()
+    templates = Jinja2Templates(directory=os.path.join(ROOT, "templates"))
+    templates.env.globals["static_url"] = lambda name: f"/static/{name}"
+
+    @app.get("/", response_class=HTMLResponse)
+    async def read_root(request: Request):
+        return templates.TemplateResponse("index.html", {"request": request})
+
+    app.mount("/static", StaticFiles(directory=os.path.join(ROOT, "static")))
+    # Same middleware as the real app, so TTFB differences are the page path
+    app.add_middleware(ProfilingMiddleware)
+    app.add_middleware(MonitoringMiddleware)
+    return app
+
+
+def serve(app):
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def wire_bytes(response) -> int:
+    headers = sum(len(k) + len(v) + 4 for k, v in response.headers.raw)
+    # httpx decompresses .content; the header has what was sent
+    return headers + int(response.headers.get("content-length", len(response.content)))
+
+
+async def page_load(client, cache):
+    """Bytes for one visit; `cache` maps URLs to the headers they were served with."""
+    total = 0
+    urls = ["/"]
+    index = 0
+    while index < len(urls):
+        url = urls[index]
+        index += 1
+        cached = cache.get(url)
+        if cached and "immutable" in (cached.get("cache-control") or ""):
+            continue
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last-modified"):
+            headers["If-Modified-Since"] = cached["last-modified"]
+        response = await client.get(url, headers=headers)
+        total += wire_bytes(response)
+        if response.status_code == 200:
+            cache[url] = dict(response.headers)
+            if url == "/":
+                cache["body"] = response.text
+        if url == "/":
+            urls.extend(ASSET_RE.findall(cache["body"]))
+    return total
+
+
+async def measure(base_url, requests):
+    import httpx
+
+    headers = {"Accept-Encoding": "gzip, br"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers) as client:
+        cache = {}
+        first = await page_load(client, cache)
+        repeat = await page_load(client, cache)
+        timings = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            async with client.stream("GET", "/") as response:
+                async for _ in response.aiter_raw():
+                    timings.append(time.perf_counter() - start)
+                    break
+        timings.sort()
+    return first, repeat, timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    # The app's startup initializes a database; keep it away from notes.db
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'page.db')}"
+    from app.main import app
+
+    cases = [("before", legacy_app()), ("after", app)]
+    print(
+        f"{'setup':<8}{'first visit B':>15}{'repeat visit B':>16}"
+        f"{'TTFB p50 ms':>13}{'TTFB p99 ms':>13}"
+    )
+    for name, asgi_app in cases:
+        server, thread, base_url = serve(asgi_app)
+        try:
+            first, repeat, p50, p99 = asyncio.run(measure(base_url, args.requests))
+        finally:
+            server.should_exit = True
+            thread.join()
+        print(f"{name:<8}{first:>15}{repeat:>16}{p50 * 1000:>13.2f}{p99 * 1000:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
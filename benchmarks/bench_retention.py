@@ -0,0 +1,169 @@
+"""
+Version storage before and after a retention pass, and how much the
+background compaction task gets in the way of writes while it runs.
+
+Seeds a throwaway SQLite file (tuned profile) with --notes notes of
+--versions versions each, edited in bursts of --burst versions on days
+spread evenly over the last --days days, then runs
+`retention.compact` with the configured policy (RETENTION_* variables) while
+a writer thread keeps updating notes. Reports rows and stored bytes before
+and after, the longest compaction transaction, and update latency with and
+without compaction running.
+
+Usage:
+    python benchmarks/bench_retention.py --notes 500 --versions 200 --days 120
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def seed(engine, notes, versions, days, burst):
+    from app import models, versioning
+
+    now = datetime.now()
+    start = now - timedelta(days=days)
+    step = timedelta(days=days) / -(-versions // burst)
+    with engine.begin() as connection:
+        for n in range(notes):
+            note_id = str(uuid.uuid4())
+            history = [
+                (v, "".join(f"line {i} of note {n}\n" for i in range(v % 40 + 20)))
+                for v in range(versions, 0, -1)
+            ]
+            connection.execute(
+                models.NoteDB.__table__.insert(),
+                {
+                    "id": note_id,
+                    "title": f"Note {n}",
+                    "content": history[0][1],
+                    "created_at": now - timedelta(days=days),
+                    "updated_at": now,
+                    "version": versions,
+                },
+            )
+            connection.execute(
+                models.NoteVersionDB.__table__.insert(),
+                [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "note_id": note_id,
+                        "title": f"Note {n}",
+                        "content": stored,
+                        "storage": storage,
+                        "version": version,
+                        "created_at": start
+                        + step * ((version - 1) // burst)
+                        + timedelta(minutes=version % burst),
+                    }
+                    for (version, _), (storage, stored) in zip(
+                        history, versioning.encode_history(history)
+                    )
+                ],
+            )
+
+
+def storage(engine):
+    from sqlalchemy import text
+
+    with engine.connect() as connection:
+        return connection.execute(
+            text(
+                "SELECT count(*), sum(length(CAST(content AS BLOB))) FROM note_versions"
+            )
+        ).one()
+
+
+def update_latencies(session_factory, note_ids, stop):
+    from app import crud, schemas
+
+    timings = []
+    i = 0
+    while not stop.is_set():
+        note_id = note_ids[i % len(note_ids)]
+        i += 1
+        start = time.perf_counter()
+        with session_factory() as db:
+            crud.update_note(
+                db, note_id, schemas.NoteUpdate(content=f"edit {i}\n" * 30)
+            )
+        timings.append(time.perf_counter() - start)
+        time.sleep(0.002)
+    timings.sort()
+    return timings
+
+
+def percentile(timings, p):
+    return timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--versions", type=int, default=200)
+    parser.add_argument("--days", type=float, default=120)
+    parser.add_argument("--burst", type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'retention.db')}"
+    from app import models, retention
+    from app.database import SessionLocal, engine
+    from app.migrations import init_db
+
+    init_db(engine)
+    seed(engine, args.notes, args.versions, args.days, args.burst)
+    rows_before, bytes_before = storage(engine)
+    with SessionLocal() as db:
+        note_ids = [note_id for (note_id,) in db.query(models.NoteDB.id)]
+
+    results = {}
+    for phase in ("idle", "compacting"):
+        stop = threading.Event()
+        timings = []
+        writer = threading.Thread(
+            target=lambda: timings.extend(
+                update_latencies(SessionLocal, note_ids, stop)
+            )
+        )
+        writer.start()
+        start = time.perf_counter()
+        if phase == "compacting":
+            totals = retention.compact(SessionLocal)
+        else:
+            time.sleep(2)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        writer.join()
+        results[phase] = timings
+
+    rows_after, bytes_after = storage(engine)
+    policy = retention.default_policy()
+    print(
+        f"policy: keep_last={policy.keep_last} keep_days={policy.keep_days:g} "
+        f"daily_days={policy.daily_days:g}"
+    )
+    print(f"version rows: {rows_before} -> {rows_after}")
+    print(f"stored bytes: {bytes_before} -> {bytes_after}")
+    print(
+        f"compaction: {elapsed:.2f}s, {totals['batches']} batches, "
+        f"longest transaction {totals['max_batch_seconds'] * 1000:.1f} ms"
+    )
+    for phase, timings in results.items():
+        print(
+            f"update latency while {phase}: p50 {percentile(timings, 0.5):.2f} ms, "
+            f"p99 {percentile(timings, 0.99):.2f} ms ({len(timings)} updates)"
+        )
+
+
+if __name__ == "__main__":
+    main()
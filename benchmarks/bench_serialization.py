@@ -0,0 +1,176 @@
+"""
+Serialization cost of note listings and version histories, before and after
+the fast path.
+
+Seeds an in-memory database, then times building the response body for
+--items notes (GET /api/notes/) and for a note with --items versions
+(GET /api/notes/{id}/versions). "before" reproduces the previous path: ORM
+entities validated one by one, then FastAPI's response_model validation and
+generic JSON encoding. "after" runs the current crud functions and response
+helpers. The read cache is bypassed, so listings pay the full miss cost, and
+both paths must produce the same JSON.
+
+Usage:
+    python benchmarks/bench_serialization.py --items 1000 --rounds 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+
+def seed(engine, items):
+    from app import models, versioning
+    from app.database import Base
+
+    Base.metadata.create_all(bind=engine)
+    now = datetime.now()
+    notes = [
+        {
+            "id": str(uuid.uuid4()),
+            "title": f"Note {i}",
+            "content": f"Serialization benchmark body {i}\n" * 10,
+            "created_at": now - timedelta(seconds=i),
+            "updated_at": now - timedelta(seconds=i),
+            "version": 1,
+        }
+        for i in range(items)
+    ]
+    history = [
+        (version, f"Line {version}\n" + "Shared history body\n" * 10)
+        for version in range(items, 0, -1)
+    ]
+    versions = [
+        {
+            "id": str(uuid.uuid4()),
+            "note_id": notes[0]["id"],
+            "title": "Note 0",
+            "content": stored,
+            "storage": storage,
+            "version": version,
+            "created_at": now,
+        }
+        for (version, _), (storage, stored) in zip(
+            history, versioning.encode_history(history)
+        )
+    ]
+    with engine.begin() as connection:
+        connection.execute(models.NoteDB.__table__.insert(), notes)
+        connection.execute(models.NoteVersionDB.__table__.insert(), versions)
+    return notes[0]["id"]
+
+
+def legacy_body(schema, content):
+    """FastAPI's response_model validation and encoding of a returned list."""
+    from typing import List
+
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    field = create_response_field(name="response", type_=List[schema])
+    serialized = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse(serialized).body
+
+
+def notes_before(db):
+    from app import models, schemas
+
+    rows = db.query(models.NoteDB).order_by(models.NoteDB.updated_at.desc()).all()
+    items = [schemas.Note.model_validate(row).model_dump(mode="json") for row in rows]
+    return legacy_body(schemas.Note, items)
+
+
+def notes_after(db):
+    from app import crud, responses, schemas
+
+    rows, _ = crud.get_notes(db)
+    adapter = schemas.list_adapter(schemas.Note)
+    items = adapter.dump_python(
+        adapter.validate_python(rows, from_attributes=True), mode="json"
+    )
+    return responses.json_response(items).body
+
+
+def versions_before(db, note_id):
+    from app import models, schemas, versioning
+
+    rows = (
+        db.query(models.NoteVersionDB)
+        .filter(models.NoteVersionDB.note_id == note_id)
+        .order_by(models.NoteVersionDB.version.desc())
+        .all()
+    )
+    versions = [
+        schemas.NoteVersion(
+            id=row.id,
+            note_id=row.note_id,
+            title=row.title,
+            content=content,
+            version=row.version,
+            created_at=row.created_at,
+        )
+        for row, content in versioning.decode_history(rows)
+    ]
+    return legacy_body(schemas.NoteVersion, versions)
+
+
+def versions_after(db, note_id):
+    from app import crud, responses, schemas
+
+    versions = crud.get_note_versions(db, note_id)
+    return responses.model_list_response(schemas.NoteVersion, versions).body
+
+
+def measure(session_factory, fn, rounds, *args):
+    timings = []
+    body = None
+    for _ in range(rounds):
+        with session_factory() as db:
+            start = time.perf_counter()
+            body = fn(db, *args)
+            timings.append(time.perf_counter() - start)
+    return min(timings), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from app import responses
+
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    note_id = seed(engine, args.items)
+    session_factory = sessionmaker(bind=engine)
+
+    per_1k = 1000 / args.items * 1000
+    print(f"JSON encoder: {responses.FastJSONResponse.__name__}")
+    print(f"{'response':<12}{'before ms/1k':>14}{'after ms/1k':>14}{'speedup':>10}")
+    cases = [
+        ("notes", notes_before, notes_after, ()),
+        ("versions", versions_before, versions_after, (note_id,)),
+    ]
+    for name, before, after, extra in cases:
+        before_s, before_body = measure(session_factory, before, args.rounds, *extra)
+        after_s, after_body = measure(session_factory, after, args.rounds, *extra)
+        assert json.loads(before_body) == json.loads(after_body), name
+        print(
+            f"{name:<12}{before_s * per_1k:>14.2f}{after_s * per_1k:>14.2f}"
+            f"{before_s / after_s:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Mixed read/write concurrency on SQLite with the default and tuned profiles.
+
+Runs loadtest.py's crud workload (reads, listings, updates and creates) once
+per SQLITE_PROFILE on a freshly seeded database each, with the read cache
+disabled so every read reaches SQLite, and prints read and write latency,
+total req/s and error counts ("database is locked" surfaces as 500s).
+`--server uvicorn --workers N` adds cross-process write contention.
+
+Usage:
+    python benchmarks/bench_sqlite_profile.py --concurrency 32 --duration 15
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROFILES = ["default", "tuned"]
+READS = ("get_note", "list_summary")
+WRITES = ("update_note", "create_note")
+
+
+def loadtest(profile, args, tmp):
+    output = os.path.join(tmp, f"{profile}.json")
+    command = [
+        sys.executable,
+        os.path.join(HERE, "loadtest.py"),
+        "--db",
+        os.path.join(tmp, f"{profile}.db"),
+        "--notes",
+        str(args.notes),
+        "--server",
+        args.server,
+        "--workers",
+        str(args.workers),
+        "--concurrency",
+        str(args.concurrency),
+        "--duration",
+        str(args.duration),
+        "--output",
+        output,
+    ]
+    env = dict(os.environ, SQLITE_PROFILE=profile, CACHE_BACKEND="none")
+    subprocess.run(
+        command, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    with open(output) as f:
+        return json.load(f)
+
+
+def worst(report, names, key):
+    values = [report["operations"][n][key] for n in names if n in report["operations"]]
+    return max(values, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument(
+        "--server", choices=["inprocess", "uvicorn"], default="inprocess"
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    print(
+        f"{'profile':<10}{'req/s':>10}{'read p50':>10}{'read p99':>10}"
+        f"{'write p50':>11}{'write p99':>11}{'errors':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in PROFILES:
+            report = loadtest(profile, args, tmp)
+            errors = sum(report["errors"].values())
+            print(
+                f"{profile:<10}{report['total']['req_per_sec']:>10}"
+                f"{worst(report, READS, 'p50_ms'):>10}"
+                f"{worst(report, READS, 'p99_ms'):>10}"
+                f"{worst(report, WRITES, 'p50_ms'):>11}"
+                f"{worst(report, WRITES, 'p99_ms'):>11}{errors:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
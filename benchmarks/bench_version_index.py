@@ -0,0 +1,144 @@
+"""
+Query plans and latency for version-history lookups with and without the
+(note_id, version) index on note_versions.
+
+Seeds a throwaway SQLite file with --rows version rows spread over --notes
+notes, then times the lookups the app issues: a page of history, a single
+(note_id, version) row and a full history scan for one note.
+
+Usage:
+    python benchmarks/bench_version_index.py --rows 1000000 --notes 10000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import models  # noqa: E402
+from app.database import Base  # noqa: E402
+
+INDEX = "ix_note_versions_note_id_version"
+
+QUERIES = {
+    "history page": (
+        "SELECT id, version, created_at FROM note_versions "
+        "WHERE note_id = :note_id ORDER BY version DESC LIMIT 20"
+    ),
+    "single version": (
+        "SELECT content, storage FROM note_versions "
+        "WHERE note_id = :note_id AND version = :version"
+    ),
+    "full history": (
+        "SELECT id, content, storage FROM note_versions "
+        "WHERE note_id = :note_id ORDER BY version DESC"
+    ),
+}
+
+
+def seed(engine, rows, notes, batch=20000):
+    note_ids = [str(uuid.uuid4()) for _ in range(notes)]
+    per_note = rows // notes
+    now = datetime.now()
+    with engine.begin() as connection:
+        connection.execute(
+            models.NoteDB.__table__.insert(),
+            [
+                {"id": note_id, "title": "t", "content": "c", "version": per_note}
+                for note_id in note_ids
+            ],
+        )
+        pending = []
+        for version in range(1, per_note + 1):
+            for note_id in note_ids:
+                pending.append(
+                    {
+                        "id": str(uuid.uuid4()),
+                        "note_id": note_id,
+                        "title": "t",
+                        "content": f"version {version} body",
+                        "storage": "full",
+                        "version": version,
+                        "created_at": now,
+                    }
+                )
+                if len(pending) >= batch:
+                    connection.execute(models.NoteVersionDB.__table__.insert(), pending)
+                    pending = []
+        if pending:
+            connection.execute(models.NoteVersionDB.__table__.insert(), pending)
+    return note_ids, per_note
+
+
+def measure(engine, note_ids, per_note, samples):
+    results = {}
+    with engine.connect() as connection:
+        for name, sql in QUERIES.items():
+            params = {"note_id": note_ids[0], "version": 1}
+            plan = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params)
+            timings = []
+            for _ in range(samples):
+                params = {
+                    "note_id": random.choice(note_ids),
+                    "version": random.randint(1, per_note),
+                }
+                start = time.perf_counter()
+                connection.execute(text(sql), params).all()
+                timings.append(time.perf_counter() - start)
+            results[name] = (
+                " | ".join(row[-1] for row in plan),
+                statistics.median(timings) * 1000,
+            )
+    return results
+
+
+def report(title, results):
+    print(f"\n== {title}")
+    for name, (plan, p50) in results.items():
+        print(f"{name:<16}{p50:>10.3f} ms   {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--notes", type=int, default=10_000)
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP INDEX {INDEX}"))
+
+        start = time.perf_counter()
+        note_ids, per_note = seed(engine, args.rows, args.notes)
+        print(
+            f"Seeded {per_note * len(note_ids)} version rows "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+
+        report("without index", measure(engine, note_ids, per_note, args.samples))
+
+        start = time.perf_counter()
+        with engine.begin() as connection:
+            for index in models.NoteVersionDB.__table__.indexes:
+                if index.name == INDEX:
+                    index.create(connection)
+        print(f"\nBuilt {INDEX} in {time.perf_counter() - start:.1f}s")
+
+        report("with index", measure(engine, note_ids, per_note, args.samples))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Throughput scaling of production mode with the number of uvicorn workers.
+
+Seeds one SQLite database, then runs loadtest.py against `run.py --mode
+production` once per worker count on that same database and prints req/s,
+p99 latency and peak RSS side by side. Scaling is bounded by the CPUs
+available (reported) and, for write-heavy workloads, by SQLite's single
+writer.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1,2,4 --workload crud
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def loadtest(db, workers, args, output):
+    command = [
+        sys.executable,
+        os.path.join(HERE, "loadtest.py"),
+        "--server",
+        "uvicorn",
+        "--db",
+        db,
+        "--notes",
+        str(args.notes),
+        "--workload",
+        args.workload,
+        "--workers",
+        str(workers),
+        "--concurrency",
+        str(args.concurrency),
+        "--duration",
+        str(args.duration),
+        "--output",
+        output,
+    ]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with open(output) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated counts")
+    parser.add_argument("--workload", default="crud")
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15)
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.workers.split(",")]
+    print(f"CPUs available: {os.cpu_count()}")
+    print(f"{'workers':>8}{'req/s':>10}{'p99 ms':>10}{'RSS MB':>10}{'speedup':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "workers.db")
+        baseline = None
+        for workers in counts:
+            report = loadtest(db, workers, args, os.path.join(tmp, f"{workers}.json"))
+            total = report["total"]
+            baseline = baseline or total["req_per_sec"]
+            print(
+                f"{workers:>8}{total['req_per_sec']:>10}{total['p99_ms']:>10}"
+                f"{report['rss_mb']:>10}{total['req_per_sec'] / baseline:>9.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
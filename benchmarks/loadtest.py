@@ -0,0 +1,446 @@
+"""
+Load-test harness: seed a database, drive a workload, save the results as JSON.
+
+Seeds a SQLite file with --notes notes (each with --versions versions, delta
+encoded like the app does), then runs concurrent clients against the app
+either in-process (httpx ASGITransport) or over HTTP against the production
+server (`run.py --mode production`) in a subprocess. Reports p50/p95/p99
+latency per operation, req/s and peak RSS, and writes everything plus the
+git commit to --output so runs can be compared across commits with --compare.
+
+Workloads:
+    crud      reads, listings, updates and creates
+    search    full-text search listings with a few note reads
+    versions  history pages, version bodies and the updates that create them
+    replay    lines from --replay, a JSONL file of {"method", "path", "json"}
+              requests whose {note_id}, {version_id} and {word} placeholders
+              are filled from the seeded data (see workloads/sample.jsonl)
+
+Usage:
+    python benchmarks/loadtest.py --notes 10000 --workload crud --output crud.json
+    python benchmarks/loadtest.py --notes 1000000 --db /tmp/notes-1m.db --workload search
+    python benchmarks/loadtest.py --server uvicorn --workload versions --compare crud.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SEED_BATCH = 10000
+VOCABULARY_SIZE = 2000
+
+WORKLOADS = {
+    "crud": {
+        "get_note": 50,
+        "list_summary": 20,
+        "update_note": 20,
+        "create_note": 10,
+    },
+    "search": {"search": 80, "get_note": 20},
+    "versions": {"version_summary": 40, "get_version": 30, "update_note": 30},
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def vocabulary(rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [
+        "".join(rng.choice(letters) for _ in range(rng.randint(4, 9)))
+        for _ in range(VOCABULARY_SIZE)
+    ]
+
+
+def seed(notes, versions, rng, words):
+    """Insert notes and delta-encoded history in batches; skips a seeded file."""
+    from sqlalchemy import func, insert
+
+    from app import models, versioning
+    from app.database import SessionLocal, engine
+    from app.migrations import init_db
+
+    init_db(engine)
+    with SessionLocal() as db:
+        existing = db.query(func.count(models.NoteDB.id)).scalar()
+        if existing:
+            print(f"Using {existing} existing notes", file=sys.stderr)
+            return
+
+        start = time.perf_counter()
+        base_time = datetime.now() - timedelta(days=365)
+        for offset in range(0, notes, SEED_BATCH):
+            note_rows = []
+            version_rows = []
+            for i in range(offset, min(offset + SEED_BATCH, notes)):
+                note_id = str(uuid.uuid4())
+                lines = [" ".join(rng.choices(words, k=12)) for _ in range(8)]
+                history = []
+                for version in range(1, versions + 1):
+                    lines[rng.randrange(len(lines))] = " ".join(
+                        rng.choices(words, k=12)
+                    )
+                    history.append((version, "\n".join(lines)))
+                history.reverse()
+                created = base_time + timedelta(seconds=i)
+                title = " ".join(rng.choices(words, k=3))
+                note_rows.append(
+                    {
+                        "id": note_id,
+                        "title": title,
+                        "content": history[0][1],
+                        "created_at": created,
+                        "updated_at": created,
+                        "version": versions,
+                    }
+                )
+                encoded = versioning.encode_history(history)
+                for (version, _), (storage, stored) in zip(history, encoded):
+                    version_rows.append(
+                        {
+                            "id": str(uuid.uuid4()),
+                            "note_id": note_id,
+                            "title": title,
+                            "content": stored,
+                            "storage": storage,
+                            "version": version,
+                            "created_at": created,
+                        }
+                    )
+            db.execute(insert(models.NoteDB), note_rows)
+            db.execute(insert(models.NoteVersionDB), version_rows)
+            db.commit()
+            print(f"Seeded {offset + len(note_rows)}/{notes} notes", file=sys.stderr)
+        print(f"Seeded in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+def sample_targets(rng, limit=10000):
+    """Note ids and (note_id, version_id) pairs for the workload to hit."""
+    from sqlalchemy import func
+
+    from app import models
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        note_ids = [
+            note_id
+            for (note_id,) in db.query(models.NoteDB.id)
+            .order_by(func.random())
+            .limit(limit)
+        ]
+        version_ids = (
+            db.query(models.NoteVersionDB.note_id, models.NoteVersionDB.id)
+            .order_by(func.random())
+            .limit(limit)
+            .all()
+        )
+    return note_ids, [tuple(row) for row in version_ids]
+
+
+class Workload:
+    def __init__(self, name, rng, words, note_ids, version_ids, replay=None):
+        self.rng = rng
+        self.words = words
+        self.note_ids = note_ids
+        self.version_ids = version_ids
+        self.replay = replay
+        if replay is None:
+            weights = WORKLOADS[name]
+            self.operations = list(weights)
+            self.weights = list(weights.values())
+
+    def next_request(self):
+        """Return (operation, method, path, json body)."""
+        if self.replay is not None:
+            line = self.rng.choice(self.replay)
+            note_id, version_id = self.rng.choice(self.version_ids)
+            values = {"note_id": note_id, "version_id": version_id, "word": self.word()}
+            path = line["path"].format(**values)
+            body = line.get("json")
+            if body is not None:
+                body = json.loads(json.dumps(body).replace("{word}", values["word"]))
+            return line.get("name", line["path"]), line["method"], path, body
+
+        operation = self.rng.choices(self.operations, self.weights)[0]
+        note_id = self.rng.choice(self.note_ids)
+        if operation == "get_note":
+            return operation, "GET", f"/api/notes/{note_id}", None
+        if operation == "list_summary":
+            return operation, "GET", "/api/notes/summary?limit=50&preview=120", None
+        if operation == "search":
+            return operation, "GET", f"/api/notes/summary?search={self.word()}", None
+        if operation == "update_note":
+            body = {"content": " ".join(self.rng.choices(self.words, k=40))}
+            return operation, "PUT", f"/api/notes/{note_id}", body
+        if operation == "create_note":
+            body = {
+                "title": self.word(),
+                "content": " ".join(self.rng.choices(self.words, k=40)),
+            }
+            return operation, "POST", "/api/notes/", body
+        if operation == "version_summary":
+            return (
+                operation,
+                "GET",
+                f"/api/notes/{note_id}/versions/summary?limit=20",
+                None,
+            )
+        if operation == "get_version":
+            note_id, version_id = self.rng.choice(self.version_ids)
+            return operation, "GET", f"/api/notes/{note_id}/versions/{version_id}", None
+        raise ValueError(f"Unknown operation {operation}")
+
+    def word(self):
+        return self.rng.choice(self.words)
+
+
+async def drive(client, workload, concurrency, duration, warmup):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    deadline = None
+
+    async def worker():
+        while True:
+            operation, method, path, body = workload.next_request()
+            start = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            elapsed = time.perf_counter() - start
+            if deadline is None:
+                continue
+            if start > deadline:
+                return
+            # 412/409 are expected under concurrent updates of the same note
+            if response.status_code >= 400:
+                errors[f"{operation} {response.status_code}"] += 1
+            latencies[operation].append(elapsed)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    await asyncio.sleep(warmup)
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*tasks)
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(samples, seconds):
+    return {
+        "requests": len(samples),
+        "req_per_sec": round(len(samples) / seconds, 1),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+def rss_mb(pid=None):
+    """Peak resident set size of `pid` (or this process) in MB."""
+    if pid is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    total = 0
+    for child_pid in [pid, *child_pids(pid)]:
+        try:
+            with open(f"/proc/{child_pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1])
+        except FileNotFoundError:
+            pass
+    return round(total / 1024, 1)
+
+
+def child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as children:
+            return [int(child) for child in children.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(client, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            (await client.get("/health")).raise_for_status()
+            return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def run(args, workload):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    if args.server == "inprocess":
+        from app.main import app
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            result = await drive(
+                client, workload, args.concurrency, args.duration, args.warmup
+            )
+        return result, rss_mb()
+
+    port = free_port()
+    command = [
+        sys.executable,
+        "run.py",
+        "--mode",
+        "production",
+        "--host",
+        "127.0.0.1",
+        "--port",
+        str(port),
+        "--workers",
+        str(args.workers),
+        "--log-level",
+        "warning",
+    ]
+    server = subprocess.Popen(command, cwd=ROOT, env=os.environ.copy())
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60
+        ) as client:
+            await wait_for_server(client)
+            result = await drive(
+                client, workload, args.concurrency, args.duration, args.warmup
+            )
+        return result, rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    base_ops = (baseline or {}).get("operations", {})
+    print(f"{'operation':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = [*report["operations"].items(), ("total", report["total"])]
+    for name, stats in rows:
+        line = (
+            f"{name:<18}{stats['req_per_sec']:>10}{stats['p50_ms']:>10}"
+            f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+        )
+        before = (
+            (baseline or {}).get("total") if name == "total" else base_ops.get(name)
+        )
+        if before:
+            change = (stats["p99_ms"] - before["p99_ms"]) / before["p99_ms"] * 100
+            line += f"   p99 {change:+.1f}% vs {baseline.get('commit')}"
+        print(line)
+    print(f"peak RSS: {report['rss_mb']} MB")
+    for name, count in report["errors"].items():
+        print(f"errors: {name} x{count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--versions", type=int, default=5, help="versions per note")
+    parser.add_argument("--workload", choices=[*WORKLOADS, "replay"], default="crud")
+    parser.add_argument("--replay", help="JSONL file of requests for --workload replay")
+    parser.add_argument(
+        "--server", choices=["inprocess", "uvicorn"], default="inprocess"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds not measured")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--db", help="SQLite file to seed or reuse (default: temporary)"
+    )
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args()
+    if args.workload == "replay" and not args.replay:
+        parser.error("--workload replay needs --replay FILE")
+
+    tmp = None
+    if args.db is None:
+        tmp = tempfile.TemporaryDirectory()
+        args.db = os.path.join(tmp.name, "loadtest.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.db)}"
+    sys.path.insert(0, ROOT)
+
+    rng = random.Random(args.seed)
+    words = vocabulary(rng)
+    seed(args.notes, args.versions, rng, words)
+    note_ids, version_ids = sample_targets(rng)
+    replay = None
+    if args.replay:
+        with open(args.replay) as f:
+            replay = [json.loads(line) for line in f if line.strip()]
+    workload = Workload(args.workload, rng, words, note_ids, version_ids, replay)
+
+    (latencies, errors, seconds), rss = asyncio.run(run(args, workload))
+    everything = [sample for samples in latencies.values() for sample in samples]
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "seconds": round(seconds, 3),
+        "operations": {
+            name: summarize(samples, seconds)
+            for name, samples in sorted(latencies.items())
+        },
+        "total": summarize(everything, seconds),
+        "rss_mb": rss,
+        "errors": dict(errors),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,146 @@
 """
 Simple runner script for the Notes App with Versioning
 This script provides an easy way to start the application
+
+    python run.py                                # development: auto-reload, one process
+    python run.py --mode production --workers 4  # production: no reload, N workers
 """
 
-import uvicorn
+import argparse
+import importlib.util
 import os
 import sys
-from app.config import DEFAULT_HOST, DEFAULT_PORT, LOG_LEVEL
+
+import uvicorn
+
+from app.config import (
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    GRACEFUL_SHUTDOWN_SECONDS,
+    KEEP_ALIVE_SECONDS,
+    LOG_LEVEL,
+    SERVER_MODE,
+    SOCKET_BACKLOG,
+    WEB_CONCURRENCY,
+)
+
+
+def _available(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Notes App")
+    parser.add_argument(
+        "--mode", choices=["development", "production"], default=SERVER_MODE
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--workers", type=int, default=WEB_CONCURRENCY, help="production only"
+    )
+    parser.add_argument(
+        "--loop",
+        choices=["uvloop", "asyncio"],
+        default="uvloop" if _available("uvloop") else "asyncio",
+    )
+    parser.add_argument(
+        "--http",
+        choices=["httptools", "h11"],
+        default="httptools" if _available("httptools") else "h11",
+    )
+    parser.add_argument("--keep-alive", type=int, default=KEEP_ALIVE_SECONDS)
+    parser.add_argument("--backlog", type=int, default=SOCKET_BACKLOG)
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=GRACEFUL_SHUTDOWN_SECONDS
+    )
+    parser.add_argument("--log-level", default=LOG_LEVEL)
+    parser.add_argument(
+        "--access-log",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="defaults to on in development and off in production",
+    )
+    return parser.parse_args()
+
+
+def run_production(args):
+    from app.cache import backend_for_workers
+    from app.config import CACHE_BACKEND
+    from app.database import SQLALCHEMY_DATABASE_URL, engine
+    from app.migrations import init_db
+
+    # Initialize once before forking; each worker's own init then finds
+    # nothing to do. Workers are spawned fresh, so no connection is shared.
+    init_db(engine)
+    engine.dispose()
+
+    cache_backend = backend_for_workers(CACHE_BACKEND, args.workers)
+    if cache_backend != CACHE_BACKEND:
+        # Workers are spawned with this environment
+        os.environ["CACHE_BACKEND"] = cache_backend
+        print(
+            f"Note: read cache disabled; {args.workers} workers need "
+            "CACHE_BACKEND=shared with REDIS_URL to share one"
+        )
+    if SQLALCHEMY_DATABASE_URL.startswith("sqlite") and args.workers > 1:
+        print(
+            f"Note: {args.workers} workers share one SQLite file; writes are serialized"
+        )
+    print(
+        f"Production mode: {args.workers} workers, loop={args.loop}, http={args.http}"
+    )
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+        access_log=bool(args.access_log),
+        server_header=False,
+    )
+
+
+def run_development(args):
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        reload=True,
+        log_level=args.log_level,
+        access_log=args.access_log is not False,
+    )
+
 
 def main():
+    args = parse_args()
     print("Starting Notes App with Versioning...")
     print("Features: CRUD operations, versioning, and modern UI")
-    print(f"Access the app at: http://localhost:{DEFAULT_PORT}")
-    print(f"API docs at: http://localhost:{DEFAULT_PORT}/docs")
+    print(f"Access the app at: http://localhost:{args.port}")
+    print(f"API docs at: http://localhost:{args.port}/docs")
     print("=" * 50)
-    
-    #Check if we're in the right directory
+
+    # Check if we're in the right directory
     if not os.path.exists("app/main.py"):
         print("Error: main.py not found. Please run from the project root directory.")
         sys.exit(1)
     # Start the application
     try:
-        uvicorn.run(
-            "app.main:app",
-            host=DEFAULT_HOST,
-            port=DEFAULT_PORT,
-            reload=True,
-            log_level=LOG_LEVEL
-        )
+        if args.mode == "production":
+            run_production(args)
+        else:
+            run_development(args)
     except KeyboardInterrupt:
         print("\nShutting down Notes App...")
     except Exception as e:
         print(f"Error starting application: {e}")
         sys.exit(1)
 
+
 if __name__ == "__main__":
     main()
@@ -1,8 +1,18 @@
 // Global variables
 let currentNoteId = null;
+let currentNoteVersion = null;
 let notes = [];
 let versions = [];
 let searchTimeout = null;
+let nextCursor = null;
+let versionsCursor = null;
+let versionBodies = {};
+let pendingChanges = null;
+
+// Sidebar page size and preview length (characters)
+const NOTES_PAGE_SIZE = 50;
+const NOTE_PREVIEW_LENGTH = 120;
+const VERSIONS_PAGE_SIZE = 20;
 
 // DOM elements  
 const notesList = document.getElementById('notesList');
@@ -26,6 +36,7 @@ document.addEventListener('DOMContentLoaded', async function () {
         setupEventListeners();
         console.log('✅ Event listeners set up');
 
+        connectChangeFeed();
         await loadNotes();
         console.log('✅ Notes loaded');
     } catch (error) {
@@ -72,11 +83,11 @@ async function apiCall(url, options = {}) {
     showLoading();
     try {
         const response = await fetch(url, {
+            ...options,
             headers: {
                 'Content-Type': 'application/json',
                 ...options.headers
-            },
-            ...options
+            }
         });
 
         const contentType = response.headers.get("content-type");
@@ -85,6 +96,9 @@ async function apiCall(url, options = {}) {
             if (!response.ok) {
                 throw new Error(data.detail || 'Error occurred');
             }
+            if (options.includeHeaders) {
+                return { data, headers: response.headers };
+            }
             return data;
         } else {
             if (!response.ok) {
@@ -103,20 +117,103 @@ async function apiCall(url, options = {}) {
     }
 }
 
-// Load all notes
+// Load the first page of note summaries
 async function loadNotes(search = '') {
+    // Changes that arrive mid-load are applied on top of the fresh page
+    pendingChanges = pendingChanges || [];
     try {
-        let url = '/api/notes/';
-        if (search) {
-            url += `?search=${encodeURIComponent(search)}`;
-        }
-        notes = await apiCall(url);
-        renderNotes();
+        const page = await fetchNotesPage(search);
+        notes = page.data;
+        nextCursor = page.headers.get('X-Next-Cursor');
     } catch (error) {
         console.error('Failed to load notes:', error);
         notes = [];
+        nextCursor = null;
+    }
+    const changes = pendingChanges;
+    pendingChanges = null;
+    changes.forEach(applyChange);
+    renderNotes();
+}
+
+// Live changes from other tabs and clients, so the list is patched in place
+// instead of refetched; EventSource reconnects and resumes by itself
+function connectChangeFeed() {
+    if (!window.EventSource) return;
+    const source = new EventSource('/api/notes/stream');
+    source.addEventListener('message', (event) => {
+        applyChange(JSON.parse(event.data));
         renderNotes();
+    });
+}
+
+function noteChange(type, note) {
+    return {
+        type,
+        id: note.id,
+        version: note.version,
+        title: note.title,
+        updated_at: note.updated_at,
+        preview: note.content.substring(0, NOTE_PREVIEW_LENGTH)
+    };
+}
+
+// Apply a create/update/restore/delete event to the loaded summaries
+function applyChange(change) {
+    if (pendingChanges) {
+        pendingChanges.push(change);
+        return;
     }
+    if (change.type === 'resync') {
+        loadNotes(searchInput.value);
+        return;
+    }
+
+    const index = notes.findIndex(note => note.id === change.id);
+    if (change.type === 'delete') {
+        if (index !== -1) notes.splice(index, 1);
+        return;
+    }
+    // Our own writes are applied from their responses, so their events
+    // (and any that arrive out of order) are already reflected
+    if (index !== -1 && notes[index].version >= change.version) return;
+
+    const { type, ...summary } = change;
+    if (searchInput.value) {
+        // Search results are ranked by the server; only refresh what is shown
+        if (index !== -1) notes[index] = summary;
+        return;
+    }
+    if (index !== -1) notes.splice(index, 1);
+    notes.unshift(summary);
+}
+
+// Append the next page of note summaries
+async function loadMoreNotes() {
+    if (!nextCursor) return;
+
+    try {
+        const page = await fetchNotesPage(searchInput.value, nextCursor);
+        notes = notes.concat(page.data);
+        nextCursor = page.headers.get('X-Next-Cursor');
+        renderNotes();
+    } catch (error) {
+        console.error('Failed to load more notes:', error);
+    }
+}
+
+function fetchNotesPage(search = '', cursor = null) {
+    const params = new URLSearchParams({
+        limit: NOTES_PAGE_SIZE,
+        preview: NOTE_PREVIEW_LENGTH
+    });
+    if (search) {
+        params.set('search', search);
+    }
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    return apiCall(`/api/notes/summary?${params}`, { includeHeaders: true });
 }
 
 // Render notes list
@@ -144,10 +241,14 @@ function renderNotes() {
                     </button>
                 </div>
             </div>
-            <p class="mb-1 small text-muted text-truncate">${escapeHtml(note.content)}</p>
+            <p class="mb-1 small text-muted text-truncate">${escapeHtml(note.preview)}</p>
             <small class="text-muted">Updated: ${formatDate(note.updated_at)} • v${note.version}</small>
         </div>
-    `).join('');
+    `).join('') + (nextCursor ? `
+        <button class="list-group-item list-group-item-action text-center text-primary" onclick="loadMoreNotes()">
+            <i class="fas fa-angle-down"></i> Load more
+        </button>
+    ` : '');
 }
 
 // Create new note
@@ -167,6 +268,7 @@ async function selectNote(noteId) {
     try {
         const note = await apiCall(`/api/notes/${noteId}`);
         currentNoteId = noteId;
+        currentNoteVersion = note.version;
         noteTitle.value = note.title;
         noteContent.value = note.content;
         editorContainer.style.display = 'block';
@@ -191,10 +293,13 @@ async function saveNote() {
 
     try {
         if (currentNoteId) {
-            await apiCall(`/api/notes/${currentNoteId}`, {
+            // If-Match rejects the save (412) if the note changed since it was opened
+            const updatedNote = await apiCall(`/api/notes/${currentNoteId}`, {
                 method: 'PUT',
+                headers: { 'If-Match': `"${currentNoteVersion}"` },
                 body: JSON.stringify({ title, content })
             });
+            applyChange(noteChange('update', updatedNote));
             showNotification('Note updated successfully!', 'success');
         } else {
             const newNote = await apiCall('/api/notes/', {
@@ -202,10 +307,11 @@ async function saveNote() {
                 body: JSON.stringify({ title, content })
             });
             currentNoteId = newNote.id;
+            applyChange(noteChange('create', newNote));
             showNotification('Note created successfully!', 'success');
         }
 
-        await loadNotes(searchInput.value);
+        renderNotes();
         cancelEdit();
     } catch (error) {
         console.error('Failed to save note:', error);
@@ -235,7 +341,8 @@ function deleteNote(noteId) {
             cancelEdit();
         }
 
-        loadNotes(searchInput.value);
+        applyChange({ type: 'delete', id: noteId });
+        renderNotes();
     }).catch(error => {
         console.error('Failed to delete note:', error);
     });
@@ -246,10 +353,13 @@ function viewVersionHistory(noteId) {
     selectNote(noteId);
 }
 
-// Load note versions
+// Load the first page of version metadata; bodies are fetched on demand
 async function loadNoteVersions(noteId) {
     try {
-        versions = await apiCall(`/api/notes/${noteId}/versions`);
+        const page = await fetchVersionsPage(noteId);
+        versions = page.data;
+        versionsCursor = page.headers.get('X-Next-Cursor');
+        versionBodies = {};
         renderVersions();
         versionHistory.style.display = 'block';
     } catch (error) {
@@ -257,6 +367,44 @@ async function loadNoteVersions(noteId) {
     }
 }
 
+async function loadMoreVersions() {
+    if (!versionsCursor) return;
+
+    try {
+        const page = await fetchVersionsPage(currentNoteId, versionsCursor);
+        versions = versions.concat(page.data);
+        versionsCursor = page.headers.get('X-Next-Cursor');
+        renderVersions();
+    } catch (error) {
+        console.error('Failed to load more versions:', error);
+    }
+}
+
+function fetchVersionsPage(noteId, cursor = null) {
+    const params = new URLSearchParams({ limit: VERSIONS_PAGE_SIZE });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    return apiCall(`/api/notes/${noteId}/versions/summary?${params}`, { includeHeaders: true });
+}
+
+// Show or hide the body of a single version
+async function toggleVersionBody(versionId) {
+    if (versionBodies[versionId] !== undefined) {
+        delete versionBodies[versionId];
+        renderVersions();
+        return;
+    }
+
+    try {
+        const version = await apiCall(`/api/notes/${currentNoteId}/versions/${versionId}`);
+        versionBodies[versionId] = version.content;
+        renderVersions();
+    } catch (error) {
+        console.error('Failed to load version:', error);
+    }
+}
+
 // Render versions
 function renderVersions() {
     if (versions.length === 0) {
@@ -272,12 +420,24 @@ function renderVersions() {
                     <p class="mb-1 small">${escapeHtml(version.title)}</p>
                     <small class="text-muted">${formatDate(version.created_at)}</small>
                 </div>
-                <button class="btn btn-sm btn-primary" onclick="restoreVersion('${version.id}')">
-                    <i class="fas fa-undo"></i> Restore
-                </button>
+                <div class="btn-group btn-group-sm align-self-start">
+                    <button class="btn btn-sm btn-outline-secondary" onclick="toggleVersionBody('${version.id}')">
+                        <i class="fas fa-eye"></i> View
+                    </button>
+                    <button class="btn btn-sm btn-primary" onclick="restoreVersion('${version.id}')">
+                        <i class="fas fa-undo"></i> Restore
+                    </button>
+                </div>
             </div>
+            ${versionBodies[version.id] !== undefined ? `
+                <pre class="mt-2 mb-0 p-2 bg-light small text-wrap">${escapeHtml(versionBodies[version.id])}</pre>
+            ` : ''}
         </div>
-    `).join('');
+    `).join('') + (versionsCursor ? `
+        <button class="list-group-item list-group-item-action text-center text-primary" onclick="loadMoreVersions()">
+            <i class="fas fa-angle-down"></i> Older versions
+        </button>
+    ` : '');
 }
 
 // Restore version
@@ -287,12 +447,13 @@ async function restoreVersion(versionId) {
     }
 
     try {
-        await apiCall(`/api/notes/${currentNoteId}/restore/${versionId}`, {
+        const restoredNote = await apiCall(`/api/notes/${currentNoteId}/restore/${versionId}`, {
             method: 'POST'
         });
         showNotification('Version restored!', 'success');
 
-        await loadNotes(searchInput.value);
+        applyChange(noteChange('restore', restoredNote));
+        renderNotes();
         await loadNoteVersions(currentNoteId);
         await selectNote(currentNoteId);
     } catch (error) {
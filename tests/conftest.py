@@ -11,7 +11,8 @@ from sqlalchemy.pool import StaticPool
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from app.database import Base, get_db  # noqa: E402
+from app import cache  # noqa: E402
+from app.database import Base, get_db, get_read_db  # noqa: E402
 from app.main import app  # noqa: E402
 
 # Use in-memory SQLite database for testing
@@ -48,8 +49,11 @@ def client(db_session):
             pass
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    # Every test starts from an empty database, so nothing cached may survive
+    cache.clear()
     yield TestClient(app)
-    del app.dependency_overrides[get_db]
+    app.dependency_overrides.clear()
 
 
 @pytest.fixture
@@ -1,3 +1,14 @@
+import json
+import sys
+import threading
+
+import anyio
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
 def test_health_check(client):
     response = client.get("/health")
     assert response.status_code == 200
@@ -120,3 +131,1346 @@ def test_version_history_and_restore(client):
     assert data["title"] == "v1"
     assert data["content"] == "c1"
     assert data["version"] == 3
+
+
+def test_search_ranks_title_matches_first(client):
+    client.post("/api/notes/", json={"title": "Groceries", "content": "Buy apples"})
+    client.post("/api/notes/", json={"title": "Apple pie", "content": "Recipe"})
+
+    response = client.get("/api/notes/?search=appl")
+    assert response.status_code == 200
+    titles = [note["title"] for note in response.json()]
+    assert titles == ["Apple pie", "Groceries"]
+
+
+def test_search_index_follows_updates_and_deletes(client):
+    note_id = client.post(
+        "/api/notes/", json={"title": "Draft", "content": "kiwi"}
+    ).json()["id"]
+    other_id = client.post(
+        "/api/notes/", json={"title": "Other", "content": "kiwi"}
+    ).json()["id"]
+
+    client.put(f"/api/notes/{note_id}", json={"content": "mango"})
+    client.delete(f"/api/notes/{other_id}")
+
+    assert client.get("/api/notes/?search=kiwi").json() == []
+    results = client.get("/api/notes/?search=mango").json()
+    assert [note["id"] for note in results] == [note_id]
+
+
+def test_search_rebuild_restores_index(client, db_session):
+    from app.search import rebuild_search_index
+
+    client.post("/api/notes/", json={"title": "Rebuilt", "content": "Content"})
+    db_session.execute(text("DELETE FROM notes_fts"))
+    db_session.commit()
+    assert client.get("/api/notes/?search=rebuilt").json() == []
+
+    rebuild_search_index(db_session.get_bind())
+    assert len(client.get("/api/notes/?search=rebuilt").json()) == 1
+
+
+def test_get_notes_cursor_pagination(client):
+    for i in range(5):
+        client.post("/api/notes/", json={"title": f"Note {i}", "content": "Body"})
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/notes/", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 2
+        seen.extend(note["title"] for note in page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert seen == [f"Note {i}" for i in reversed(range(5))]
+
+
+def test_get_notes_rejects_invalid_cursor(client):
+    import base64
+
+    response = client.get("/api/notes/", params={"limit": 2, "cursor": "garbage"})
+    assert response.status_code == 400
+    for payload in ('"ab"', '{"a": 1, "b": 2}', '["2024-01-01T00:00:00", 5]', "[]"):
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+        response = client.get("/api/notes/", params={"limit": 2, "cursor": cursor})
+        assert response.status_code == 400, payload
+
+
+def test_note_summaries_omit_content(client):
+    client.post("/api/notes/", json={"title": "Long", "content": "x" * 1000})
+
+    response = client.get("/api/notes/summary", params={"preview": 10})
+    assert response.status_code == 200
+    summary = response.json()[0]
+    assert "content" not in summary
+    assert summary["title"] == "Long"
+    assert summary["preview"] == "x" * 10
+    assert summary["version"] == 1
+
+    response = client.get("/api/notes/summary")
+    assert response.json()[0]["preview"] is None
+
+
+def test_run_db_with_async_session():
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    from app import crud, schemas
+    from app.database import Base, run_db
+
+    async def scenario():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            note = await run_db(
+                db, crud.create_note, note=schemas.NoteCreate(title="A", content="B")
+            )
+            notes, _ = await run_db(db, crud.get_notes, search="a")
+        await engine.dispose()
+        return note, notes
+
+    note, notes = anyio.run(scenario)
+    assert note.version == 1
+    assert [n.id for n in notes] == [note.id]
+
+
+def test_versions_are_delta_compressed(client, db_session, monkeypatch):
+    from app import models, versioning
+
+    monkeypatch.setattr(versioning, "VERSION_KEYFRAME_INTERVAL", 3)
+    lines = [f"line {i}\n" for i in range(50)]
+    contents = ["".join(lines)]
+    note_id = client.post(
+        "/api/notes/", json={"title": "Delta", "content": contents[0]}
+    ).json()["id"]
+    for i in range(1, 6):
+        lines[i * 7] = f"edited {i}\n"
+        contents.append("".join(lines))
+        client.put(f"/api/notes/{note_id}", json={"content": contents[-1]})
+
+    rows = (
+        db_session.query(models.NoteVersionDB)
+        .filter(models.NoteVersionDB.note_id == note_id)
+        .order_by(models.NoteVersionDB.version)
+        .all()
+    )
+    storage = {row.version: row.storage for row in rows}
+    assert storage == {
+        1: "delta",
+        2: "delta",
+        3: "full",
+        4: "delta",
+        5: "delta",
+        6: "full",
+    }
+
+    versions = client.get(f"/api/notes/{note_id}/versions").json()
+    assert {v["version"]: v["content"] for v in versions} == {
+        i + 1: content for i, content in enumerate(contents)
+    }
+
+    v1_id = next(v["id"] for v in versions if v["version"] == 1)
+    restored = client.post(f"/api/notes/{note_id}/restore/{v1_id}").json()
+    assert restored["content"] == contents[0]
+    assert restored["version"] == 7
+
+
+def test_migrations_upgrade_legacy_database(tmp_path):
+    from sqlalchemy import create_engine, inspect
+
+    from app import crud, migrations, versioning
+    from app.database import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE notes (id VARCHAR PRIMARY KEY, title VARCHAR, "
+                "content VARCHAR, created_at VARCHAR, updated_at VARCHAR, "
+                "version INTEGER)"
+            )
+        )
+        connection.execute(
+            text(
+                "CREATE TABLE note_versions (id VARCHAR PRIMARY KEY, "
+                "note_id VARCHAR, title VARCHAR, content VARCHAR, "
+                "version INTEGER, created_at VARCHAR)"
+            )
+        )
+        body = "".join(f"line {i}\n" for i in range(40))
+        connection.execute(
+            text(
+                "INSERT INTO notes VALUES ('n1', 't', :c, "
+                "'2025-11-27T23:37:43.406072', '2025-11-27T23:42:42', 2)"
+            ),
+            {"c": body + "tail\n"},
+        )
+        connection.execute(
+            text(
+                "INSERT INTO note_versions VALUES "
+                "('v1', 'n1', 't', :old, 1, '2025-11-27T23:37:43.406072'), "
+                "('v2', 'n1', 't', :new, 2, '2025-11-27T23:42:42')"
+            ),
+            {"old": body, "new": body + "tail\n"},
+        )
+
+    Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+    assert migrations.pending(engine) == []
+
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT id, storage FROM note_versions"))
+        storage = dict(rows.tuples().all())
+        updated_at = connection.execute(text("SELECT updated_at FROM notes")).scalar()
+        v2_content = connection.execute(
+            text("SELECT content FROM note_versions WHERE id = 'v2'")
+        ).scalar()
+        blobs = connection.execute(text("SELECT count(*) FROM content_blobs")).scalar()
+        note_hash, note_size = connection.execute(
+            text("SELECT content_hash, content_size FROM notes")
+        ).one()
+    assert storage == {"v1": "delta", "v2": "full"}
+    assert v2_content is None and blobs == 1
+    assert note_hash == versioning.content_hash(body + "tail\n")
+    assert note_size == len(body) + 5
+    assert updated_at == "2025-11-27 23:42:42.000000"
+    index_names = {i["name"] for i in inspect(engine).get_indexes("note_versions")}
+    assert "ix_note_versions_note_id_version" in index_names
+
+    with Session(bind=engine) as db:
+        versions = crud.get_note_versions(db, "n1")
+        notes, _ = crud.get_notes(db, limit=10)
+    assert [v.content for v in versions] == [body + "tail\n", body]
+    assert notes[0].updated_at.second == 42
+    engine.dispose()
+
+
+def test_duplicate_version_numbers_are_rejected(db_session):
+    from datetime import datetime
+
+    from sqlalchemy.exc import IntegrityError
+
+    from app import models
+
+    now = datetime.now()
+    db_session.add(models.NoteDB(id="n", title="t", content="c", version=1))
+    for version_id in ("a", "b"):
+        db_session.add(
+            models.NoteVersionDB(
+                id=version_id,
+                note_id="n",
+                title="t",
+                content="c",
+                version=1,
+                created_at=now,
+            )
+        )
+    with pytest.raises(IntegrityError):
+        db_session.commit()
+    db_session.rollback()
+
+
+def test_version_summaries_are_paginated_without_content(client):
+    note_id = client.post("/api/notes/", json={"title": "t0", "content": "c0"}).json()[
+        "id"
+    ]
+    for i in range(1, 5):
+        client.put(f"/api/notes/{note_id}", json={"title": f"t{i}", "content": f"c{i}"})
+
+    response = client.get(f"/api/notes/{note_id}/versions/summary", params={"limit": 3})
+    assert response.status_code == 200
+    page = response.json()
+    assert [v["version"] for v in page] == [5, 4, 3]
+    assert "content" not in page[0]
+
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(
+        f"/api/notes/{note_id}/versions/summary",
+        params={"limit": 3, "cursor": cursor},
+    )
+    assert [v["version"] for v in response.json()] == [2, 1]
+    assert "X-Next-Cursor" not in response.headers
+
+    v2_id = response.json()[0]["id"]
+    version = client.get(f"/api/notes/{note_id}/versions/{v2_id}").json()
+    assert version["title"] == "t1"
+    assert version["content"] == "c1"
+
+
+def test_version_body_requires_matching_note(client):
+    first = client.post("/api/notes/", json={"title": "a", "content": "a"}).json()
+    second = client.post("/api/notes/", json={"title": "b", "content": "b"}).json()
+    version_id = client.get(f"/api/notes/{first['id']}/versions").json()[0]["id"]
+
+    response = client.get(f"/api/notes/{second['id']}/versions/{version_id}")
+    assert response.status_code == 404
+    response = client.get("/api/notes/missing/versions/summary")
+    assert response.status_code == 404
+
+
+def test_bulk_create_update_delete(client):
+    response = client.post(
+        "/api/notes/bulk",
+        json={"notes": [{"title": f"Bulk {i}", "content": f"c{i}"} for i in range(3)]},
+    )
+    assert response.status_code == 200
+    created = response.json()
+    assert created["succeeded"] == 3
+    ids = [item["id"] for item in created["results"]]
+    assert client.get(f"/api/notes/{ids[0]}").json()["title"] == "Bulk 0"
+    assert len(client.get(f"/api/notes/{ids[0]}/versions").json()) == 1
+
+    response = client.put(
+        "/api/notes/bulk",
+        json={
+            "notes": [
+                {"id": ids[0], "content": "changed"},
+                {"id": "missing", "title": "x"},
+                {"id": ids[0], "title": "again"},
+            ]
+        },
+    )
+    updated = response.json()
+    assert [item["status"] for item in updated["results"]] == [
+        "updated",
+        "not_found",
+        "error",
+    ]
+    assert updated["failed"] == 2
+    note = client.get(f"/api/notes/{ids[0]}").json()
+    assert (note["title"], note["content"], note["version"]) == ("Bulk 0", "changed", 2)
+    versions = client.get(f"/api/notes/{ids[0]}/versions").json()
+    assert [v["content"] for v in versions] == ["changed", "c0"]
+
+    response = client.post(
+        "/api/notes/bulk/delete", json={"ids": [ids[1], ids[2], "missing"]}
+    )
+    assert [item["status"] for item in response.json()["results"]] == [
+        "deleted",
+        "deleted",
+        "not_found",
+    ]
+    assert [note["id"] for note in client.get("/api/notes/").json()] == [ids[0]]
+
+
+def test_bulk_write_failures_are_reported(client, monkeypatch):
+    from app import crud
+
+    def fail(db, **kwargs):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(crud, "bulk_update_notes", fail)
+    monkeypatch.setattr(crud, "bulk_delete_notes", fail)
+    response = client.put("/api/notes/bulk", json={"notes": [{"id": "a"}]})
+    assert response.status_code == 500
+    assert response.json()["detail"] == "database unavailable"
+    response = client.post("/api/notes/bulk/delete", json={"ids": ["a"]})
+    assert response.status_code == 500
+    assert response.json()["detail"] == "database unavailable"
+
+
+def test_bulk_rejects_empty_batches(client):
+    assert client.post("/api/notes/bulk", json={"notes": []}).status_code == 422
+    assert client.post("/api/notes/bulk/delete", json={"ids": []}).status_code == 422
+
+
+def test_export_import_round_trip(client):
+    note = client.post("/api/notes/", json={"title": "Round", "content": "one"}).json()
+    client.put(f"/api/notes/{note['id']}", json={"content": "one\ntwo"})
+    client.post("/api/notes/", json={"title": "Other", "content": "x"})
+
+    response = client.get("/api/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert [json.loads(line)["type"] for line in lines].count("version") == 3
+
+    client.delete(f"/api/notes/{note['id']}")
+    result = client.post("/api/import", content=response.content).json()
+    assert (result["notes"], result["versions"]) == (1, 2)
+    assert (result["skipped_notes"], result["skipped_versions"]) == (1, 1)
+
+    restored = client.get(f"/api/notes/{note['id']}").json()
+    assert (restored["content"], restored["version"]) == ("one\ntwo", 2)
+    versions = client.get(f"/api/notes/{note['id']}/versions").json()
+    assert [v["content"] for v in versions] == ["one\ntwo", "one"]
+    assert client.get("/api/notes/", params={"search": "round"}).json()
+
+
+def test_import_reassembles_lines_split_across_chunks(client, db_session):
+    from app import transfer
+
+    note = client.post("/api/notes/", json={"title": "Split", "content": "a" * 50})
+    exported = client.get("/api/export").content
+    client.delete(f"/api/notes/{note.json()['id']}")
+
+    async def chunks():
+        for start in range(0, len(exported), 7):
+            yield exported[start : start + 7]
+
+    result = anyio.run(transfer.import_stream, db_session, chunks())
+    assert (result["notes"], result["versions"]) == (1, 1)
+    assert client.get(f"/api/notes/{note.json()['id']}").json()["content"] == "a" * 50
+
+
+def _ndjson(*records):
+    return b"\n".join(json.dumps(record).encode() for record in records)
+
+
+def test_import_skips_repeated_ids(client):
+    stamp = "2024-01-01T00:00:00"
+    note = {"type": "note", "id": "dup", "title": "Twice", "content": "x"}
+    note.update(created_at=stamp, updated_at=stamp, version=1)
+    version = {"type": "version", "id": "v1", "note_id": "dup", "version": 1}
+    version.update(title="Twice", content="x", created_at=stamp)
+
+    body = _ndjson(note, version, {**note, "title": "Again"}, version)
+    result = client.post("/api/import", content=body).json()
+    assert (result["notes"], result["versions"]) == (1, 1)
+    assert (result["skipped_notes"], result["skipped_versions"]) == (1, 1)
+    assert client.get("/api/notes/dup").json()["title"] == "Twice"
+
+
+def test_import_conflict_reports_committed_rows(client):
+    stored = client.post("/api/notes/", json={"title": "Kept", "content": "k"}).json()
+    (stored_version,) = client.get(f"/api/notes/{stored['id']}/versions").json()
+
+    stamp = "2024-01-01T00:00:00"
+    note = {"type": "note", "id": "fresh", "title": "New", "content": "n"}
+    note.update(created_at=stamp, updated_at=stamp, version=1)
+    # Reuses the id of a stored version, which the database rejects
+    version = {"type": "version", "id": stored_version["id"], "note_id": "fresh"}
+    version.update(title="New", content="n", version=1, created_at=stamp)
+
+    response = client.post("/api/import", content=_ndjson(note, version))
+    assert response.status_code == 409
+    assert "0 notes and 0 versions were committed" in response.json()["detail"]
+    assert client.get("/api/notes/fresh").status_code == 404
+
+
+def test_import_rejects_invalid_line(client):
+    response = client.post("/api/import", content=b'{"type": "note"}\nnot json\n')
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Line 1:")
+
+
+def test_note_reads_are_cached_until_written(client, db_session):
+    note = client.post("/api/notes/", json={"title": "Cached", "content": "c"}).json()
+    assert client.get(f"/api/notes/{note['id']}").json()["title"] == "Cached"
+    assert [n["title"] for n in client.get("/api/notes/").json()] == ["Cached"]
+
+    # Out-of-band writes are not seen until the cache is invalidated
+    db_session.execute(text("UPDATE notes SET title = 'Stale'"))
+    db_session.commit()
+    assert client.get(f"/api/notes/{note['id']}").json()["title"] == "Cached"
+    assert [n["title"] for n in client.get("/api/notes/").json()] == ["Cached"]
+
+    client.put(f"/api/notes/{note['id']}", json={"title": "Fresh"})
+    assert client.get(f"/api/notes/{note['id']}").json()["title"] == "Fresh"
+    assert [n["title"] for n in client.get("/api/notes/").json()] == ["Fresh"]
+
+    client.delete(f"/api/notes/{note['id']}")
+    assert client.get(f"/api/notes/{note['id']}").status_code == 404
+    assert client.get("/api/notes/summary").json() == []
+    assert "cache_hits_total" in client.get("/metrics").text
+
+
+def test_lru_cache_evicts_and_expires():
+    from app.cache import LRUCache
+
+    lru = LRUCache(max_entries=2, ttl=60)
+    for key in "abc":
+        lru.put(key, key, lru.generation())
+    assert (lru.get("a"), lru.get("c")) == (None, "c")
+
+    token = lru.generation()
+    lru.invalidate(["c"])
+    lru.put("c", "stale", token)
+    assert lru.get("c") is None
+
+    lru.ttl = -1
+    lru.put("d", "d", lru.generation())
+    assert lru.get("d") is None
+
+
+def test_shared_cache_backend(client, monkeypatch):
+    from app import cache
+
+    monkeypatch.setattr(cache, "backend", cache.create_backend("shared"))
+    note = client.post("/api/notes/", json={"title": "Shared", "content": "c"}).json()
+    client.get(f"/api/notes/{note['id']}")
+    assert cache.backend.get(cache.note_key(note["id"]))["title"] == "Shared"
+
+    client.put(f"/api/notes/{note['id']}", json={"title": "Changed"})
+    assert cache.backend.get(cache.note_key(note["id"])) is None
+    assert client.get(f"/api/notes/{note['id']}").json()["title"] == "Changed"
+
+
+def test_several_workers_only_keep_a_redis_cache(monkeypatch):
+    from app import cache
+
+    assert cache.backend_for_workers("memory", 1) == "memory"
+    assert cache.backend_for_workers("memory", 3) == "none"
+    assert cache.backend_for_workers("shared", 3) == "none"
+    monkeypatch.setattr(cache, "REDIS_URL", "redis://cache:6379/0")
+    assert cache.backend_for_workers("shared", 3) == "shared"
+    assert cache.backend_for_workers("none", 3) == "none"
+
+
+def test_conditional_get_note(client):
+    note = client.post("/api/notes/", json={"title": "Etag", "content": "c"}).json()
+    response = client.get(f"/api/notes/{note['id']}")
+    etag = response.headers["etag"]
+    assert etag == '"1"'
+
+    response = client.get(f"/api/notes/{note['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    last_modified = response.headers["last-modified"]
+    response = client.get(
+        f"/api/notes/{note['id']}", headers={"If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 304
+
+    client.put(f"/api/notes/{note['id']}", json={"content": "changed"})
+    response = client.get(f"/api/notes/{note['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] == '"2"'
+
+
+def test_conditional_get_collections(client):
+    note = client.post("/api/notes/", json={"title": "List", "content": "c"}).json()
+    urls = [
+        "/api/notes/",
+        "/api/notes/summary",
+        f"/api/notes/{note['id']}/versions",
+        f"/api/notes/{note['id']}/versions/summary",
+    ]
+    etags = {url: client.get(url).headers["etag"] for url in urls}
+    for url, etag in etags.items():
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    client.put(f"/api/notes/{note['id']}", json={"title": "List 2"})
+    for url, etag in etags.items():
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+    version_id = client.get(urls[2]).json()[0]["id"]
+    url = f"/api/notes/{note['id']}/versions/{version_id}"
+    etag = client.get(url).headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_update_if_match(client):
+    note = client.post("/api/notes/", json={"title": "Match", "content": "c"}).json()
+    url = f"/api/notes/{note['id']}"
+
+    response = client.put(url, json={"content": "a"}, headers={"If-Match": '"1"'})
+    assert response.status_code == 200
+    assert response.headers["etag"] == '"2"'
+
+    response = client.put(url, json={"content": "b"}, headers={"If-Match": '"1"'})
+    assert response.status_code == 412
+    assert client.get(url).json()["content"] == "a"
+
+    response = client.put(url, json={"content": "b"}, headers={"If-Match": "*"})
+    assert response.json()["version"] == 3
+    assert client.put("/api/notes/missing", json={"title": "x"}).status_code == 404
+
+
+def test_updates_are_single_round_trip(client, db_session):
+    from sqlalchemy import event
+
+    body = "".join(f"line {i}\n" for i in range(20))
+    note = client.post("/api/notes/", json={"title": "Race", "content": body}).json()
+    url = f"/api/notes/{note['id']}"
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement.split()[0])
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        first = client.put(url, json={"content": body + "first\n"}).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    # UPDATE ... RETURNING, the blob and version INSERTs, then re-encoding the
+    # previous head, all before the single commit
+    assert statements == ["UPDATE", "INSERT", "INSERT", "SELECT", "UPDATE", "DELETE"]
+    assert first["version"] == 2 and first["content"] == body + "first\n"
+
+    # The version is incremented in SQL, so a writer holding a stale copy
+    # still gets its own version instead of overwriting version 2
+    assert client.put(url, json={"content": "second"}).json()["version"] == 3
+    stale = client.put(url, json={"content": "lost"}, headers={"If-Match": '"1"'})
+    assert stale.status_code == 412
+    assert client.get(url).json()["content"] == "second"
+    assert len(client.get(f"{url}/versions").json()) == 3
+
+    assert client.delete(url).status_code == 200
+    assert client.delete(url).status_code == 404
+    assert client.get(f"{url}/versions").status_code == 404
+
+
+def test_failed_delta_encoding_rolls_back_the_write(client, db_session, monkeypatch):
+    from app import crud, models, schemas, versioning
+
+    body = "".join(f"line {i}\n" for i in range(20))
+    note = client.post("/api/notes/", json={"title": "Atomic", "content": body}).json()
+
+    def broken_delta(content, newer_content):
+        raise RuntimeError("delta encoding failed")
+
+    monkeypatch.setattr(versioning, "make_delta", broken_delta)
+    with pytest.raises(RuntimeError):
+        crud.update_note(db_session, note["id"], schemas.NoteUpdate(content="new\n"))
+    # The write and the re-encoding of the old head commit or fail together
+    versions = client.get(f"/api/notes/{note['id']}/versions").json()
+    assert [(v["version"], v["content"]) for v in versions] == [(1, body)]
+    assert client.get(f"/api/notes/{note['id']}").json()["version"] == 1
+
+    monkeypatch.undo()
+    updated, _ = crud.update_note(
+        db_session, note["id"], schemas.NoteUpdate(content=body + "new\n")
+    )
+    assert updated.version == 2
+    versions = client.get(f"/api/notes/{note['id']}/versions").json()
+    assert [v["content"] for v in versions] == [body + "new\n", body]
+    stored = db_session.query(models.NoteVersionDB.storage).filter_by(version=1)
+    assert stored.scalar() == versioning.STORAGE_DELTA
+
+
+def test_metrics_are_labelled_by_route_template(client):
+    note = client.post("/api/notes/", json={"title": "Label", "content": "c"}).json()
+    client.get(f"/api/notes/{note['id']}")
+    client.get("/static/script.js")
+    client.get(f"/no/such/{note['id']}")
+
+    metrics = client.get("/metrics").text
+    assert 'endpoint="/api/notes/{note_id}"' in metrics
+    assert 'endpoint="/static/{path}"' in metrics
+    assert 'endpoint="unmatched",method="GET",status="404"' in metrics
+    assert note["id"] not in metrics
+
+
+def test_database_instrumentation(tmp_path, monkeypatch, caplog):
+    from prometheus_client import REGISTRY
+    from sqlalchemy import create_engine
+    from starlette.concurrency import run_in_threadpool
+
+    from app import monitoring
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    monitoring.instrument_engine(engine, "test")
+    monkeypatch.setattr(monitoring, "SLOW_QUERY_SECONDS", 0)
+
+    def query():
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT 2"))
+
+    async def request():
+        with monitoring.request_stats() as stats:
+            await run_in_threadpool(query)
+        return stats
+
+    stats = anyio.run(request)
+    assert stats.queries == 2
+    assert stats.db_seconds > 0
+    assert "Slow query" in caplog.text
+    assert REGISTRY.get_sample_value("db_pool_in_use", {"pool": "test"}) == 0
+    assert REGISTRY.get_sample_value(
+        "db_pool_checkout_wait_seconds_count", {"pool": "test"}
+    )
+    assert REGISTRY.get_sample_value(
+        "db_query_duration_seconds_count", {"operation": "SELECT"}
+    )
+
+    # run.py disposes the engine after init_db; the new pool is timed too
+    waits = REGISTRY.get_sample_value(
+        "db_pool_checkout_wait_seconds_count", {"pool": "test"}
+    )
+    engine.dispose()
+    query()
+    assert (
+        REGISTRY.get_sample_value(
+            "db_pool_checkout_wait_seconds_count", {"pool": "test"}
+        )
+        == waits + 1
+    )
+
+
+def test_profiled_request_and_admin_download(client, monkeypatch):
+    from app import profiling
+
+    assert client.get("/admin/profiles").status_code == 404
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILES", profiling.deque(maxlen=5))
+
+    response = client.get("/api/notes/", headers={"X-Profile": "wrong"})
+    assert "server-timing" not in response.headers
+    response = client.get("/api/notes/", headers={"X-Profile": "secret"})
+    timing = response.headers["server-timing"]
+    assert [part.split(";")[0] for part in timing.split(", ")] == [
+        "db",
+        "app",
+        "template",
+        "serialize",
+        "total",
+    ]
+    profile_id = response.headers["x-profile-id"]
+
+    assert client.get("/admin/profiles").status_code == 403
+    admin = {"X-Admin-Token": "secret"}
+    listed = client.get("/admin/profiles", headers=admin).json()
+    assert [(p["id"], p["path"]) for p in listed] == [(profile_id, "/api/notes/")]
+
+    url = f"/admin/profiles/{profile_id}"
+    speedscope = client.get(url, headers=admin).json()
+    assert speedscope["profiles"][0]["type"] == "sampled"
+    response = client.get(url, params={"format": "collapsed"}, headers=admin)
+    assert response.headers["content-type"].startswith("text/plain")
+    assert client.get("/admin/profiles/missing", headers=admin).status_code == 404
+
+
+def test_profiler_collapses_sampled_stacks():
+    from app.profiling import Profile
+
+    profile = Profile("GET", "/", interval=0.01)
+    profile.add_thread(threading.get_ident())
+    profile.sample(sys._current_frames())
+    profile.sample(sys._current_frames())
+
+    (line,) = profile.collapsed().splitlines()
+    stack, count = line.rsplit(" ", 1)
+    assert count == "2"
+    assert stack.split(";")[-1].startswith("test_profiler_collapses_sampled_stacks")
+    speedscope = profile.speedscope()["profiles"][0]
+    assert speedscope["weights"] == [0.02]
+
+
+def test_profiler_skips_event_streams_and_caps_sampling():
+    from app.profiling import Profile, ProfilingMiddleware, Sampler
+
+    middleware = ProfilingMiddleware(None, sample_rate=1.0)
+    assert middleware._wanted({"headers": [(b"accept", b"*/*")]})
+    assert not middleware._wanted({"headers": [(b"accept", b"text/event-stream")]})
+
+    sampler = Sampler(Profile("GET", "/", interval=0.001), max_seconds=0.05)
+    sampler.start()
+    sampler.join(timeout=5)
+    assert not sampler.is_alive()
+
+
+def test_in_memory_sqlite_urls_are_not_files():
+    from sqlalchemy.engine import make_url
+
+    from app.database import is_sqlite_file, pool_args
+
+    assert is_sqlite_file("sqlite:///notes.db")
+    assert is_sqlite_file("sqlite+aiosqlite:////var/lib/notes/notes.db")
+    for url in (
+        "sqlite://",
+        "sqlite:///:memory:",
+        "sqlite+pysqlite:///:memory:",
+        "postgresql://user@db/notes",
+    ):
+        assert not is_sqlite_file(url), url
+    assert pool_args("sqlite://") == {"poolclass": StaticPool}
+    assert pool_args("sqlite:///notes.db") == {}
+    # Engine URLs, as the lock helpers pass them
+    assert is_sqlite_file(make_url("sqlite:///notes.db"))
+    assert not is_sqlite_file(make_url("sqlite://"))
+
+
+def test_sqlite_profile_pragmas(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import OperationalError
+
+    from app.database import is_sqlite_file, sqlite_pragmas
+
+    url = f"sqlite:///{tmp_path / 'tuned.db'}"
+    assert is_sqlite_file(url)
+    assert not is_sqlite_file("sqlite:///:memory:")
+    writer = create_engine(url, pool_size=1, max_overflow=0)
+    sqlite_pragmas(writer, immediate=True)
+    reader = create_engine(url)
+    sqlite_pragmas(reader, read_only=True)
+
+    with writer.begin() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        connection.exec_driver_sql("CREATE TABLE t (x INTEGER)")
+        connection.exec_driver_sql("INSERT INTO t VALUES (1)")
+    with reader.connect() as connection:
+        assert connection.exec_driver_sql("SELECT x FROM t").scalar() == 1
+        with pytest.raises(OperationalError):
+            connection.exec_driver_sql("INSERT INTO t VALUES (2)")
+    writer.dispose()
+    reader.dispose()
+
+
+def test_read_replica_routing(client, db_session, monkeypatch):
+    import time
+
+    from fastapi import Request, Response
+
+    from app import cache, crud, database
+
+    monkeypatch.setattr(database, "SQLALCHEMY_READ_URL", "postgresql://replica/notes")
+    response = Response()
+    database.mark_write(response)
+    cookie = response.headers["set-cookie"].split(";")[0]
+    assert cookie.startswith(f"{database.LAST_WRITE_COOKIE}=")
+
+    def request(cookie_header):
+        return Request({"type": "http", "headers": [(b"cookie", cookie_header)]})
+
+    assert database.reads_from_primary(request(cookie.encode()))
+    stale = f"{database.LAST_WRITE_COOKIE}={time.time() - 60}".encode()
+    assert not database.reads_from_primary(request(stale))
+    assert not database.reads_from_primary(request(b""))
+
+    # Replica reads are served but never cached
+    note_id = client.post("/api/notes/", json={"title": "T", "content": "C"}).json()[
+        "id"
+    ]
+    db_session.info["replica"] = True
+    assert crud.get_note_cached(db_session, note_id)["title"] == "T"
+    assert cache.backend.get(cache.note_key(note_id)) is None
+    db_session.info["replica"] = False
+    crud.get_note_cached(db_session, note_id)
+    assert cache.backend.get(cache.note_key(note_id)) is not None
+
+    # Writes answered with 204 still set the cookie
+    def write_db(response: Response):
+        database.mark_write(response)
+        yield db_session
+
+    client.app.dependency_overrides[database.get_db] = write_db
+    response = client.put(f"/api/notes/{note_id}/content", content=b"new")
+    assert response.status_code == 204
+    assert response.headers["etag"] == '"2"'
+    assert response.cookies[database.LAST_WRITE_COOKIE]
+
+
+def test_fast_json_responses_keep_route_headers(client):
+    from fastapi import Response
+
+    from app import responses, schemas
+
+    note_id = client.post("/api/notes/", json={"title": "T", "content": "C"}).json()[
+        "id"
+    ]
+    client.put(f"/api/notes/{note_id}", json={"content": "C2"})
+    versions = client.get(f"/api/notes/{note_id}/versions")
+    assert versions.headers["content-type"] == "application/json"
+    assert "etag" in versions.headers
+    assert [v["content"] for v in versions.json()] == ["C2", "C"]
+
+    injected = Response()
+    injected.headers["X-Next-Cursor"] = "abc"
+    fast = responses.json_response([{"id": "n"}], injected)
+    assert fast.headers["x-next-cursor"] == "abc"
+    assert fast.body.replace(b" ", b"") == b'[{"id":"n"}]'
+    body = responses.model_list_response(
+        schemas.NoteSummary,
+        [
+            schemas.NoteSummary(
+                id="n", title="T", updated_at="2025-01-02T03:04:05", version=1
+            )
+        ],
+    ).body
+    assert b'"updated_at":"2025-01-02T03:04:05"' in body
+
+
+def test_page_and_static_assets_are_fingerprinted_and_compressed(client):
+    import re
+
+    page = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert page.headers["content-encoding"] == "gzip"
+    assert page.headers["cache-control"] == "no-cache"
+    revalidated = client.get("/", headers={"If-None-Match": page.headers["etag"]})
+    assert revalidated.status_code == 304
+
+    css_url = re.search(r'href="(/static/style\.[0-9a-f]{12}\.css)"', page.text)[1]
+    css = client.get(css_url, headers={"Accept-Encoding": "gzip"})
+    assert css.headers["cache-control"].endswith("immutable")
+    assert css.headers["vary"] == "Accept-Encoding"
+    plain = client.get("/static/style.css", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["cache-control"] == "no-cache"
+    assert plain.content == css.content
+    # Each coding has its own strong tag; If-None-Match compares weakly
+    assert css.headers["etag"] == plain.headers["etag"][:-1] + '-gzip"'
+    mixed = client.get(
+        "/static/style.css",
+        headers={"Accept-Encoding": "identity", "If-None-Match": css.headers["etag"]},
+    )
+    assert mixed.status_code == 304
+    assert mixed.headers["etag"] == plain.headers["etag"]
+    assert client.get("/static/missing.css").status_code == 404
+
+    for i in range(20):
+        client.post("/api/notes/", json={"title": f"N{i}", "content": "x" * 200})
+    listing = client.get("/api/notes/", headers={"Accept-Encoding": "gzip"})
+    assert listing.headers["content-encoding"] == "gzip"
+    assert int(listing.headers["content-length"]) < len(listing.content)
+    assert len(listing.json()) == 20
+    small = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    raw = client.get("/api/notes/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in raw.headers
+    assert raw.content == listing.content
+
+    # Gzipped on the fly, a note's tag gets a coding suffix but still names
+    # its version, so it revalidates and works as If-Match
+    note_id = listing.json()[0]["id"]
+    client.put(f"/api/notes/{note_id}", json={"content": "y" * 2000})
+    note = client.get(f"/api/notes/{note_id}", headers={"Accept-Encoding": "gzip"})
+    assert note.headers["content-encoding"] == "gzip"
+    assert note.headers["etag"] == '"2-gzip"'
+    revalidated = client.get(
+        f"/api/notes/{note_id}",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": note.headers["etag"]},
+    )
+    assert revalidated.status_code == 304
+    saved = client.put(
+        f"/api/notes/{note_id}",
+        json={"content": "z" * 2000},
+        headers={"Accept-Encoding": "gzip", "If-Match": note.headers["etag"]},
+    )
+    assert saved.status_code == 200
+    assert saved.headers["etag"] == '"3-gzip"'
+    stale = client.put(
+        f"/api/notes/{note_id}",
+        json={"content": "lost"},
+        headers={"If-Match": note.headers["etag"]},
+    )
+    assert stale.status_code == 412
+    weak = client.put(
+        f"/api/notes/{note_id}", json={"content": "lost"}, headers={"If-Match": 'W/"3"'}
+    )
+    assert weak.status_code == 412
+
+
+def test_compression_merges_vary_into_existing_header():
+    import asyncio
+
+    from app.compression import CompressionMiddleware
+
+    async def app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"vary", b"Origin"),
+                    (b"etag", b'"7"'),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"[]" * 1000})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=10)(scope, None, send))
+    headers = sent[0]["headers"]
+    assert [value for key, value in headers if key == b"vary"] == [
+        b"Origin, Accept-Encoding"
+    ]
+    assert (b"etag", b'"7-gzip"') in headers
+
+
+def test_change_feed_streams_replays_and_resyncs(client):
+    import asyncio
+
+    from app import events
+
+    def parse(frame):
+        fields = dict(
+            line.split(": ", 1) for line in frame.decode().strip().split("\n")
+        )
+        return fields.get("id"), json.loads(fields["data"])
+
+    async def scenario():
+        feed = events.stream()
+        assert (await feed.__anext__()).startswith(b"retry:")
+        note = (
+            await asyncio.to_thread(
+                client.post, "/api/notes/", json={"title": "T", "content": "C"}
+            )
+        ).json()
+        await asyncio.to_thread(
+            client.put, f"/api/notes/{note['id']}", json={"content": "C2"}
+        )
+        await asyncio.to_thread(client.delete, f"/api/notes/{note['id']}")
+
+        first_id, created = parse(await asyncio.wait_for(feed.__anext__(), 1))
+        assert created == {
+            "type": "create",
+            "id": note["id"],
+            "version": 1,
+            "title": "T",
+            "updated_at": note["updated_at"],
+            "preview": "C",
+        }
+        _, updated = parse(await asyncio.wait_for(feed.__anext__(), 1))
+        assert (updated["type"], updated["version"], updated["preview"]) == (
+            "update",
+            2,
+            "C2",
+        )
+        _, deleted = parse(await asyncio.wait_for(feed.__anext__(), 1))
+        assert deleted == {"type": "delete", "id": note["id"]}
+        await feed.aclose()
+        assert events.broker.subscriber_count() == 0
+
+        # A reconnect resumes after the last event it saw
+        resumed = events.stream(last_event_id=first_id)
+        await resumed.__anext__()
+        replayed = [parse(await resumed.__anext__())[1]["type"] for _ in range(2)]
+        assert replayed == ["update", "delete"]
+        await resumed.aclose()
+        stale = events.stream(last_event_id="0-1")
+        await stale.__anext__()
+        assert parse(await stale.__anext__())[1] == {"type": "resync"}
+        await stale.aclose()
+
+        # Idle subscribers get keepalives; one that falls behind gets its
+        # backlog replaced by a resync
+        broker = events.Broker(queue_size=2, history=10, heartbeat=0.01)
+        idle = events.stream(source=broker)
+        await idle.__anext__()
+        assert await asyncio.wait_for(idle.__anext__(), 1) == events.KEEPALIVE_FRAME[1]
+        await idle.aclose()
+        subscriber = broker.subscribe()
+        for i in range(3):
+            broker.dispatch({"type": "delete", "id": str(i)})
+        await asyncio.sleep(0)
+        assert subscriber.queue.qsize() == 1
+        assert subscriber.queue.get_nowait() == events.OVERFLOW_FRAME
+        broker.unsubscribe(subscriber)
+
+        # Churning subscribers leaves a single keepalive timer running
+        ticks = []
+        keepalive = broker._keepalive
+        broker._keepalive = lambda loop: (ticks.append(loop), keepalive(loop))
+        for _ in range(5):
+            broker.unsubscribe(broker.subscribe())
+        assert not broker._timers
+        subscriber = broker.subscribe()
+        await asyncio.sleep(0.055)
+        assert 1 <= len(ticks) <= 6
+        broker.unsubscribe(subscriber)
+        assert not broker._timers
+
+    asyncio.run(scenario())
+
+
+def test_retention_prunes_history_and_keeps_it_readable(client, db_session):
+    from datetime import datetime, timedelta
+
+    from sqlalchemy.orm import sessionmaker
+
+    from app import models, retention
+
+    note_id = client.post(
+        "/api/notes/", json={"title": "T", "content": "line 0\n"}
+    ).json()["id"]
+    body = "line 0\n"
+    for i in range(1, 31):
+        body += f"line {i}\n"
+        client.put(f"/api/notes/{note_id}", json={"content": body})
+    now = datetime.now()
+    # Versions 1-24 are old, four a day, with days ending on 1, 5, 9, ... 21
+    # and 24, so keyframe 20 is pruned; 25-31 are recent
+    midnight = (now - timedelta(days=60)).replace(hour=0, minute=1)
+    for version in range(1, 25):
+        db_session.query(models.NoteVersionDB).filter_by(
+            note_id=note_id, version=version
+        ).update({"created_at": midnight + timedelta(hours=6 * (version - 2))})
+    db_session.commit()
+    before = {
+        v["version"]: v["content"]
+        for v in client.get(f"/api/notes/{note_id}/versions").json()
+    }
+    assert client.get(f"/api/notes/{note_id}/storage").json()["versions"] == 31
+
+    policy = retention.RetentionPolicy(keep_last=3, keep_days=7, daily_days=0)
+    totals = retention.compact(
+        sessionmaker(bind=db_session.get_bind()), policy, batch_size=1, pause=0, now=now
+    )
+    # 7 recent versions, and the last of each of the seven old days
+    assert totals["pruned"] == 31 - 7 - 7
+    versions = client.get(f"/api/notes/{note_id}/versions").json()
+    kept = [v["version"] for v in versions]
+    assert kept[:7] == list(range(31, 24, -1))
+    assert kept[7:] == [24, 21, 17, 13, 9, 5, 1]
+    for version in versions:
+        assert version["content"] == before[version["version"]]
+        single = client.get(f"/api/notes/{note_id}/versions/{version['id']}").json()
+        assert single["content"] == before[version["version"]]
+
+    storage = client.get(f"/api/notes/{note_id}/storage").json()
+    assert storage["versions"] == 14
+    assert storage["full_versions"] + storage["delta_versions"] == 14
+    assert storage["content_bytes"] == len(body)
+    assert 0 < storage["history_bytes"]
+    assert client.get("/api/notes/missing/storage").status_code == 404
+    assert "version_compaction_pruned_total" in client.get("/metrics").text
+
+
+def test_bodies_are_stored_once_and_no_op_updates_add_no_version(client, db_session):
+    from app import models
+
+    def counts():
+        return (
+            db_session.query(models.NoteVersionDB).count(),
+            db_session.query(models.BlobDB).count(),
+        )
+
+    body = "".join(f"shared line {i}\n" for i in range(30))
+    first = client.post("/api/notes/", json={"title": "A", "content": body}).json()
+    client.post("/api/notes/", json={"title": "B", "content": body})
+    assert counts() == (2, 1)
+
+    # Same title and content, or an empty update: same version, no history
+    for payload in ({"title": "A", "content": body}, {}):
+        response = client.put(f"/api/notes/{first['id']}", json=payload)
+        assert response.status_code == 200
+        assert response.json()["version"] == 1
+    assert counts() == (2, 1)
+
+    client.put(f"/api/notes/{first['id']}", json={"content": body + "more\n"})
+    # A title-only edit is a new version sharing the previous body
+    renamed = client.put(f"/api/notes/{first['id']}", json={"title": "A2"}).json()
+    assert renamed["version"] == 3
+    assert counts()[1] == 2
+
+    versions = client.get(f"/api/notes/{first['id']}/versions").json()
+    v1_id = next(v["id"] for v in versions if v["version"] == 1)
+    restored = client.post(f"/api/notes/{first['id']}/restore/{v1_id}").json()
+    assert (restored["version"], restored["title"]) == (4, "A")
+    assert counts() == (5, 1)
+    # Restoring what the note already holds changes nothing
+    again = client.post(f"/api/notes/{first['id']}/restore/{v1_id}").json()
+    assert again["version"] == 4
+    assert counts() == (5, 1)
+    assert [
+        v["content"] for v in client.get(f"/api/notes/{first['id']}/versions").json()
+    ] == [body, body + "more\n", body + "more\n", body]
+
+    result = client.put(
+        "/api/notes/bulk",
+        json={"notes": [{"id": first["id"], "title": "A", "content": body}]},
+    ).json()
+    assert result["results"][0]["status"] == "unchanged"
+    assert result["results"][0]["version"] == 4
+    assert counts() == (5, 1)
+
+    storage = client.get(f"/api/notes/{first['id']}/storage").json()
+    assert storage["blob_bytes"] > 0
+
+    client.delete(f"/api/notes/{first['id']}")
+    # The body note B still uses survives; the other one goes with note A
+    assert counts() == (1, 1)
+
+
+def test_large_bodies_are_stored_out_of_row_and_served_raw(
+    client, db_session, monkeypatch
+):
+    from app import bodies, models, routes
+
+    monkeypatch.setattr(bodies, "LARGE_CONTENT_BYTES", 1000)
+    monkeypatch.setattr(bodies, "LARGE_CONTENT_PREFIX_CHARS", 100)
+    body = "zebra café\n" + "".join(f"line {i} é\n" for i in range(500))
+    data = body.encode()
+    note = client.post("/api/notes/", json={"title": "Big", "content": body}).json()
+    note_id = note["id"]
+    assert note["content"] == body
+
+    row = db_session.query(models.NoteDB).filter_by(id=note_id).one()
+    assert row.content_external and row.content == body[:100]
+    assert row.content_size == len(data)
+    assert client.get(f"/api/notes/{note_id}").json()["content"] == body
+    assert client.get("/api/notes/").json()[0]["content"] == body
+    assert [n["id"] for n in client.get("/api/notes/?search=zebra").json()] == [note_id]
+
+    # Raw reads take only the bytes they send from the blob, in several queries
+    reads = []
+    read_range = bodies.read_range
+
+    def recorded_read(db, content_hash, start, end):
+        reads.append((start, end))
+        return read_range(db, content_hash, start, end)
+
+    monkeypatch.setattr(bodies, "read_range", recorded_read)
+    monkeypatch.setattr(routes, "CONTENT_READ_BYTES", 2048)
+    response = client.get(f"/api/notes/{note_id}/content")
+    assert response.status_code == 200
+    assert response.content == data
+    assert reads == [
+        (start, min(start + 2048, len(data))) for start in range(0, len(data), 2048)
+    ]
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-type"] == "text/plain; charset=utf-8"
+    etag = response.headers["etag"]
+
+    response = client.get(
+        f"/api/notes/{note_id}/content", headers={"Range": "bytes=6-11"}
+    )
+    assert response.status_code == 206
+    assert response.content == data[6:12]
+    assert reads[-1] == (6, 12)
+    assert response.headers["content-range"] == f"bytes 6-11/{len(data)}"
+    response = client.get(
+        f"/api/notes/{note_id}/content", headers={"Range": "bytes=-4"}
+    )
+    assert response.content == data[-4:]
+    response = client.get(
+        f"/api/notes/{note_id}/content",
+        headers={"Range": "bytes=0-3", "If-Range": '"99"'},
+    )
+    assert response.status_code == 200 and response.content == data
+    response = client.get(
+        f"/api/notes/{note_id}/content", headers={"Range": f"bytes={len(data)}-"}
+    )
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(data)}"
+
+    updated = body + "appended\n"
+    response = client.put(
+        f"/api/notes/{note_id}/content",
+        content=updated.encode(),
+        headers={"If-Match": etag},
+    )
+    assert response.status_code == 204
+    assert response.headers["etag"] == '"2"'
+    assert client.get(f"/api/notes/{note_id}/content").text == updated
+    response = client.put(
+        f"/api/notes/{note_id}/content", content=b"x", headers={"If-Match": etag}
+    )
+    assert response.status_code == 412
+    response = client.put(f"/api/notes/{note_id}/content", content=b"\xff\xfe")
+    assert response.status_code == 400
+    monkeypatch.setattr(routes, "MAX_CONTENT_BYTES", len(updated.encode()))
+    chunked = (part for part in (updated.encode(), b"more"))
+    response = client.put(f"/api/notes/{note_id}/content", content=chunked)
+    assert response.status_code == 413
+
+    # A title-only change keeps the stored body and still versions it
+    renamed = client.put(f"/api/notes/{note_id}", json={"title": "Bigger"}).json()
+    assert (renamed["version"], renamed["content"]) == (3, updated)
+    versions = client.get(f"/api/notes/{note_id}/versions").json()
+    assert [v["content"] for v in versions] == [updated, updated, body]
+    exported = [json.loads(line) for line in client.get("/api/export").iter_lines()]
+    assert exported[0]["content"] == updated
+
+    client.delete(f"/api/notes/{note_id}")
+    assert db_session.query(models.BlobDB).count() == 0
+
+
+def test_group_commit_coalesces_updates_into_one_transaction(
+    client, db_session, monkeypatch
+):
+    import asyncio
+
+    from prometheus_client import REGISTRY
+
+    from app import batching, models, routes
+
+    first = client.post("/api/notes/", json={"title": "A", "content": "a0"}).json()
+    second = client.post("/api/notes/", json={"title": "B", "content": "b0"}).json()
+    committer = batching.GroupCommitter(
+        window=0.05,
+        max_writes=100,
+        session_factory=sessionmaker(bind=db_session.get_bind()),
+    )
+    batches = (
+        REGISTRY.get_sample_value("group_commit_batches_total", {"result": "ok"}) or 0
+    )
+
+    async def autosave():
+        return await asyncio.gather(
+            *(committer.update(first["id"], {"content": f"a{i}"}) for i in range(1, 6)),
+            committer.update(second["id"], {"title": "B2"}),
+            committer.update("missing", {"content": "x"}),
+        )
+
+    results = asyncio.run(autosave())
+    # Every request for A is answered with the one version the window produced
+    assert {(note.version, note.content) for note, _ in results[:5]} == {(2, "a5")}
+    renamed, error = results[5]
+    assert (renamed.version, renamed.title, renamed.content, error) == (
+        2,
+        "B2",
+        "b0",
+        None,
+    )
+    assert results[6] == (None, "Note not found")
+    assert (
+        REGISTRY.get_sample_value("group_commit_batches_total", {"result": "ok"})
+        == batches + 1
+    )
+    versions = client.get(f"/api/notes/{first['id']}/versions").json()
+    assert [v["content"] for v in versions] == ["a5", "a0"]
+    assert db_session.query(models.NoteVersionDB).count() == 4
+
+    # Routed through the committer; If-Match still goes straight to crud
+    monkeypatch.setattr(routes, "GROUP_COMMIT_ENABLED", True)
+    monkeypatch.setattr(batching, "committer", committer)
+    response = client.put(f"/api/notes/{first['id']}", json={"content": "a6"})
+    assert response.json()["version"] == 3
+    assert response.headers["etag"] == '"3"'
+    response = client.put(
+        f"/api/notes/{first['id']}", json={"content": "a7"}, headers={"If-Match": '"2"'}
+    )
+    assert response.status_code == 412
+    assert (
+        REGISTRY.get_sample_value("group_commit_batches_total", {"result": "ok"})
+        == batches + 2
+    )
+
+
+def test_group_commit_survives_its_first_request_being_cancelled(client, db_session):
+    import asyncio
+
+    from app import batching
+
+    first = client.post("/api/notes/", json={"title": "A", "content": "a0"}).json()
+    second = client.post("/api/notes/", json={"title": "B", "content": "b0"}).json()
+    committer = batching.GroupCommitter(
+        window=0.05, session_factory=sessionmaker(bind=db_session.get_bind())
+    )
+
+    async def cancel_leader():
+        leader = asyncio.ensure_future(committer.update(first["id"], {"content": "a1"}))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(
+            committer.update(second["id"], {"content": "b1"})
+        )
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await asyncio.wait_for(follower, 1), leader.cancelled()
+
+    (note, error), cancelled = asyncio.run(cancel_leader())
+    assert cancelled
+    assert (note.version, note.content, error) == (2, "b1", None)
+    # The batch was written as a whole, the cancelled request's update included
+    db_session.expire_all()
+    assert client.get(f"/api/notes/{first['id']}").json()["content"] == "a1"